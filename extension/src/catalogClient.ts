@@ -0,0 +1,188 @@
+/**
+ * @description 规则目录查询客户端：通过常驻的Python查询进程（--serve）分页获取规则列表，
+ * 只传输需要的字段，完整内容按需获取，扩展和WebView的内存占用不随规则目录大小增长
+ */
+
+import * as cp from 'child_process';
+import * as fs from 'fs';
+import * as path from 'path';
+import * as vscode from 'vscode';
+
+/**
+ * @description 分页查询的一页结果
+ */
+export interface CatalogPage {
+  items: { [field: string]: any; id: string }[];
+  next_cursor: string | null;
+  total: number;
+}
+
+/**
+ * @description 分页查询参数，与Python端CatalogQuery.page一致
+ */
+export interface CatalogQueryParams {
+  fields?: string[];
+  sort?: string;
+  cursor?: string | null;
+  limit?: number;
+  search?: string;
+  where?: string;
+}
+
+/**
+ * @description 随扩展分发的规则库路径；同目录的rules.db.json（更新规则数据库时写入）作为覆盖层由Python端叠加，
+ * 没有规则库的旧版本安装直接使用rules.db.json
+ * @param extensionPath 扩展根目录
+ * @returns 传给 --rules-json 的路径
+ */
+export function catalogPath(extensionPath: string): string {
+  const storePath = path.join(extensionPath, 'rules_data', 'rules.pack');
+  return fs.existsSync(storePath) ? storePath : path.join(extensionPath, 'rules_data', 'rules.db.json');
+}
+
+interface PendingRequest {
+  resolve: (value: any) => void;
+  reject: (reason: Error) => void;
+}
+
+/**
+ * @description 规则目录查询客户端，第一次请求时启动查询进程，进程退出后下次请求时重新启动
+ */
+export class CatalogClient implements vscode.Disposable {
+  private process?: cp.ChildProcess;
+  private pending = new Map<number, PendingRequest>();
+  private nextId = 1;
+  private buffer = '';
+
+  /**
+   * @description 构造函数
+   * @param extensionPath 扩展根目录
+   */
+  constructor(private readonly extensionPath: string) {}
+
+  /**
+   * @description 查询一页规则
+   * @param params 查询参数
+   * @returns 当前页结果
+   */
+  public query(params: CatalogQueryParams): Promise<CatalogPage> {
+    return this.request('query', params);
+  }
+
+  /**
+   * @description 获取单条规则
+   * @param id 规则slug
+   * @param fields 返回的字段，为空时返回全部字段（包括content）
+   * @returns 规则对象
+   */
+  public get(id: string, fields?: string[]): Promise<{ [field: string]: any }> {
+    return this.request('get', { id, fields });
+  }
+
+  /**
+   * @description 逐页获取全部满足条件的规则（只包含请求的字段），用于需要完整列表的QuickPick
+   * @param params 查询参数
+   * @returns 规则列表
+   */
+  public async queryAll(params: CatalogQueryParams): Promise<CatalogPage['items']> {
+    const items: CatalogPage['items'] = [];
+    let cursor: string | null = null;
+    do {
+      const page: CatalogPage = await this.query({ ...params, cursor, limit: params.limit || 500 });
+      items.push(...page.items);
+      cursor = page.next_cursor;
+    } while (cursor);
+    return items;
+  }
+
+  /**
+   * @description 结束查询进程
+   */
+  public dispose(): void {
+    if (this.process) {
+      this.process.stdin?.end();
+      this.process.kill();
+      this.process = undefined;
+    }
+    this.failPending(new Error('规则查询服务已关闭'));
+  }
+
+  private request(method: string, params: object): Promise<any> {
+    const child = this.ensureProcess();
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      this.pending.set(id, { resolve, reject });
+      child.stdin?.write(JSON.stringify({ id, method, params }) + '\n');
+    });
+  }
+
+  private ensureProcess(): cp.ChildProcess {
+    if (this.process) {
+      return this.process;
+    }
+    const scriptPath = [
+      path.join(this.extensionPath, 'scripts', 'local_rules_selector.py'),
+      path.join(__dirname, '..', '..', 'scripts', 'local_rules_selector.py'),
+      path.join(__dirname, '..', 'scripts', 'local_rules_selector.py')
+    ].find(candidate => fs.existsSync(candidate));
+    if (!scriptPath) {
+      throw new Error('找不到规则选择器脚本 local_rules_selector.py');
+    }
+    const rulesJsonPath = catalogPath(this.extensionPath);
+    const pythonPath = vscode.workspace.getConfiguration('cursor-rules').get<string>('pythonPath') || 'python';
+
+    const child = cp.spawn(pythonPath, [scriptPath, '--rules-json', rulesJsonPath, '--serve'], {
+      cwd: this.extensionPath,
+      env: { ...process.env, PYTHONIOENCODING: 'utf-8' }
+    });
+    this.process = child;
+    this.buffer = '';
+    child.stdout?.on('data', (data: Buffer) => {
+      this.buffer += data.toString();
+      const lines = this.buffer.split('\n');
+      this.buffer = lines.pop() || '';
+      for (const line of lines) {
+        this.handleResponse(line);
+      }
+    });
+    // 日志输出到标准错误，不影响响应解析
+    child.stderr?.on('data', () => undefined);
+    child.on('error', (error) => {
+      this.process = undefined;
+      this.failPending(new Error(`启动规则查询服务失败: ${error.message}`));
+    });
+    child.on('close', () => {
+      if (this.process === child) {
+        this.process = undefined;
+      }
+      this.failPending(new Error('规则查询服务已退出'));
+    });
+    return child;
+  }
+
+  private handleResponse(line: string): void {
+    let response: any;
+    try {
+      response = JSON.parse(line);
+    } catch (error) {
+      return;
+    }
+    const request = this.pending.get(response.id);
+    if (!request) {
+      return;
+    }
+    this.pending.delete(response.id);
+    if (response.error) {
+      request.reject(new Error(response.error));
+    } else {
+      request.resolve(response.result);
+    }
+  }
+
+  private failPending(error: Error): void {
+    for (const request of this.pending.values()) {
+      request.reject(error);
+    }
+    this.pending.clear();
+  }
+}
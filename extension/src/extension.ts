@@ -7,6 +7,7 @@ import * as cp from 'child_process';
 import * as fs from 'fs';
 import * as path from 'path';
 import * as vscode from 'vscode';
+import { CatalogClient, catalogPath } from './catalogClient';
 import { RulesWebViewProvider } from './webviewProvider';
 
 /**
@@ -173,13 +174,13 @@ async function showRulesSelector(context: vscode.ExtensionContext) {
     const extensionUri = context.extensionUri;
     const extensionPath = extensionUri.fsPath;
     
-    const rulesJsonPath = path.join(extensionPath, 'rules_data', 'rules.db.json');
+    const rulesJsonPath = catalogPath(extensionPath);
     let rules: RuleQuickPickItem[] = [];
 
     try {
       if (fs.existsSync(rulesJsonPath)) {
-        const rawData = fs.readFileSync(rulesJsonPath, 'utf8');
-        const rulesData = JSON.parse(rawData);
+        // 只获取列表需要的字段，不读取规则内容
+        const rulesData = await getCatalogClient(context).queryAll({ fields: ['slug', 'title', 'tags'], sort: 'slug' });
         
         rules = rulesData.map((rule: any, index: number) => {
           // 获取规则类型（从slug中提取）
@@ -193,7 +194,7 @@ async function showRulesSelector(context: vscode.ExtensionContext) {
           const searchKey = `${rule.title || ''} ${ruleType} ${libsString}`.toLowerCase();
           
           return {
-            id: rule.slug || `rule-${index}`,
+            id: rule.id || `rule-${index}`,
             label: rule.title || '未命名规则',
             // 显示友好的规则类型名称
             description: ruleType,
@@ -377,7 +378,7 @@ async function generateSingleRule(ruleId: string, extensionUri: vscode.Uri): Pro
     const modelName = config.get<string>('modelName');
     
     // 设置规则数据文件路径（使用绝对路径）
-    const rulesJsonPath = path.join(extensionPath, 'rules_data', 'rules.db.json');
+    const rulesJsonPath = catalogPath(extensionPath);
     if (!fs.existsSync(rulesJsonPath)) {
       vscode.window.showErrorMessage(`找不到规则数据文件: ${rulesJsonPath}`);
       outputChannel.appendLine(`规则数据文件不存在: ${rulesJsonPath}`);
@@ -393,7 +394,7 @@ async function generateSingleRule(ruleId: string, extensionUri: vscode.Uri): Pro
         title: `正在生成规则: ${ruleId}`,
         cancellable: false
       },
-      async () => {
+      async (progress) => {
         return new Promise<void>((resolve, reject) => {
           // 设置环境变量以传递模型配置
           const env: {[key: string]: string} = {
@@ -437,15 +438,62 @@ async function generateSingleRule(ruleId: string, extensionUri: vscode.Uri): Pro
             '--rules-json', rulesJsonPath,
             '--selected-rule', ruleId,
             '--debug',  // 添加调试参数
-            '--output-dir', path.join(workspacePath, '.cursor', 'rules')
+            '--output-dir', path.join(workspacePath, '.cursor', 'rules'),
+            '--events', 'ndjson'  // 标准输出为NDJSON进度事件
           ];
           
           outputChannel.appendLine(`执行命令: ${pythonPath} ${args.join(' ')}`);
           
           const childProcess = cp.spawn(pythonPath, args, { env, cwd: workspacePath });
           
+          // 根据进度事件记录生成的规则文件，无需在进程结束后扫描规则目录
+          const writtenFiles = new Map<string, string>();
+          let stdoutBuffer = '';
+          
+          const handleEvent = (event: any) => {
+            switch (event.event) {
+              case 'phase_start':
+                if (event.phase === 'generate') {
+                  progress.report({ message: `(${event.index}/${event.total}) ${event.rule}` });
+                }
+                break;
+              case 'first_token':
+                outputChannel.appendLine(`首个token延迟: ${event.latency}秒`);
+                break;
+              case 'rule_parsed':
+                progress.report({ message: `已解析规则: ${event.name}` });
+                break;
+              case 'file_written':
+                writtenFiles.set(event.path, event.sha256);
+                outputChannel.appendLine(`已写入规则文件: ${event.path}`);
+                break;
+              case 'file_removed':
+                writtenFiles.delete(event.path);
+                outputChannel.appendLine(`已删除规则文件: ${event.path}`);
+                break;
+              case 'error':
+                outputChannel.appendLine(`错误[${event.stage}]: ${event.message}`);
+                break;
+              case 'stats':
+                outputChannel.appendLine(`处理统计: ${event.rules}条源规则, ${event.files}个规则文件, 耗时${event.elapsed}秒`);
+                break;
+            }
+          };
+          
           childProcess.stdout.on('data', (data: Buffer) => {
-            outputChannel.append(data.toString());
+            stdoutBuffer += data.toString();
+            const lines = stdoutBuffer.split('\n');
+            stdoutBuffer = lines.pop() || '';
+            for (const line of lines) {
+              if (!line.trim()) {
+                continue;
+              }
+              try {
+                handleEvent(JSON.parse(line));
+              } catch (error) {
+                outputChannel.appendLine(line);
+              }
+            }
           });
           
           childProcess.stderr.on('data', (data: Buffer) => {
@@ -462,21 +510,14 @@ async function generateSingleRule(ruleId: string, extensionUri: vscode.Uri): Pro
             if (code === 0) {
               outputChannel.appendLine('规则生成完成！');
               
-              // 检查规则文件是否实际创建
-              const rulesDirPath = path.join(workspacePath, '.cursor', 'rules');
-              if (fs.existsSync(rulesDirPath)) {
-                const ruleFiles = fs.readdirSync(rulesDirPath);
-                outputChannel.appendLine(`规则目录 ${rulesDirPath} 中的文件:`);
-                if (ruleFiles.length > 0) {
-                  ruleFiles.forEach(file => outputChannel.appendLine(`- ${file}`));
-                  vscode.window.showInformationMessage(`规则 ${ruleId} 已成功生成`);
-                } else {
-                  outputChannel.appendLine('规则目录为空，没有生成规则文件');
-                  vscode.window.showWarningMessage(`规则生成过程完成，但没有找到生成的规则文件`);
-                }
+              // 根据进度事件确认规则文件是否实际创建
+              if (writtenFiles.size > 0) {
+                outputChannel.appendLine(`生成的规则文件:`);
+                writtenFiles.forEach((_, file) => outputChannel.appendLine(`- ${file}`));
+                vscode.window.showInformationMessage(`规则 ${ruleId} 已成功生成`);
               } else {
-                outputChannel.appendLine(`规则目录 ${rulesDirPath} 不存在`);
-                vscode.window.showWarningMessage(`规则生成过程完成，但规则目录不存在`);
+                outputChannel.appendLine('没有生成规则文件');
+                vscode.window.showWarningMessage(`规则生成过程完成，但没有找到生成的规则文件`);
               }
               
               resolve();
@@ -529,6 +570,107 @@ async function checkPythonInterpreter(pythonPath: string, outputChannel: vscode.
   });
 }
 
+// 后台预生成进程，工作区关闭或变化时结束
+let prefetchProcess: cp.ChildProcess | undefined;
+
+// 规则目录查询客户端，规则列表和WebView共用一个常驻查询进程
+let catalogClient: CatalogClient | undefined;
+
+/**
+ * @description 获取规则目录查询客户端
+ * @param context 扩展上下文
+ * @returns 查询客户端
+ */
+function getCatalogClient(context: vscode.ExtensionContext): CatalogClient {
+  if (!catalogClient) {
+    catalogClient = new CatalogClient(context.extensionUri.fsPath);
+    context.subscriptions.push(catalogClient);
+  }
+  return catalogClient;
+}
+
+/**
+ * @description 打开工作区时在后台预生成推荐规则，只写入缓存，之后点击这些规则可立即完成
+ * @param context 扩展上下文
+ */
+function startPrefetch(context: vscode.ExtensionContext): void {
+  const config = vscode.workspace.getConfiguration('cursor-rules');
+  if (!config.get<boolean>('prefetch.enabled') || prefetchProcess) {
+    return;
+  }
+  // 后台任务不弹出配置提示，配置不完整时直接跳过
+  const modelUrl = config.get<string>('modelUrl');
+  const apiKey = config.get<string>('apiKey');
+  const modelName = config.get<string>('modelName');
+  if (!vscode.workspace.workspaceFolders || vscode.workspace.workspaceFolders.length === 0 || !modelUrl || !apiKey || !modelName) {
+    return;
+  }
+  
+  const workspacePath = vscode.workspace.workspaceFolders[0].uri.fsPath;
+  const extensionPath = context.extensionUri.fsPath;
+  const scriptPath = [
+    path.join(extensionPath, 'scripts', 'local_rules_selector.py'),
+    path.join(__dirname, '..', '..', 'scripts', 'local_rules_selector.py'),
+    path.join(__dirname, '..', 'scripts', 'local_rules_selector.py')
+  ].find(candidate => fs.existsSync(candidate));
+  const rulesJsonPath = catalogPath(extensionPath);
+  if (!scriptPath || !fs.existsSync(rulesJsonPath)) {
+    return;
+  }
+  
+  const args = [
+    scriptPath,
+    workspacePath,
+    '--rules-json', rulesJsonPath,
+    '--prefetch', String(config.get<number>('prefetch.count') || 5),
+    '--prefetch-max-tokens', String(config.get<number>('prefetch.maxTokens') ?? 60000),
+    '--events', 'ndjson'
+  ];
+  const env: {[key: string]: string} = {
+    ...process.env,
+    CURSOR_RULES_MODEL_URL: modelUrl,
+    CURSOR_RULES_API_KEY: apiKey,
+    CURSOR_RULES_MODEL_NAME: modelName,
+    PYTHONIOENCODING: 'utf-8'
+  };
+  
+  const child = cp.spawn(config.get<string>('pythonPath') || 'python', args, { env, cwd: workspacePath });
+  prefetchProcess = child;
+  let stdoutBuffer = '';
+  child.stdout?.on('data', (data: Buffer) => {
+    stdoutBuffer += data.toString();
+    const lines = stdoutBuffer.split('\n');
+    stdoutBuffer = lines.pop() || '';
+    for (const line of lines) {
+      try {
+        const event = JSON.parse(line);
+        if (event.event === 'prefetch') {
+          console.log(`规则预生成完成: 生成${event.generated}项，已缓存${event.cached}项，超出花费上限跳过${event.over_budget}项`);
+        }
+      } catch (error) {
+        // 忽略非事件输出
+      }
+    }
+  });
+  // 预生成失败不影响正常使用，不提示用户
+  child.on('error', (error) => console.log(`启动规则预生成失败: ${error.message}`));
+  child.on('close', () => {
+    if (prefetchProcess === child) {
+      prefetchProcess = undefined;
+    }
+  });
+}
+
+/**
+ * @description 结束后台预生成进程，未完成的生成不会写入缓存
+ */
+function stopPrefetch(): void {
+  if (prefetchProcess) {
+    prefetchProcess.kill('SIGTERM');
+    prefetchProcess = undefined;
+  }
+}
+
 /**
  * @description 激活扩展时调用
  * @param context 扩展上下文
@@ -542,7 +684,7 @@ export function activate(context: vscode.ExtensionContext) {
   }, 2000); // 延迟2秒显示提示，让VSCode界面完全加载
 
   // 注册WebView提供者
-  const rulesProvider = new RulesWebViewProvider(context.extensionUri);
+  const rulesProvider = new RulesWebViewProvider(context.extensionUri, getCatalogClient(context));
   context.subscriptions.push(
     vscode.window.registerWebviewViewProvider(
       'cursor-rules-view',
@@ -631,6 +773,16 @@ export function activate(context: vscode.ExtensionContext) {
   );
 
   context.subscriptions.push(generateRulesCommand, previewRulesCommand, configureModelCommand, configureAPIKeyCommand, resetConfigPromptCommand, localRulesCommand);
+  
+  // 后台预生成推荐规则，工作区变化时针对新工作区重新开始
+  startPrefetch(context);
+  context.subscriptions.push(
+    vscode.workspace.onDidChangeWorkspaceFolders(() => {
+      stopPrefetch();
+      startPrefetch(context);
+    }),
+    { dispose: stopPrefetch }
+  );
 }
 
 /**
@@ -670,6 +822,9 @@ function getPreviewWebviewContent(webview: vscode.Webview, extensionUri: vscode.
  * @description 停用扩展时调用
  */
 export function deactivate() {
+  stopPrefetch();
+  catalogClient?.dispose();
+  catalogClient = undefined;
   console.log('Cursor Project Rules Generator 已停用');
 }
 
@@ -745,7 +900,7 @@ async function updateRulesDatabase(context: vscode.ExtensionContext): Promise<vo
     const extensionUri = context.extensionUri;
     const extensionPath = extensionUri.fsPath;
     
-    // 规则数据文件路径
+    // 规则数据文件路径：获取的规则写入rules.db.json，作为覆盖层叠加在随扩展分发的规则库之上
     const rulesDir = path.join(extensionPath, 'rules_data');
     const rulesJsonPath = path.join(rulesDir, 'rules.db.json');
     
@@ -6,6 +6,10 @@ import * as cp from 'child_process';
 import * as fs from 'fs';
 import * as path from 'path';
 import * as vscode from 'vscode';
+import { CatalogClient, catalogPath } from './catalogClient';
+
+// 每页加载的规则数
+const RULES_PAGE_SIZE = 50;
 
 /**
  * @description 规则信息接口
@@ -15,7 +19,7 @@ interface RuleInfo {
   name: string;
   title: string;
   description: string;
-  content: string;
+  content?: string;
   tags?: string[];
   slug?: string;
 }
@@ -30,42 +34,45 @@ export class RulesWebViewProvider implements vscode.WebviewViewProvider {
   /**
    * @description 构造函数
    * @param _extensionUri 扩展URI
+   * @param _catalog 规则目录查询客户端
    */
-  constructor(private readonly _extensionUri: vscode.Uri) {}
+  constructor(private readonly _extensionUri: vscode.Uri, private readonly _catalog: CatalogClient) {}
 
   /**
-   * @description 从本地JSON文件加载规则
-   * @returns 规则列表
+   * @description 分页加载规则列表，只包含列表需要的字段，规则内容在展开时单独获取
+   * @param cursor 上一页返回的游标，为空时加载第一页
+   * @returns 当前页规则和下一页游标
    */
-  private async loadRulesFromJson(): Promise<RuleInfo[]> {
+  private async loadRulesPage(cursor?: string | null): Promise<{ rules: RuleInfo[]; nextCursor: string | null; total: number }> {
     try {
-      const extensionPath = this._extensionUri.fsPath;
-      const rulesJsonPath = path.join(extensionPath, 'rules_data', 'rules.db.json');
-      
+      const rulesJsonPath = catalogPath(this._extensionUri.fsPath);
       if (!fs.existsSync(rulesJsonPath)) {
         throw new Error(`找不到规则数据文件: ${rulesJsonPath}`);
       }
       
-      const rawData = fs.readFileSync(rulesJsonPath, 'utf8');
-      const rulesData = JSON.parse(rawData);
-      
-      const rules: RuleInfo[] = rulesData.map((rule: any, index: number) => {
+      const page = await this._catalog.query({
+        fields: ['slug', 'title', 'tags'],
+        sort: 'title',
+        cursor,
+        limit: RULES_PAGE_SIZE
+      });
+      const rules: RuleInfo[] = page.items.map((rule: any) => {
+        const tags = Array.isArray(rule.tags) ? rule.tags : rule.tags ? [String(rule.tags)] : [];
         return {
-          id: rule.slug || `rule-${index}`,
-          name: rule.slug ? `${rule.slug}-practices` : `rule-${index}`,
+          id: rule.id,
+          name: rule.slug ? `${rule.slug}-practices` : rule.id,
           title: rule.title || '未命名规则',
-          description: rule.content?.substring(0, 100) + '...' || '无描述',
-          content: rule.content || '',
-          tags: rule.tags || [],
+          description: tags.length > 0 ? tags.join(', ') : '无描述',
+          tags,
           slug: rule.slug || ''
         };
       });
       
-      return rules;
+      return { rules, nextCursor: page.next_cursor, total: page.total };
     } catch (error) {
       console.error('加载规则失败:', error);
       vscode.window.showErrorMessage(`加载本地规则数据失败: ${error instanceof Error ? error.message : String(error)}`);
-      return [];
+      return { rules: [], nextCursor: null, total: 0 };
     }
   }
 
@@ -106,6 +113,12 @@ export class RulesWebViewProvider implements vscode.WebviewViewProvider {
           case 'refreshRules':
             this.updateRulesList();
             return;
+          case 'loadMoreRules':
+            this.updateRulesList(message.cursor);
+            return;
+          case 'getRuleContent':
+            this._sendRuleContent(message.ruleId);
+            return;
         }
       },
       undefined,
@@ -115,8 +128,9 @@ export class RulesWebViewProvider implements vscode.WebviewViewProvider {
 
   /**
    * @description 更新规则列表
+   * @param cursor 下一页的游标，为空时重新加载第一页
    */
-  private async updateRulesList(): Promise<void> {
+  private async updateRulesList(cursor?: string): Promise<void> {
     if (!this._view) {
       return;
     }
@@ -125,8 +139,13 @@ export class RulesWebViewProvider implements vscode.WebviewViewProvider {
     this._view.webview.postMessage({ command: 'setLoading', value: true });
     
     try {
-      const rules = await this.loadRulesFromJson();
-      this._view.webview.postMessage({ command: 'updateRules', rules });
+      const page = await this.loadRulesPage(cursor);
+      this._view.webview.postMessage({
+        command: cursor ? 'appendRules' : 'updateRules',
+        rules: page.rules,
+        nextCursor: page.nextCursor,
+        total: page.total
+      });
     } catch (error) {
       vscode.window.showErrorMessage(`更新规则列表失败: ${error instanceof Error ? error.message : String(error)}`);
     } finally {
@@ -134,6 +153,26 @@ export class RulesWebViewProvider implements vscode.WebviewViewProvider {
     }
   }
 
+  /**
+   * @description 按需获取单条规则的完整内容并发送到WebView
+   * @param ruleId 规则ID
+   */
+  private async _sendRuleContent(ruleId: string): Promise<void> {
+    if (!this._view || !ruleId) {
+      return;
+    }
+    try {
+      const rule = await this._catalog.get(ruleId, ['content']);
+      this._view.webview.postMessage({ command: 'ruleContent', ruleId, content: rule.content || '' });
+    } catch (error) {
+      this._view.webview.postMessage({
+        command: 'ruleContent',
+        ruleId,
+        content: `加载规则内容失败: ${error instanceof Error ? error.message : String(error)}`
+      });
+    }
+  }
+
   /**
    * @description 生成单个规则
    * @param ruleId 规则ID
@@ -163,7 +202,7 @@ export class RulesWebViewProvider implements vscode.WebviewViewProvider {
       const pythonPath = config.get<string>('pythonPath') || 'python';
       
       // 设置规则数据文件路径
-      const rulesJsonPath = path.join(extensionPath, 'rules_data', 'rules.db.json');
+      const rulesJsonPath = catalogPath(extensionPath);
       
       // 运行Python脚本并传递参数
       const childProcess = cp.spawn(pythonPath, [
@@ -288,6 +327,10 @@ export class RulesWebViewProvider implements vscode.WebviewViewProvider {
         button:hover {
           background-color: var(--vscode-button-hoverBackground);
         }
+        .load-more {
+          display: none;
+          width: 100%;
+        }
         .empty-message {
           text-align: center;
           padding: 20px;
@@ -317,6 +360,7 @@ export class RulesWebViewProvider implements vscode.WebviewViewProvider {
         <div id="rules-list" class="rules-list">
           <!-- 规则列表将在此动态生成 -->
         </div>
+        <button id="load-more-button" class="load-more">加载更多</button>
         
         <div class="actions">
           <button id="apply-button">应用所选规则</button>
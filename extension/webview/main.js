@@ -5,15 +5,17 @@
 // 获取VS Code API
 const vscode = acquireVsCodeApi();
 
-// 存储规则数据
+// 存储规则数据（只包含列表字段，内容在展开时按需获取）
 let rules = [];
 let selectedRuleIds = [];
+let nextCursor = null;
 
 // DOM元素
 const rulesListElement = document.getElementById('rules-list');
 const loadingElement = document.getElementById('loading');
 const applyButton = document.getElementById('apply-button');
 const refreshButton = document.getElementById('refresh-button');
+const loadMoreButton = document.getElementById('load-more-button');
 
 /**
  * @description 初始化页面
@@ -56,6 +58,18 @@ function init() {
     });
   }
 
+  if (loadMoreButton) {
+    loadMoreButton.addEventListener('click', () => {
+      if (nextCursor) {
+        setLoading(true);
+        vscode.postMessage({
+          command: 'loadMoreRules',
+          cursor: nextCursor
+        });
+      }
+    });
+  }
+
   // 请求规则数据
   vscode.postMessage({
     command: 'refreshRules'
@@ -76,13 +90,26 @@ function setLoading(isLoading) {
   }
 }
 
+/**
+ * @description 更新"加载更多"按钮
+ * @param {string|null} cursor - 下一页的游标，没有下一页时为null
+ */
+function setNextCursor(cursor) {
+  nextCursor = cursor || null;
+  if (loadMoreButton) {
+    loadMoreButton.style.display = nextCursor ? 'block' : 'none';
+  }
+}
+
 /**
  * @description 更新规则列表
- * @param {Array} newRules - 新的规则列表
+ * @param {Array} newRules - 第一页规则
+ * @param {string|null} cursor - 下一页的游标
  */
-function updateRulesList(newRules) {
-  rules = newRules;
+function updateRulesList(newRules, cursor) {
+  rules = [];
   selectedRuleIds = [];
+  setNextCursor(cursor);
   
   if (!rulesListElement) {
     return;
@@ -91,13 +118,29 @@ function updateRulesList(newRules) {
   // 清空列表
   rulesListElement.innerHTML = '';
   
-  if (rules.length === 0) {
+  if (newRules.length === 0) {
     rulesListElement.innerHTML = '<div class="empty-message">没有可用的规则</div>';
     return;
   }
   
+  appendRules(newRules, cursor);
+}
+
+/**
+ * @description 在列表末尾追加一页规则
+ * @param {Array} newRules - 新加载的规则
+ * @param {string|null} cursor - 下一页的游标
+ */
+function appendRules(newRules, cursor) {
+  rules = rules.concat(newRules);
+  setNextCursor(cursor);
+  
+  if (!rulesListElement) {
+    return;
+  }
+  
   // 创建规则项
-  rules.forEach(rule => {
+  newRules.forEach(rule => {
     const ruleElement = document.createElement('div');
     ruleElement.className = 'rule-item';
     ruleElement.id = `rule-item-${rule.id}`;
@@ -147,8 +190,12 @@ function updateRulesList(newRules) {
           if (!ruleElement.querySelector('.rule-content')) {
             const content = document.createElement('div');
             content.className = 'rule-content';
-            content.textContent = rule.content;
+            content.textContent = '加载中...';
             ruleElement.appendChild(content);
+            vscode.postMessage({
+              command: 'getRuleContent',
+              ruleId: rule.id
+            });
           }
         }
       }
@@ -166,8 +213,19 @@ window.addEventListener('message', event => {
   
   switch (message.command) {
     case 'updateRules':
-      updateRulesList(message.rules);
+      updateRulesList(message.rules, message.nextCursor);
+      break;
+    case 'appendRules':
+      appendRules(message.rules, message.nextCursor);
+      break;
+    case 'ruleContent': {
+      const ruleElement = document.getElementById(`rule-item-${message.ruleId}`);
+      const content = ruleElement && ruleElement.querySelector('.rule-content');
+      if (content) {
+        content.textContent = message.content;
+      }
       break;
+    }
     case 'setLoading':
       setLoading(message.value);
       break;
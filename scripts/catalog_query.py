@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 规则目录的分页查询：只返回请求的字段（默认slug、title、tags），按排序键和游标分页，
+完整内容按需单独获取；常驻模式（--serve）通过标准输入输出逐行处理JSON请求，规则数据文件变化时自动重新加载
+"""
+
+import os
+import sys
+import json
+import base64
+import logging
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+try:
+    from rule_query import RuleIndex
+    from rule_store import rule_content, catalog_signature
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from rule_query import RuleIndex
+    from rule_store import rule_content, catalog_signature
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FIELDS = ("slug", "title", "tags")  # 列表默认返回的字段
+SORT_KEYS = ("slug", "title")               # 可用的排序键，前缀 - 表示降序
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+FILTER_CACHE_SIZE = 16                      # 缓存的筛选结果数（翻页时不必重新筛选）
+
+def _sort_value(rule, key):
+    value = rule.get(key)
+    return str(value if value is not None else '').casefold()
+
+def encode_cursor(sort, value, rule_id):
+    """游标记录上一页最后一条规则的排序值和id，插入或删除规则后翻页仍然连续"""
+    raw = json.dumps([sort, value, rule_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort):
+    """
+    @return Tuple[str, str] - (排序值, 规则id)
+    @throws ValueError 游标格式不正确或不是按同一排序键生成的
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, rule_id = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+    if cursor_sort != sort:
+        raise ValueError(f"游标不是按 {sort} 排序生成的")
+    return str(value), str(rule_id)
+
+class CatalogQuery:
+    """
+    规则目录的分页查询
+
+    每个排序键的顺序只计算一次，翻页时用二分查找定位游标位置；
+    筛选条件（文本搜索、tag:/lib: 选择表达式）的结果按条件缓存
+
+    @param rules - 规则列表（load_rules_from_json的结果）
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.ids = []
+        self.by_id = {}
+        for index, rule in enumerate(rules):
+            rule_id = rule.get('slug') or f"rule-{index}"
+            if rule_id in self.by_id:
+                # 重复的slug加上序号：游标依赖 (排序值, id) 唯一，否则翻页时会跳过同名规则
+                rule_id = f"{rule_id}~{index}"
+            self.by_id[rule_id] = index
+            self.ids.append(rule_id)
+        self.orders = {}
+        self.filters = OrderedDict()
+        self.index = None
+
+    def _order(self, key):
+        """
+        @return Tuple[List[Tuple[str, str]], List[int]] - 升序排列的 (排序值, id) 和对应的规则下标
+        """
+        order = self.orders.get(key)
+        if order is None:
+            indexes = sorted(range(len(self.rules)), key=lambda i: (_sort_value(self.rules[i], key), self.ids[i]))
+            order = self.orders[key] = ([(_sort_value(self.rules[i], key), self.ids[i]) for i in indexes], indexes)
+        return order
+
+    def _matches(self, search, where):
+        """
+        @return Set[int] | None - 满足筛选条件的规则下标，没有筛选条件时返回None
+        """
+        if not search and not where:
+            return None
+        key = (search, where)
+        matched = self.filters.get(key)
+        if matched is not None:
+            self.filters.move_to_end(key)
+            return matched
+
+        candidates = range(len(self.rules))
+        if where:
+            if self.index is None:
+                self.index = RuleIndex(self.rules)
+            selected, _ = self.index.select(where)
+            selected_ids = {id(rule) for rule in selected}
+            candidates = [i for i in candidates if id(self.rules[i]) in selected_ids]
+        if search:
+            needle = search.casefold()
+            candidates = [i for i in candidates if needle in self._search_text(i)]
+        matched = self.filters[key] = set(candidates)
+        if len(self.filters) > FILTER_CACHE_SIZE:
+            self.filters.popitem(last=False)
+        return matched
+
+    def _search_text(self, index):
+        rule = self.rules[index]
+        tags = rule.get('tags') or []
+        if isinstance(tags, str):
+            tags = [tags]
+        return ' '.join([self.ids[index], str(rule.get('title') or ''), *map(str, tags)]).casefold()
+
+    def project(self, index, fields):
+        """只保留请求的字段，id始终返回；延迟加载的规则在请求content时才解压正文"""
+        rule = self.rules[index]
+        item = {"id": self.ids[index]}
+        for field in fields:
+            if field in rule:
+                item[field] = rule[field]
+            elif field == 'content' and rule.get('content_id'):
+                item[field] = rule_content(rule)
+        return item
+
+    def page(self, fields=DEFAULT_FIELDS, sort="title", cursor=None, limit=DEFAULT_PAGE_SIZE, search=None, where=None):
+        """
+        查询一页规则
+
+        @param fields - 返回的字段
+        @param sort - 排序键（SORT_KEYS之一），前缀 - 表示降序
+        @param cursor - 上一页返回的next_cursor，为空时从第一条开始
+        @param limit - 每页条数，不超过MAX_PAGE_SIZE
+        @param search - 在slug、标题和标签中搜索的文本（不区分大小写）
+        @param where - 规则选择表达式，例如 "tag:react AND NOT lib:vue"
+        @return dict - {"items": 当前页规则, "next_cursor": 下一页游标（没有下一页时为None）, "total": 满足条件的规则总数}
+        @throws ValueError 排序键、游标或选择表达式不正确时
+        @example
+            query.page(sort="-title", limit=20, where="tag:python")
+        """
+        descending = sort.startswith('-')
+        key = sort.lstrip('-')
+        if key not in SORT_KEYS:
+            raise ValueError(f"不支持的排序键: {sort}（可用: {', '.join(SORT_KEYS)}）")
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        fields = list(fields or DEFAULT_FIELDS)
+
+        keys, indexes = self._order(key)
+        matched = self._matches(search, where)
+        if cursor:
+            position = decode_cursor(cursor, sort)
+            start = bisect_left(keys, position) - 1 if descending else bisect_right(keys, position)
+        else:
+            start = len(keys) - 1 if descending else 0
+        step = -1 if descending else 1
+
+        items = []
+        position = start
+        last = None
+        while 0 <= position < len(keys) and len(items) < limit:
+            index = indexes[position]
+            if matched is None or index in matched:
+                items.append(self.project(index, fields))
+                last = keys[position]
+            position += step
+
+        # 之后是否还有满足条件的规则
+        has_more = False
+        while 0 <= position < len(keys):
+            if matched is None or indexes[position] in matched:
+                has_more = True
+                break
+            position += step
+
+        return {
+            "items": items,
+            "next_cursor": encode_cursor(sort, *last) if has_more and last else None,
+            "total": len(keys) if matched is None else len(matched)
+        }
+
+    def get(self, rule_id, fields=None):
+        """
+        获取单条规则
+
+        @param rule_id - 规则slug（没有slug的规则为 rule-<序号>，重复的slug为 <slug>~<序号>）
+        @param fields - 返回的字段，为空时返回全部字段
+        @return dict | None
+        """
+        index = self.by_id.get(rule_id)
+        if index is None:
+            return None
+        if fields:
+            return self.project(index, fields)
+        rule = dict(self.rules[index], id=rule_id)
+        if 'content' not in rule and rule.get('content_id'):
+            rule['content'] = rule_content(rule)
+        return rule
+
+class CatalogService:
+    """
+    常驻查询服务：规则数据文件（规则库及其覆盖层）的修改时间或大小变化时重新加载
+
+    @param catalog_path - 规则库或规则数据JSON文件路径
+    @param load - 加载函数 load(path) -> 规则列表
+    """
+
+    def __init__(self, catalog_path, load):
+        self.catalog_path = catalog_path
+        self.load = load
+        self.signature = None
+        self.query = None
+
+    def current(self):
+        """@return CatalogQuery - 与规则数据文件当前内容一致的查询对象"""
+        signature = catalog_signature(self.catalog_path)
+        if signature != self.signature:
+            self.query = CatalogQuery(self.load(self.catalog_path))
+            self.signature = signature
+        return self.query
+
+    def handle(self, request):
+        """
+        处理一个请求
+
+        - {"method": "query", "params": {...page的参数}}
+        - {"method": "get", "params": {"id": 规则slug, "fields": [...]}}
+        - {"method": "ping"}
+
+        @return dict - {"id": 请求id, "result": ...} 或 {"id": 请求id, "error": 错误信息}
+        """
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("请求必须是JSON对象")
+            method = request.get("method")
+            params = request.get("params") or {}
+            if method == "ping":
+                result = {"rules": len(self.current().rules)}
+            elif method == "query":
+                allowed = ("fields", "sort", "cursor", "limit", "search", "where")
+                result = self.current().page(**{key: value for key, value in params.items() if key in allowed})
+            elif method == "get":
+                result = self.current().get(str(params.get("id") or ''), params.get("fields"))
+                if result is None:
+                    raise ValueError(f"找不到规则: {params.get('id')}")
+            else:
+                raise ValueError(f"未知的方法: {method}")
+        except (ValueError, TypeError, OSError) as e:
+            return {"id": request_id, "error": str(e)}
+        return {"id": request_id, "result": result}
+
+    def serve(self, input_stream=None, output_stream=None):
+        """
+        逐行读取JSON请求并逐行输出响应，直到输入结束（扩展关闭标准输入或结束进程）
+        """
+        input_stream = input_stream or sys.stdin
+        output_stream = output_stream or sys.stdout
+        logger.info(f"规则查询服务已启动: {self.catalog_path}")
+        for line in input_stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"id": None, "error": f"无效的JSON: {str(e)}"}
+            else:
+                response = self.handle(request)
+            output_stream.write(json.dumps(response, ensure_ascii=False) + '\n')
+            output_stream.flush()
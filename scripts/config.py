@@ -6,10 +6,18 @@
 """
 
 import os
-import json
+import sys
 import logging
+import threading
 from pathlib import Path
 
+try:
+    from settings_store import SettingsFile
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from settings_store import SettingsFile
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -28,66 +36,132 @@ DEFAULT_CONFIG = {
     "api_key": "",
     "model_name": "gpt-3.5-turbo",
     "use_ai": True,
-    "temperature": 0.5,
-    "max_tokens": 2000
+    "temperature": 0.2,
+    "max_tokens": 2000,
+    # 备用端点列表，元素为URL或包含model_url/api_key/model_name的字典
+    "endpoints": [],
+    # 首个token超过该百分位延迟时发送对冲请求
+    "hedge_percentile": 0.95,
+    # 单次生成的整体截止时间（秒），超时后回退到原始规则
+    "request_deadline": 120,
+    # 客户端限流：每分钟请求数和token数上限，0表示不限制
+    "rpm_limit": 0,
+    "tpm_limit": 0,
+    # 命名的模型配置，每项可覆盖PROFILE_KEYS中的配置，例如 {"fast": {"model_name": "gpt-4o-mini"}}
+    "profiles": {},
+    # 按顺序匹配的路由规则，第一条满足全部条件的规则生效，例如
+    # {"profile": "strong", "min_chars": 8000}、{"profile": "fast", "tags": ["python"]}、{"profile": "strong", "rules": ["slug"]}
+    "profile_routing": [],
+    # 没有匹配的路由规则时使用的模型配置，为空时使用顶层配置
+    "default_profile": "",
+    # 每1000个输入/输出token的价格，仅用于--plan的费用预估，0表示未配置
+    "input_price_per_1k": 0,
+    "output_price_per_1k": 0,
+    # 预生成（--prefetch）：推荐的规则数量，以及单次预生成的预估token数和费用上限（0表示不限制）
+    "prefetch_count": 5,
+    "prefetch_max_tokens": 60000,
+    "prefetch_max_cost": 0,
+    # 批量任务（--batch）：并发生成的任务数、每个任务的最大尝试次数，以及进度报告间隔（秒）
+    "batch_workers": 4,
+    "batch_max_attempts": 3,
+    "batch_progress_interval": 5,
+    # 单个源规则最多生成的规则数、每条规则最多保留的顶层条目数，达到后提前结束模型输出（0表示不限制）
+    "max_rules_per_source": 0,
+    "max_bullets_per_rule": 0
 }
 
+# 模型配置（profile）可以覆盖的配置项
+PROFILE_KEYS = ["model_url", "api_key", "model_name", "endpoints", "temperature", "max_tokens",
+                "hedge_percentile", "request_deadline", "input_price_per_1k", "output_price_per_1k",
+                "max_rules_per_source", "max_bullets_per_rule"]
+
+# 可以由环境变量覆盖的配置项
+ENV_VARS = {
+    "model_url": "CURSOR_RULES_MODEL_URL",
+    "api_key": "CURSOR_RULES_API_KEY",
+    "model_name": "CURSOR_RULES_MODEL_NAME",
+    "use_ai": "CURSOR_RULES_USE_AI",
+    "endpoints": "CURSOR_RULES_ENDPOINTS",
+    "default_profile": "CURSOR_RULES_PROFILE"
+}
+
+# 配置文件，按修改时间判断是否需要重新读取
+_config_file = SettingsFile(CONFIG_FILE)
+# 最近一次合并的完整配置，配置文件和环境变量都没有变化时直接复用
+_config_cache = {}
+_config_lock = threading.RLock()
+
 def load_config():
     """
     加载配置，优先级：环境变量 > 配置文件 > 默认值
-    """
-    # 初始化配置为默认值
-    config = DEFAULT_CONFIG.copy()
     
-    # 尝试从配置文件加载
+    配置文件的修改时间和环境变量都没有变化时返回缓存的结果（的副本），不再重新读取和合并
+    """
     try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                file_config = json.load(f)
-                # 更新配置，但不覆盖默认配置中不存在的键
-                for key in config:
-                    if key in file_config and file_config[key]:
-                        config[key] = file_config[key]
+        file_config = _config_file.read()
     except Exception as e:
         logger.error(f"加载配置文件失败: {str(e)}")
+        file_config = {}
+    env_vars = {key: os.environ.get(name) for key, name in ENV_VARS.items()}
+    
+    signature = (_config_file.signature, tuple(env_vars.values()))
+    with _config_lock:
+        if _config_cache.get("signature") == signature:
+            return dict(_config_cache["config"])
+    
+    # 初始化配置为默认值
+    config = DEFAULT_CONFIG.copy()
+    
+    # 更新配置，但不覆盖默认配置中不存在的键；数值0是有效值（例如表示不限制）
+    for key in config:
+        value = file_config.get(key)
+        if value or (value == 0 and isinstance(value, (int, float)) and not isinstance(value, bool)):
+            config[key] = value
     
     # 从环境变量加载配置
-    env_vars = {
-        "model_url": os.environ.get("CURSOR_RULES_MODEL_URL"),
-        "api_key": os.environ.get("CURSOR_RULES_API_KEY"),
-        "model_name": os.environ.get("CURSOR_RULES_MODEL_NAME"),
-        "use_ai": os.environ.get("CURSOR_RULES_USE_AI")
-    }
-    
-    # 更新配置
     for key, value in env_vars.items():
         if value:
             if key == "use_ai":
                 # 转换为布尔值
                 config[key] = value.lower() in ("yes", "true", "t", "1")
+            elif key == "endpoints":
+                # 多个备用端点URL以逗号分隔
+                config[key] = [url.strip() for url in value.split(',') if url.strip()]
             else:
                 config[key] = value
     
-    return config
+    with _config_lock:
+        _config_cache["signature"] = signature
+        _config_cache["config"] = config
+    return dict(config)
 
 def save_config(config):
     """
-    保存配置到文件
+    保存配置到文件（加锁并原子替换，同时运行的其他进程不会读到写了一半的文件）
     """
     try:
-        # 确保配置目录存在
-        os.makedirs(CONFIG_DIR, exist_ok=True)
-        
-        # 保存配置
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
-        
+        _config_file.replace(config)
         logger.info(f"配置已保存到: {CONFIG_FILE}")
         return True
     except Exception as e:
         logger.error(f"保存配置失败: {str(e)}")
         return False
 
+def on_config_change(listener):
+    """
+    订阅配置文件的变化，常驻进程可以据此在不重启的情况下使用新的API密钥或模型
+    
+    变化在下一次load_config或watch_config的后台检查时发现
+    
+    @param listener - listener(config, changed_keys)，config为重新加载后的完整配置
+    @return Callable - 调用后取消订阅
+    """
+    return _config_file.subscribe(lambda old, new, changed: listener(load_config(), changed))
+
+def watch_config(interval=None):
+    """启动后台线程定期检查配置文件，没有调用load_config时也能及时通知订阅者"""
+    _config_file.watch(interval)
+
 def prompt_for_config(config):
     """
     交互式提示用户输入配置信息
@@ -119,7 +193,7 @@ def get_model_config(force_prompt=False):
     config = load_config()
     
     # 检查是否有必要的配置项
-    has_required = all([config.get('model_url'), config.get('api_key'), config.get('model_name')])
+    has_required = all([config.get('model_url') or config.get('endpoints'), config.get('api_key'), config.get('model_name')])
     
     # 打印配置检测结果
     logger.info(f"模型配置检测结果: {'完整' if has_required else '不完整'}")
@@ -130,6 +204,67 @@ def get_model_config(force_prompt=False):
     
     return config
 
+def get_profile_config(config, profile_name):
+    """
+    获取应用了指定模型配置（profile）后的配置，profile中未设置的项沿用顶层配置
+    
+    每次按传入的config重新合并（只是复制一个字典），环境变量或配置文件变化后不会返回过期的结果
+    
+    @param config - get_model_config返回的顶层配置
+    @param profile_name - profile名称，为空时返回顶层配置
+    @return dict
+    """
+    if not profile_name:
+        return config
+    
+    profile = (config.get('profiles') or {}).get(profile_name)
+    if not isinstance(profile, dict):
+        logger.warning(f"未找到模型配置 {profile_name}，使用默认配置")
+        return config
+    
+    merged = dict(config)
+    for key in PROFILE_KEYS:
+        if profile.get(key) not in (None, ''):
+            merged[key] = profile[key]
+    merged['profile'] = profile_name
+    return merged
+
+def select_profile(config, rule, content_length, override=None):
+    """
+    按路由规则为源规则选择模型配置
+    
+    路由规则的条件：rules（slug列表）、tags（任一标签匹配）、min_chars/max_chars（源规则字符数范围），
+    一条路由规则中的多个条件需要同时满足
+    
+    @param rule - 源规则数据
+    @param content_length - 源规则内容的字符数
+    @param override - 显式指定的profile名称，优先于路由规则
+    @return str | None - profile名称，None表示使用顶层配置
+    """
+    if override:
+        return override
+    
+    tags = rule.get('tags') or []
+    if isinstance(tags, str):
+        tags = [tag.strip(" '\"") for tag in tags.strip('[]').split(',')]
+    tags = {str(tag).lower() for tag in tags if tag}
+    slug = str(rule.get('slug', '')).lower()
+    
+    for route in config.get('profile_routing') or []:
+        if not isinstance(route, dict) or not route.get('profile'):
+            continue
+        if route.get('rules') and slug not in [str(r).lower() for r in route['rules']]:
+            continue
+        if route.get('tags') and not tags & {str(t).lower() for t in route['tags']}:
+            continue
+        if 'min_chars' in route and content_length < route['min_chars']:
+            continue
+        if 'max_chars' in route and content_length > route['max_chars']:
+            continue
+        return route['profile']
+    
+    return config.get('default_profile') or None
+
 if __name__ == "__main__":
     # 测试配置加载和保存
     print("当前配置:", load_config())
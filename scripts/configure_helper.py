@@ -6,10 +6,9 @@
 """
 
 import os
-import json
+import sys
 import logging
 import argparse
-from pathlib import Path
 
 # 配置日志
 logging.basicConfig(
@@ -19,61 +18,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def find_vscode_settings():
-    """查找VSCode设置文件"""
-    # 尝试查找用户设置文件
-    home_dir = Path.home()
-    
-    # Windows路径
-    win_path = home_dir / "AppData" / "Roaming" / "Code" / "User" / "settings.json"
-    # Linux路径
-    linux_path = home_dir / ".config" / "Code" / "User" / "settings.json"
-    # macOS路径
-    mac_path = home_dir / "Library" / "Application Support" / "Code" / "User" / "settings.json"
-    
-    if win_path.exists():
-        return win_path
-    elif linux_path.exists():
-        return linux_path
-    elif mac_path.exists():
-        return mac_path
-    else:
-        return None
+try:
+    from settings_store import update_vscode_settings as write_vscode_settings
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from settings_store import update_vscode_settings as write_vscode_settings
 
 def update_vscode_settings(model_url=None, api_key=None, model_name=None):
-    """更新VSCode设置文件"""
-    settings_path = find_vscode_settings()
-    if not settings_path:
-        logger.error("无法找到VSCode设置文件")
-        return False
-    
-    try:
-        # 读取现有设置
-        with open(settings_path, 'r', encoding='utf-8') as f:
-            settings = json.load(f)
-        
-        # 更新设置
-        if model_url:
-            settings["cursor-rules.modelUrl"] = model_url
-            logger.info(f"已设置模型URL: {model_url}")
-            
-        if api_key:
-            settings["cursor-rules.apiKey"] = api_key
-            logger.info(f"已设置API密钥: {'*' * 8}")
-            
-        if model_name:
-            settings["cursor-rules.modelName"] = model_name
-            logger.info(f"已设置模型名称: {model_name}")
-        
-        # 写回设置文件
-        with open(settings_path, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"设置已成功更新")
-        return True
-    except Exception as e:
-        logger.error(f"更新设置时出错: {str(e)}")
-        return False
+    """更新VSCode设置文件（加锁并原子替换，见settings_store.update_vscode_settings）"""
+    return write_vscode_settings(model_url=model_url, api_key=api_key, model_name=model_name)
 
 def get_from_env_or_input(env_var, prompt, sensitive=False):
     """从环境变量或用户输入获取值"""
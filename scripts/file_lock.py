@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 跨进程文件锁，兼容Windows和类Unix系统
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+LOCK_POLL_INTERVAL = 0.05  # 非阻塞加锁的重试间隔（秒）
+
+def _try_lock(f):
+    """尝试获取排他锁，成功返回True"""
+    try:
+        if os.name == 'nt':
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _unlock(f):
+    """释放排他锁"""
+    try:
+        if os.name == 'nt':
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass
+
+@contextmanager
+def file_lock(path, timeout=None, on_wait=None):
+    """
+    获取指定锁文件上的排他锁
+
+    @param path - 锁文件路径，不存在时自动创建
+    @param timeout - 最长等待时间（秒），None表示一直等待
+    @param on_wait - 锁已被占用、需要等待时调用一次的回调
+    @raise TimeoutError - 超时仍未获取到锁
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a+') as f:
+        started = time.time()
+        waiting = False
+        while not _try_lock(f):
+            if not waiting:
+                waiting = True
+                if on_wait:
+                    on_wait()
+            if timeout is not None and time.time() - started >= timeout:
+                raise TimeoutError(f"获取文件锁超时: {path}")
+            time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield f
+        finally:
+            _unlock(f)
@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 规则生成流水线：SSE读取、规则解析校验、文件写入分别在独立线程中运行，阶段之间通过有界队列连接
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+
+try:
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+    from progress_events import emit_event
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    import sys
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+    from progress_events import emit_event
+
+logger = logging.getLogger(__name__)
+
+# 增量文本队列容量：单次响应的数据块数量远小于该值，下游变慢时网络读取也不会被阻塞
+DELTA_QUEUE_SIZE = 8192
+RULE_QUEUE_SIZE = 32        # 解析出的规则队列容量
+WRITE_QUEUE_SIZE = 64       # 待写入文件队列容量，写入过慢时提交方阻塞（背压）
+WRITE_BATCH_SIZE = 16       # 写入线程每批最多处理的文件数
+# 输出目录锁文件所在目录，多个进程写入同一个规则目录时按批次互斥
+OUTPUT_LOCK_DIR = os.path.join(CONFIG_DIR, "locks")
+
+_END = object()
+
+# 顶层条目（无缩进的 "- "、"* "、"1. " 开头的行）
+_BULLET_LINE = re.compile(r'^(?:[-*+]|\d+\.)\s')
+# 未闭合的JSON字符串中的顶层条目开头（换行仍是转义形式 \n）
+_RAW_BULLET = re.compile(r'(?:^|\\n)(?:[-*+]|\d+\.) ')
+_RAW_CONTENT_KEY = re.compile(r'"content"\s*:\s*"')
+
+class StageMetrics:
+    """单个阶段的吞吐统计，多次运行累计"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.max_depth = 0
+
+    def snapshot(self):
+        return {
+            "items": self.items,
+            "busy": round(self.busy, 3),
+            "blocked": round(self.blocked, 3),
+            "max_queue_depth": self.max_depth,
+            "throughput": round(self.items / self.busy, 1) if self.busy > 0 else None
+        }
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+def _stage_metrics(name):
+    with _metrics_lock:
+        if name not in _metrics:
+            _metrics[name] = StageMetrics(name)
+        return _metrics[name]
+
+def get_pipeline_metrics():
+    """
+    获取各阶段的累计统计
+
+    @return dict - {阶段名: {"items", "busy", "blocked", "max_queue_depth", "throughput"}}，
+                   busy为处理耗时，blocked为因下游队列已满而等待的时间
+    """
+    with _metrics_lock:
+        return {name: stage.snapshot() for name, stage in _metrics.items()}
+
+def _put(q, item, metrics):
+    """放入有界队列，记录因背压阻塞的时间和队列深度"""
+    started = time.time()
+    q.put(item)
+    metrics.blocked += time.time() - started
+    metrics.max_depth = max(metrics.max_depth, q.qsize())
+
+class _Failure:
+    """在线程之间传递的阶段异常"""
+
+    def __init__(self, error):
+        self.error = error
+
+class JsonArrayScanner:
+    """
+    增量扫描JSON数组中的顶层对象：跟踪字符串和转义状态以及花括号深度，
+    对象闭合时立即返回其文本，不受字符串内容中的括号和逗号影响
+    """
+
+    def __init__(self):
+        self.text = []
+        self.length = 0
+        self.complete_length = 0
+        self.buffer = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.closed = False  # 数组已闭合，之后的输出只可能是说明文字或代码块标记
+
+    def feed(self, text):
+        """
+        输入一段增量文本
+
+        @return List[str] - 本次输入中闭合的完整对象文本
+        """
+        objects = []
+        if self.closed:
+            return objects
+        self.text.append(text)
+        for char in text:
+            self.length += 1
+            if not self.started:
+                # 跳过数组开始之前的说明文字或代码块标记
+                if char == '[':
+                    self.started = True
+                continue
+            if self.depth == 0:
+                if char == '{':
+                    self.depth = 1
+                    self.buffer = ['{']
+                elif char == ']':
+                    self.closed = True
+                    break
+                elif not self.complete_length and not char.isspace() and char != ',':
+                    # 说明文字中的方括号（例如"[见下文]"）不是规则数组的开始
+                    self.started = False
+                continue
+
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    objects.append(''.join(self.buffer))
+                    self.buffer = []
+                    self.complete_length = self.length
+        return objects
+
+    def complete_text(self):
+        """已输入文本中截至最后一个完整对象的部分，用于续写请求"""
+        return ''.join(self.text)[:self.complete_length]
+
+    def partial_text(self):
+        """尚未闭合的最后一个对象的文本，没有时返回空字符串"""
+        return ''.join(self.buffer) if self.depth > 0 else ''
+
+def parse_object(text):
+    """
+    解析完整的规则对象文本，容忍字符串中未转义的换行和多余的尾随逗号
+
+    @return dict | None
+    """
+    for candidate in (text, re.sub(r',\s*([}\]])', r'\1', text)):
+        try:
+            return json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+    return None
+
+def salvage_object(text):
+    """
+    尝试补全被截断的JSON对象文本：先补上未闭合的字符串和括号，
+    失败时依次回退到前面的顶层逗号处，丢弃最后一个不完整的字段
+
+    @return Tuple[dict | None, str | None] - (补全后的对象, 被截断的字符串值所属的键)
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    string_start = 0
+    escape_start = -1
+    last_string = None
+    last_key = None
+    cut_points = []
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+                escape_start = i
+            elif char == '"':
+                in_string = False
+                last_string = text[string_start + 1:i]
+            continue
+        if char == '"':
+            in_string = True
+            string_start = i
+        elif char == ':' and len(stack) == 1:
+            last_key = last_string
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if stack:
+                stack.pop()
+        elif char == ',' and len(stack) == 1:
+            cut_points.append(i)
+
+    closing = ''.join(reversed(stack))
+    candidates = []
+    if in_string:
+        # 去掉被截断的转义序列（单独的反斜杠或不完整的\\uXXXX）后补上引号
+        base = text
+        if escape_start > string_start and (escaped or (text[escape_start + 1] == 'u' and len(text) - escape_start < 6)):
+            base = text[:escape_start]
+        candidates.append((base + '"' + closing, last_key))
+    else:
+        candidates.append((text + closing, None))
+    candidates.extend((text[:i] + '}', None) for i in reversed(cut_points))
+
+    for candidate, open_key in candidates:
+        obj = parse_object(candidate)
+        if isinstance(obj, dict):
+            return obj, open_key
+    return None, None
+
+def salvage_rule(text):
+    """
+    从被截断的规则对象文本中恢复规则，名称和内容都存在时才返回；
+    内容在中途被截断时丢弃最后一条不完整的条目，其他字段被截断时丢弃该字段（使用默认值）
+
+    @return Tuple[str, str, str, str] | None
+    """
+    if not text:
+        return None
+    obj, open_key = salvage_object(text)
+    if obj is None or open_key == 'name':
+        return None
+    content = obj.get('content')
+    if open_key == 'content' and isinstance(content, str) and '\n' in content:
+        obj['content'] = content.rsplit('\n', 1)[0]
+    elif open_key == 'content' and isinstance(content, list):
+        obj['content'] = content[:-1]
+    elif open_key and open_key != 'content':
+        obj.pop(open_key, None)
+    return validate_rule(obj)
+
+def limit_bullets(content, max_bullets):
+    """
+    只保留前max_bullets条顶层条目（连同其下的缩进内容），之后的内容被丢弃
+
+    @return str
+    """
+    if not max_bullets:
+        return content
+    lines = content.split('\n')
+    count = 0
+    for index, line in enumerate(lines):
+        if _BULLET_LINE.match(line):
+            count += 1
+            if count > max_bullets:
+                return '\n'.join(lines[:index]).rstrip()
+    return content
+
+def count_partial_bullets(text):
+    """
+    统计未闭合的规则对象文本中content字段已开始的顶层条目数，content为数组或尚未出现时返回0
+    """
+    match = _RAW_CONTENT_KEY.search(text)
+    if not match:
+        return 0
+    return len(_RAW_BULLET.findall(text, match.end()))
+
+def validate_rule(rule):
+    """
+    校验并规范化模型返回的规则对象
+
+    @return Tuple[str, str, str, str] | None - 规则元组，缺少名称或内容时返回None
+    """
+    if not isinstance(rule, dict):
+        return None
+    name = str(rule.get("name") or '').strip()
+    content = rule.get("content")
+    if isinstance(content, list):
+        content = '\n'.join(str(line) for line in content)
+    if not name or not content:
+        return None
+    name = name.replace('/', '-').replace('\\', '-')
+    return (name, str(rule.get("description") or ''), str(rule.get("glob_pattern") or '**/*'), str(content))
+
+class StreamPipeline:
+    """
+    将SSE响应流拆分为两个线程阶段：
+    - read: 读取SSE行并提取增量文本，放入容量足够大的队列，保证网络读取始终全速进行
+    - parse: 增量扫描JSON对象并校验，放入有界的规则队列
+
+    迭代该对象即可按生成顺序取得规则元组，任一阶段的异常会在迭代时重新抛出；
+    迭代结束后可通过finish_reason和complete_text()判断输出是否被截断以及从哪里续写，
+    通过salvage()恢复被截断的最后一个规则
+
+    达到以下条件时提前结束并关闭响应流，不再为多余的输出等待和付费（stopped_early记录原因）：
+    - array_end: JSON数组已闭合，之后只可能是说明文字或代码块标记
+    - max_items: 已解析出max_items个对象
+    - max_bullets: 最后一个允许的规则的条目数已达到max_bullets
+
+    @param validate - 对象校验函数，默认按规则对象校验（增量生成时用于校验修改操作）
+    @param max_items - 最多解析的对象数，为空时不限制
+    @param max_bullets - 每条规则最多保留的顶层条目数（只用于规则对象），为空时不限制
+    """
+
+    def __init__(self, lines, on_first_token=None, validate=None, max_items=None, max_bullets=None):
+        self.lines = lines
+        self.on_first_token = on_first_token
+        self.validate = validate or validate_rule
+        self.max_items = max_items
+        self.max_bullets = max_bullets
+        self.stopped_early = None
+        self.emitted = 0
+        self.deltas = queue.Queue(maxsize=DELTA_QUEUE_SIZE)
+        self.rules = queue.Queue(maxsize=RULE_QUEUE_SIZE)
+        self.stop = threading.Event()
+        self.scanner = JsonArrayScanner()
+        self.finish_reason = None
+        self.ended_cleanly = False
+        self.threads = [
+            threading.Thread(target=self._read, name="rule-stream-read", daemon=True),
+            threading.Thread(target=self._parse, name="rule-stream-parse", daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _read(self):
+        metrics = _stage_metrics("read")
+        received_first_token = False
+        try:
+            for line in self.lines:
+                if self.stop.is_set():
+                    break
+                started = time.time()
+                if not line or not line.startswith(b"data: "):
+                    continue
+                json_str = line[6:].decode('utf-8')
+                if json_str.strip() == "[DONE]":
+                    self.ended_cleanly = True
+                    break
+                try:
+                    chunk = json.loads(json_str)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"处理数据块时出错: {str(e)}")
+                    continue
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content") or ''
+                if choices[0].get("finish_reason"):
+                    self.finish_reason = choices[0]["finish_reason"]
+                    self.ended_cleanly = True
+                metrics.busy += time.time() - started
+                if delta:
+                    if not received_first_token:
+                        received_first_token = True
+                        if self.on_first_token:
+                            self.on_first_token()
+                    metrics.items += 1
+                    _put(self.deltas, delta, metrics)
+        except Exception as e:
+            _put(self.deltas, _Failure(e), metrics)
+        finally:
+            # 提前结束时关闭响应流，释放连接
+            close = getattr(self.lines, 'close', None)
+            if close:
+                close()
+            self.deltas.put(_END)
+
+    def _emit(self, rule_tuple, metrics):
+        if self.max_bullets:
+            rule_tuple = rule_tuple[:3] + (limit_bullets(rule_tuple[3], self.max_bullets),)
+        self.emitted += 1
+        metrics.items += 1
+        _put(self.rules, rule_tuple, metrics)
+
+    def _finish_early(self, reason, metrics):
+        """提前结束：通知读取线程关闭响应流，并立即结束迭代（不等待读取线程）"""
+        self.stopped_early = reason
+        self.stop.set()
+        logger.debug(f"提前结束模型输出: {reason}")
+        _put(self.rules, _END, metrics)
+
+    def _parse(self):
+        metrics = _stage_metrics("parse")
+        scanner = self.scanner
+        while True:
+            item = self.deltas.get()
+            if self.stopped_early:
+                # 丢弃提前结束后读取线程送来的剩余内容，避免其阻塞在队列上
+                if item is _END:
+                    return
+                continue
+            if item is _END or isinstance(item, _Failure):
+                _put(self.rules, item, metrics)
+                if item is _END:
+                    return
+                continue
+            started = time.time()
+            for obj_text in scanner.feed(item):
+                rule = parse_object(obj_text)
+                if rule is None:
+                    logger.warning(f"解析规则时出错: {obj_text[:80]}")
+                    continue
+                rule_tuple = self.validate(rule)
+                if rule_tuple is None:
+                    logger.warning("模型返回的对象缺少必要字段，已跳过")
+                    continue
+                metrics.busy += time.time() - started
+                self._emit(rule_tuple, metrics)
+                started = time.time()
+                if self.max_items and self.emitted >= self.max_items:
+                    self._finish_early("max_items", metrics)
+                    break
+            metrics.busy += time.time() - started
+            if self.stopped_early:
+                continue
+            if scanner.closed:
+                self._finish_early("array_end", metrics)
+            elif self.max_bullets and self.max_items and self.emitted == self.max_items - 1 and scanner.depth > 0 \
+                    and count_partial_bullets(scanner.partial_text()) > self.max_bullets:
+                # 最后一个允许的规则已有足够的条目：恢复该规则（丢弃未完成的最后一条）后结束
+                rule_tuple = salvage_rule(scanner.partial_text())
+                if rule_tuple is not None:
+                    self._emit(rule_tuple, metrics)
+                    self._finish_early("max_bullets", metrics)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self.rules.get()
+                if item is _END:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            # 调用方提前停止迭代时通知读取线程结束
+            self.stop.set()
+
+    def complete_text(self):
+        """截至最后一个完整规则对象的响应文本"""
+        return self.scanner.complete_text()
+
+    def partial_text(self):
+        """响应结束或中断时尚未闭合的规则对象文本"""
+        return self.scanner.partial_text()
+
+    @property
+    def truncated(self):
+        """输出因长度限制被截断，或连接在没有结束标记的情况下关闭且最后一个对象未闭合（主动提前结束的不算）"""
+        if self.stopped_early:
+            return False
+        return self.finish_reason == "length" or (not self.ended_cleanly and bool(self.partial_text()))
+
+    def salvage(self):
+        """从尚未闭合的规则对象中恢复规则，见salvage_rule"""
+        return salvage_rule(self.partial_text())
+
+def render_mdc(name, description, glob_pattern, content):
+    """
+    渲染MDC文件内容
+
+    @return Tuple[str, bytes] - (文件名, 文件内容)
+    """
+    # 确保name以.mdc结尾
+    if not name.endswith('.mdc'):
+        name = f"{name}.mdc"
+
+    mdc_content = f"""---
+name: {name}
+description: {description}
+globs: {glob_pattern}
+---
+
+{content}
+"""
+    return name, mdc_content.encode('utf-8')
+
+def output_dir_lock(output_dir):
+    """
+    获取规则输出目录的跨进程锁，锁文件放在配置目录下，不会出现在规则目录中
+
+    @example with output_dir_lock(output_dir): ...
+    """
+    digest = hashlib.sha256(os.path.abspath(output_dir).encode('utf-8')).hexdigest()[:16]
+    return file_lock(os.path.join(OUTPUT_LOCK_DIR, f"output-{digest}.lock"))
+
+def write_rule_file(output_dir, name, data):
+    """
+    写入渲染好的规则文件并发送file_written事件，先写临时文件再重命名，其他进程不会读到写了一半的文件
+
+    @return str - 写入的文件路径
+    """
+    output_path = os.path.join(output_dir, name)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+
+    logger.info(f"已创建规则文件: {output_path}")
+    emit_event("file_written", path=output_path, name=name, sha256=hashlib.sha256(data).hexdigest(), bytes=len(data))
+    return output_path
+
+class RuleWriter:
+    """
+    后台批量写入规则文件：提交时只渲染内容并入队，写入线程每次取出队列中积压的全部文件一起写入，
+    磁盘或杀毒软件扫描变慢不会阻塞模型响应的读取
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.pending = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.errors = []
+        self.written = []
+        self.metrics = _stage_metrics("write")
+        self.thread = threading.Thread(target=self._run, name="rule-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, name, description, glob_pattern, content):
+        """
+        提交一个规则，写入队列已满时阻塞
+
+        @return str - 规则文件将要写入的路径
+        """
+        filename, data = render_mdc(name, description, glob_pattern, content)
+        _put(self.pending, (filename, data), self.metrics)
+        return os.path.join(self.output_dir, filename)
+
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.time()
+            finished = batch[-1] is _END
+            files = [item for item in batch if item is not _END]
+            if files:
+                # 每批文件在输出目录锁内一起写入，避免与其他进程交错
+                with output_dir_lock(self.output_dir):
+                    for filename, data in files:
+                        try:
+                            self.written.append(write_rule_file(self.output_dir, filename, data))
+                            self.metrics.items += 1
+                        except OSError as e:
+                            logger.error(f"写入规则文件失败: {filename}: {str(e)}")
+                            emit_event("error", stage="write", path=os.path.join(self.output_dir, filename),
+                                       message=str(e), recoverable=True)
+                            self.errors.append((filename, e))
+            self.metrics.busy += time.time() - started
+            if finished:
+                return
+
+    def close(self):
+        """
+        等待队列中的文件全部写入
+
+        @return List[Tuple[str, Exception]] - 写入失败的文件
+        """
+        self.pending.put(_END)
+        self.thread.join()
+        return self.errors
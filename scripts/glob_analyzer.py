@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 规则glob有效性分析：将glob编译为匹配器，基于缓存的工作区路径索引统计匹配数量、规则重叠并给出收窄建议
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+from collections import Counter
+
+# 导入配置管理模块
+try:
+    from config import CONFIG_DIR
+    from rule_merger import split_globs
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import CONFIG_DIR
+    from rule_merger import split_globs
+
+logger = logging.getLogger(__name__)
+
+# 路径索引缓存目录，按工作区路径的哈希区分
+INDEX_CACHE_DIR = os.path.join(CONFIG_DIR, "path_index")
+INDEX_IGNORED_DIRS = {'node_modules', 'venv', 'env', '__pycache__', 'dist', 'build', 'target', 'vendor'}
+
+BROAD_RATIO = 0.5     # 匹配超过该比例的文件视为过于宽泛
+COVERAGE_RATIO = 0.9  # 收窄建议需要覆盖的原匹配文件比例
+MAX_SUGGESTED_DIRS = 3
+
+def expand_braces(pattern):
+    """
+    展开glob中的花括号（支持嵌套）
+
+    @example expand_braces('src/**/*.{ts,tsx}') => ['src/**/*.ts', 'src/**/*.tsx']
+    """
+    depth = 0
+    start = None
+    for i, char in enumerate(pattern):
+        if char == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                options = split_globs(pattern[start + 1:i]) if ',' in pattern[start + 1:i] else [pattern[start + 1:i]]
+                results = []
+                for option in options:
+                    results.extend(expand_braces(pattern[:start] + option + pattern[i + 1:]))
+                return results
+    return [pattern]
+
+def _glob_to_regex(pattern):
+    """将单个（已展开花括号的）glob转换为正则表达式"""
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                regex += f'[{body}]'
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+def compile_glob(glob_pattern):
+    """
+    将glob（可包含逗号分隔的多个模式和花括号）编译为匹配器列表
+
+    每个匹配器包含字面目录前缀和扩展名，用于先从索引中筛选候选路径；
+    形如 prefix/**/*.ext 和 prefix/**/* 的模式无需再执行正则匹配
+
+    @return List[dict] - {"prefix", "ext", "regex", "simple"}
+    """
+    matchers = []
+    for part in split_globs(glob_pattern):
+        for pattern in expand_braces(re.sub(r'^(\./|/)+', '', part)):
+            literal = re.split(r'[*?\[]', pattern, 1)[0]
+            prefix = literal.rsplit('/', 1)[0] + '/' if '/' in literal else ''
+            basename = pattern.rsplit('/', 1)[-1]
+            ext_match = re.fullmatch(r'\*(\.[A-Za-z0-9_+-]+)', basename)
+            ext = ext_match.group(1) if ext_match else None
+            simple = pattern == f"{prefix}**/*{ext_match.group(1) if ext_match else ''}"
+            matchers.append({
+                "prefix": prefix,
+                "ext": ext,
+                "regex": re.compile(_glob_to_regex(pattern)),
+                "simple": simple
+            })
+    return matchers
+
+class PathIndex:
+    """
+    工作区文件路径索引
+
+    按目录缓存文件列表和修改时间，刷新时只重新列出修改时间变化的目录；
+    同时维护按扩展名分组的路径下标，加速glob匹配
+    """
+
+    def __init__(self, workspace_path, cache_dir=INDEX_CACHE_DIR):
+        self.workspace_path = os.path.abspath(workspace_path)
+        digest = hashlib.sha1(self.workspace_path.encode('utf-8')).hexdigest()[:16]
+        self.cache_file = os.path.join(cache_dir, f"{digest}.json")
+        self.dirs = {}
+        self.paths = []
+        self.exts = []
+        self.by_ext = {}
+        self._match_cache = {}
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get("dirs", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump({"workspace": self.workspace_path, "dirs": self.dirs}, f)
+        except OSError as e:
+            logger.debug(f"保存路径索引失败: {str(e)}")
+
+    def refresh(self):
+        """
+        刷新索引：未变化的目录直接复用缓存
+
+        @return PathIndex - 自身，便于链式调用
+        """
+        cached = self._load_cache()
+        dirs = {}
+        rescanned = 0
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            abs_dir = os.path.join(self.workspace_path, rel_dir) if rel_dir else self.workspace_path
+            try:
+                mtime = os.stat(abs_dir).st_mtime_ns
+            except OSError:
+                continue
+
+            entry = cached.get(rel_dir)
+            if not entry or entry.get("mtime") != mtime:
+                files, subdirs = [], []
+                try:
+                    with os.scandir(abs_dir) as it:
+                        for item in it:
+                            if item.is_dir(follow_symlinks=False):
+                                if not item.name.startswith('.') and item.name not in INDEX_IGNORED_DIRS:
+                                    subdirs.append(item.name)
+                            elif item.is_file():
+                                files.append(item.name)
+                except OSError:
+                    continue
+                entry = {"mtime": mtime, "files": files, "dirs": subdirs}
+                rescanned += 1
+
+            dirs[rel_dir] = entry
+            for name in entry["dirs"]:
+                stack.append(f"{rel_dir}/{name}" if rel_dir else name)
+
+        self.dirs = dirs
+        self.paths = []
+        self.exts = []
+        self.by_ext = {}
+        self._match_cache = {}
+        for rel_dir in sorted(dirs):
+            base = f"{rel_dir}/" if rel_dir else ''
+            for name in dirs[rel_dir]["files"]:
+                dot = name.rfind('.')
+                ext = name[dot:] if dot > 0 else ''
+                self.by_ext.setdefault(ext, []).append(len(self.paths))
+                self.exts.append(ext)
+                self.paths.append(base + name)
+
+        if rescanned:
+            self._save_cache()
+        logger.debug(f"路径索引: {len(self.paths)}个文件, 重新扫描{rescanned}个目录")
+        return self
+
+    def match(self, glob_pattern):
+        """
+        返回glob匹配的路径下标集合（相同glob只计算一次）
+        """
+        if glob_pattern in self._match_cache:
+            return self._match_cache[glob_pattern]
+
+        paths = self.paths
+        matched = set()
+        for matcher in compile_glob(glob_pattern):
+            candidates = self.by_ext.get(matcher["ext"], []) if matcher["ext"] else range(len(paths))
+            prefix = matcher["prefix"]
+            if matcher["simple"] and not prefix:
+                matched.update(candidates)
+            elif matcher["simple"]:
+                matched.update(i for i in candidates if paths[i].startswith(prefix))
+            else:
+                fullmatch = matcher["regex"].fullmatch
+                matched.update(i for i in candidates if paths[i].startswith(prefix) and fullmatch(paths[i]))
+
+        self._match_cache[glob_pattern] = matched
+        return matched
+
+    def bitmap(self, matched):
+        """将路径下标集合转换为位图（整数），用于快速计算规则间的重叠"""
+        bits = bytearray((len(self.paths) + 7) // 8)
+        for i in matched:
+            bits[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(bits, 'little')
+
+def parse_mdc_front_matter(path):
+    """
+    读取.mdc文件的front matter（name、description、globs）
+    """
+    meta = {}
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        if f.readline().strip() != '---':
+            return meta
+        for line in f:
+            if line.strip() == '---':
+                break
+            if ':' in line:
+                key, value = line.split(':', 1)
+                meta[key.strip()] = value.strip().strip('"\'')
+    return meta
+
+def suggest_narrower_glob(index, matched):
+    """
+    根据实际匹配文件的顶层目录和扩展名分布给出更窄的glob，覆盖不足或没有收窄效果时返回None
+    """
+    if not matched:
+        return None
+    paths = index.paths
+    top_dirs = Counter(paths[i][:paths[i].find('/')] if '/' in paths[i] else '' for i in matched)
+    exts = Counter(map(index.exts.__getitem__, matched))
+
+    def covering(counter):
+        chosen, covered = [], 0
+        for key, count in counter.most_common():
+            chosen.append(key)
+            covered += count
+            if covered >= len(matched) * COVERAGE_RATIO:
+                break
+        return chosen
+
+    dirs = covering(top_dirs)
+    ext_list = [e.lstrip('.') for e in covering(exts) if e]
+    if len(dirs) > MAX_SUGGESTED_DIRS or '' in dirs or not ext_list:
+        dirs = ['']
+    ext_part = f"*.{ext_list[0]}" if len(ext_list) == 1 else "*.{" + ','.join(sorted(ext_list)) + "}"
+    suggestion = ','.join(f"{d}/**/{ext_part}" if d else f"**/{ext_part}" for d in sorted(dirs))
+
+    if len(index.match(suggestion)) >= len(matched):
+        return None
+    return suggestion
+
+def analyze_rules_globs(workspace_path, rules_dir):
+    """
+    分析规则目录中每个.mdc文件的glob效果
+
+    @return dict - {"total_files", "rules": [...], "overlaps": [...]}
+    """
+    index = PathIndex(workspace_path).refresh()
+    total = len(index.paths)
+    report = {"total_files": total, "rules": [], "overlaps": []}
+    matched_sets = {}
+
+    if not os.path.isdir(rules_dir):
+        return report
+
+    for file_name in sorted(os.listdir(rules_dir)):
+        if not file_name.endswith('.mdc'):
+            continue
+        meta = parse_mdc_front_matter(os.path.join(rules_dir, file_name))
+        globs = meta.get('globs', '')
+        matched = index.match(globs) if globs else set()
+        matched_sets[file_name] = matched
+
+        item = {"file": file_name, "globs": globs, "matches": len(matched), "suggestion": None, "issue": None}
+        if not matched:
+            item["issue"] = "no_match"
+        elif total and len(matched) / total > BROAD_RATIO:
+            item["issue"] = "too_broad"
+            item["suggestion"] = suggest_narrower_glob(index, matched)
+        report["rules"].append(item)
+
+    # 使用位图计算两两重叠，相同glob的位图只构建一次
+    bitmaps = {}
+    for name, matched in matched_sets.items():
+        key = id(matched)
+        if key not in bitmaps:
+            bitmaps[key] = index.bitmap(matched)
+    names = list(matched_sets)
+    for i, name_a in enumerate(names):
+        bitmap_a = bitmaps[id(matched_sets[name_a])]
+        for name_b in names[i + 1:]:
+            shared = bin(bitmap_a & bitmaps[id(matched_sets[name_b])]).count('1')
+            if shared:
+                report["overlaps"].append({"rules": [name_a, name_b], "shared": shared})
+    report["overlaps"].sort(key=lambda o: o["shared"], reverse=True)
+    return report
+
+def print_glob_report(report):
+    """
+    打印glob分析报告
+    """
+    total = report["total_files"]
+    print(f"\n工作区文件总数: {total}")
+    print("-" * 80)
+    print(f"{'规则文件':<40}{'匹配数':>8}{'占比':>8}  问题")
+    print("-" * 80)
+    for item in report["rules"]:
+        ratio = f"{item['matches'] / total:.0%}" if total else '-'
+        issue = {"no_match": "未匹配任何文件", "too_broad": "匹配范围过宽"}.get(item["issue"], '')
+        print(f"{item['file'][:38]:<40}{item['matches']:>8}{ratio:>8}  {issue}")
+        print(f"    globs: {item['globs']}")
+        if item["suggestion"]:
+            print(f"    建议: {item['suggestion']}")
+    print("-" * 80)
+    if report["overlaps"]:
+        print("规则重叠（共同匹配的文件数）:")
+        for overlap in report["overlaps"][:20]:
+            print(f"  {overlap['rules'][0]} <-> {overlap['rules'][1]}: {overlap['shared']}")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 源码导入语句采样：按语言分层抽取少量源文件，只读取文件开头部分，统计实际引用的第三方库
+"""
+
+import os
+import re
+import mmap
+import time
+import random
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+RESERVOIR_SIZE = 200       # 每种语言在遍历时保留的候选文件数（蓄水池抽样）
+FILES_PER_LANGUAGE = 40    # 每种语言最终读取的文件数
+HEAD_BYTES = 4096          # 每个文件最多读取的字节数
+TOTAL_BYTES_BUDGET = 512 * 1024  # 所有文件合计最多读取的字节数
+TIME_BUDGET = 1.0          # 读取和解析的时间预算（秒）
+SAMPLER_WORKERS = 8
+TOP_LIBRARIES = 15         # 写入项目信息的库数量
+
+# 扩展名到语言的映射
+LANGUAGE_EXTENSIONS = {
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'javascript', '.tsx': 'javascript', '.vue': 'javascript', '.svelte': 'javascript',
+    '.py': 'python',
+    '.go': 'go',
+    '.rs': 'rust',
+    '.java': 'java', '.kt': 'java'
+}
+
+_IMPORT_PATTERNS = {
+    'javascript': [
+        re.compile(rb'''(?:^|[;\s])import\s+(?:[\w*{}\s,$]+\s+from\s+)?['"]([^'"]+)['"]'''),
+        re.compile(rb'''(?:require|import)\s*\(\s*['"]([^'"]+)['"]\s*\)'''),
+        re.compile(rb'''^\s*export\s+[\w*{}\s,$]+\s+from\s+['"]([^'"]+)['"]''', re.M),
+    ],
+    'python': [
+        re.compile(rb'^\s*import\s+([\w.]+(?:\s*,\s*[\w.]+)*)', re.M),
+        re.compile(rb'^\s*from\s+([\w.]+)\s+import\s', re.M),
+    ],
+    'go': [
+        re.compile(rb'^\s*import\s+(?:\w+\s+)?"([^"]+)"', re.M),
+        re.compile(rb'^\s*(?:\w+\s+|_\s+|\.\s+)?"([^"]+)"\s*$', re.M),
+    ],
+    'rust': [
+        re.compile(rb'^\s*(?:pub\s+)?use\s+(\w+)::', re.M),
+        re.compile(rb'^\s*extern\s+crate\s+(\w+)', re.M),
+    ],
+    'java': [
+        re.compile(rb'^\s*import\s+(?:static\s+)?([\w.]+)', re.M),
+    ],
+}
+
+_PYTHON_STDLIB = {
+    'os', 'sys', 're', 'json', 'time', 'typing', 'logging', 'pathlib', 'collections', 'itertools',
+    'functools', 'datetime', 'subprocess', 'asyncio', 'unittest', 'dataclasses', 'abc', 'math',
+    'random', 'io', 'shutil', 'argparse', 'threading', 'enum', 'copy', 'hashlib', 'uuid', 'glob',
+    'tempfile', 'contextlib', 'traceback', 'urllib', 'http', 'socket', 'csv', 'pickle', 'string'
+}
+_RUST_BUILTIN = {'std', 'core', 'alloc', 'crate', 'self', 'super'}
+
+def _normalize_module(language, module):
+    """
+    将导入路径归一化为库名，相对导入和标准库返回None
+    """
+    if language == 'javascript':
+        if module.startswith(('.', '/', '~', 'node:', '@/')):
+            return None
+        parts = module.split('/')
+        return '/'.join(parts[:2]) if module.startswith('@') else parts[0]
+    if language == 'python':
+        if module.startswith('.'):
+            return None
+        name = module.split('.')[0]
+        return None if name in _PYTHON_STDLIB else name
+    if language == 'go':
+        parts = module.split('/')
+        if '.' not in parts[0]:
+            return None  # 标准库
+        return '/'.join(parts[:3])
+    if language == 'rust':
+        return None if module in _RUST_BUILTIN else module
+    if language == 'java':
+        if module.startswith(('java.', 'javax.')):
+            return None
+        return '.'.join(module.split('.')[:3])
+    return module
+
+def extract_imports(language, head):
+    """
+    从文件开头的字节内容中提取导入的库名集合
+    """
+    libraries = set()
+    for pattern in _IMPORT_PATTERNS.get(language, []):
+        for match in pattern.findall(head):
+            for module in match.decode('utf-8', errors='ignore').split(','):
+                name = _normalize_module(language, module.strip())
+                if name:
+                    libraries.add(name)
+    return libraries
+
+def _read_head(path, limit):
+    """使用内存映射读取文件开头，空文件或读取失败返回空字节串"""
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return b''
+            with mmap.mmap(f.fileno(), min(size, limit), access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+    except (OSError, ValueError):
+        return b''
+
+class SourceSampler:
+    """
+    在遍历项目文件时收集候选源文件，遍历结束后按语言分层抽样并统计导入的库
+
+    候选文件使用蓄水池抽样，内存占用与项目大小无关
+    """
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.reservoirs = {}
+        self.seen = Counter()
+
+    def offer(self, path, ext):
+        """提供一个文件作为候选，非源码文件直接忽略"""
+        language = LANGUAGE_EXTENSIONS.get(ext)
+        if not language:
+            return
+        self.seen[language] += 1
+        reservoir = self.reservoirs.setdefault(language, [])
+        if len(reservoir) < RESERVOIR_SIZE:
+            reservoir.append(path)
+        else:
+            index = self.rng.randrange(self.seen[language])
+            if index < RESERVOIR_SIZE:
+                reservoir[index] = path
+
+    def _stratified(self, paths, limit):
+        """按所在目录轮流挑选文件，避免样本集中在少数目录"""
+        by_dir = {}
+        for path in sorted(paths):
+            by_dir.setdefault(os.path.dirname(path), []).append(path)
+        groups = list(by_dir.values())
+        self.rng.shuffle(groups)
+        chosen = []
+        while groups and len(chosen) < limit:
+            for group in list(groups):
+                chosen.append(group.pop(self.rng.randrange(len(group))))
+                if not group:
+                    groups.remove(group)
+                if len(chosen) >= limit:
+                    break
+        return chosen
+
+    def collect(self, head_bytes=HEAD_BYTES, byte_budget=TOTAL_BYTES_BUDGET, time_budget=TIME_BUDGET):
+        """
+        读取样本文件并统计导入频率，超出字节或时间预算时提前结束
+
+        @return List[dict] - [{"name": 库名, "language": 语言, "files": 引用该库的样本文件数}]，按文件数降序
+        """
+        # 各语言的样本交替排列，字节预算不足时每种语言都能分到样本
+        samples = {language: self._stratified(paths, FILES_PER_LANGUAGE) for language, paths in self.reservoirs.items()}
+        tasks = []
+        for i in range(FILES_PER_LANGUAGE):
+            tasks.extend((language, paths[i]) for language, paths in sorted(samples.items()) if i < len(paths))
+        if not tasks:
+            return []
+
+        # 按预算限制读取的文件数量，每个文件最多读取head_bytes
+        tasks = tasks[:max(1, byte_budget // head_bytes)]
+        deadline = time.time() + time_budget
+        counts = Counter()
+
+        executor = ThreadPoolExecutor(max_workers=SAMPLER_WORKERS)
+        pending = set()
+        try:
+            futures = {executor.submit(_read_head, path, head_bytes): language for language, path in tasks}
+            pending = set(futures)
+            while pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.debug(f"导入采样超出时间预算，跳过{len(pending)}个文件")
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    language = futures[future]
+                    for name in extract_imports(language, future.result()):
+                        counts[(language, name)] += 1
+        finally:
+            # 取消尚未开始的读取，不等待正在进行的读取
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        return [
+            {"name": name, "language": language, "files": files}
+            for (language, name), files in counts.most_common(TOP_LIBRARIES)
+        ]
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 可恢复的批量任务队列：任务状态和已生成的规则保存在SQLite中，进程崩溃或中断后从检查点继续
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# 导入配置管理模块
+try:
+    from config import CONFIG_DIR
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import CONFIG_DIR
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.path.join(CONFIG_DIR, "jobs.db")
+DB_TIMEOUT = 30            # 其他进程持有写锁时的最长等待时间（秒）
+RETRY_BACKOFF = 30         # 失败任务重新排队前的等待时间基数（秒），按尝试次数线性增加
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_STATES = (JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    workspace TEXT NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (name, workspace)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batches(id),
+    rule_id TEXT NOT NULL,
+    package TEXT NOT NULL,
+    rule_json TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner INTEGER,
+    not_before REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (batch_id, rule_id, package)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (batch_id, status);
+CREATE TABLE IF NOT EXISTS results (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    seq INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    globs TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+def _pid_alive(pid):
+    """判断进程是否仍在运行（Windows上无法可靠判断时视为仍在运行）"""
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+class JobQueue:
+    """
+    SQLite中的批量任务队列：每个批次对应一个工作区，批次中每条源规则、每个子包一个任务
+
+    - 领取任务使用写事务，多个进程或线程同时处理同一批次时不会重复领取
+    - 每生成一条规则立即写入检查点，中断后只需生成剩余部分
+    - 失败的任务按退避时间重新排队，达到最大尝试次数后标记为失败
+    - 恢复批次时，所属进程已退出的运行中任务重新排队
+
+    @param db_path - 数据库文件路径
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, timeout=DB_TIMEOUT, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+
+    def _write(self, sql, params=()):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self.db.execute(sql, params)
+                self.db.execute("COMMIT")
+                return cursor
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def open_batch(self, name, workspace, jobs):
+        """
+        创建批次或打开已有批次并补充新任务（已有任务的状态和检查点保持不变）
+
+        @param jobs - [(rule_id, package, rule_data)]
+        @return Tuple[int, int] - (批次id, 新增的任务数)
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute("INSERT OR IGNORE INTO batches (name, workspace, created) VALUES (?, ?, ?)",
+                                (name, workspace, now))
+                batch_id = self.db.execute("SELECT id FROM batches WHERE name = ? AND workspace = ?",
+                                           (name, workspace)).fetchone()[0]
+                before = self.db.total_changes
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO jobs (batch_id, rule_id, package, rule_json, status, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(batch_id, rule_id, package, json.dumps(rule_data, ensure_ascii=False), JOB_PENDING, now)
+                     for rule_id, package, rule_data in jobs])
+                added = self.db.total_changes - before
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return batch_id, added
+
+    def find_batch(self, name, workspace):
+        """
+        @return int | None - 批次id
+        """
+        rows = self._query("SELECT id FROM batches WHERE name = ? AND workspace = ?", (name, workspace))
+        return rows[0][0] if rows else None
+
+    def recover(self, batch_id):
+        """
+        把所属进程已退出的运行中任务重新排队（保留其检查点）
+
+        @return int - 重新排队的任务数
+        """
+        rows = self._query("SELECT id, owner FROM jobs WHERE batch_id = ? AND status = ?", (batch_id, JOB_RUNNING))
+        stale = [job_id for job_id, owner in rows if not _pid_alive(owner)]
+        for job_id in stale:
+            self._write("UPDATE jobs SET status = ?, owner = NULL, updated = ? WHERE id = ? AND status = ?",
+                        (JOB_PENDING, time.time(), job_id, JOB_RUNNING))
+        return len(stale)
+
+    def retry_failed(self, batch_id):
+        """
+        把失败的任务重新排队并清零尝试次数
+
+        @return int - 重新排队的任务数
+        """
+        return self._write("UPDATE jobs SET status = ?, attempts = 0, not_before = 0, updated = ? "
+                           "WHERE batch_id = ? AND status = ?",
+                           (JOB_PENDING, time.time(), batch_id, JOB_FAILED)).rowcount
+
+    def claim(self, batch_id):
+        """
+        领取一个可执行的任务
+
+        @return dict | None - {"id", "rule_id", "package", "rule", "attempts", "checkpoint": 已生成的规则元组列表}，
+                没有可执行的任务时返回None
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT id, rule_id, package, rule_json, attempts FROM jobs "
+                    "WHERE batch_id = ? AND status = ? AND not_before <= ? ORDER BY id LIMIT 1",
+                    (batch_id, JOB_PENDING, now)).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1, updated = ? "
+                                    "WHERE id = ?", (JOB_RUNNING, os.getpid(), now, row[0]))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, rule_id, package, rule_json, attempts = row
+        return {"id": job_id, "rule_id": rule_id, "package": package, "rule": json.loads(rule_json),
+                "attempts": attempts + 1, "checkpoint": self.results(job_id)}
+
+    def next_wakeup(self, batch_id):
+        """
+        @return float | None - 最早的等待重试任务可以执行的时间，没有等待中的任务时返回None
+        """
+        rows = self._query("SELECT MIN(not_before) FROM jobs WHERE batch_id = ? AND status = ?", (batch_id, JOB_PENDING))
+        return rows[0][0] if rows else None
+
+    def checkpoint(self, job_id, rule_tuple):
+        """
+        保存任务生成的一条规则，已保存的同名规则不重复保存
+
+        @return bool - 是否新保存
+        """
+        name, description, globs, content = rule_tuple
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                exists = self.db.execute("SELECT 1 FROM results WHERE job_id = ? AND name = ?", (job_id, name)).fetchone()
+                if not exists:
+                    self.db.execute(
+                        "INSERT INTO results (job_id, seq, name, description, globs, content) "
+                        "VALUES (?, (SELECT COUNT(*) FROM results WHERE job_id = ?), ?, ?, ?, ?)",
+                        (job_id, job_id, name, description, globs, content))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return not exists
+
+    def complete(self, job_id):
+        self._write("UPDATE jobs SET status = ?, owner = NULL, last_error = NULL, updated = ? WHERE id = ?",
+                    (JOB_DONE, time.time(), job_id))
+
+    def fail(self, job_id, error, max_attempts):
+        """
+        记录任务失败：未达到最大尝试次数时按退避时间重新排队，否则标记为失败
+
+        @return bool - 是否会重试
+        """
+        rows = self._query("SELECT attempts FROM jobs WHERE id = ?", (job_id,))
+        attempts = rows[0][0] if rows else max_attempts
+        retry = attempts < max_attempts
+        now = time.time()
+        self._write("UPDATE jobs SET status = ?, owner = NULL, last_error = ?, not_before = ?, updated = ? WHERE id = ?",
+                    (JOB_PENDING if retry else JOB_FAILED, str(error)[:2000],
+                     now + RETRY_BACKOFF * attempts if retry else 0, now, job_id))
+        return retry
+
+    def release(self, job_id):
+        """中断时把任务放回队列，不计入尝试次数，检查点保留"""
+        self._write("UPDATE jobs SET status = ?, owner = NULL, attempts = MAX(attempts - 1, 0), updated = ? "
+                    "WHERE id = ? AND status = ?", (JOB_PENDING, time.time(), job_id, JOB_RUNNING))
+
+    def results(self, job_id):
+        """
+        @return List[Tuple[str, str, str, str]] - 任务已生成的规则，按生成顺序
+        """
+        return [tuple(row) for row in self._query(
+            "SELECT name, description, globs, content FROM results WHERE job_id = ? ORDER BY seq", (job_id,))]
+
+    def batch_results(self, batch_id):
+        """
+        @return List[Tuple[str, Tuple[str, str, str, str]]] - 批次中已完成任务生成的规则 (子包路径, 规则元组)，按任务和生成顺序
+        """
+        rows = self._query("SELECT jobs.package, results.name, results.description, results.globs, results.content "
+                           "FROM results JOIN jobs ON jobs.id = results.job_id "
+                           "WHERE jobs.batch_id = ? AND jobs.status = ? ORDER BY jobs.id, results.seq",
+                           (batch_id, JOB_DONE))
+        return [(row[0], tuple(row[1:])) for row in rows]
+
+    def jobs(self, batch_id, status=None):
+        """
+        @return List[dict] - 批次中的任务（不含规则内容）
+        """
+        sql = "SELECT id, rule_id, package, status, attempts, last_error FROM jobs WHERE batch_id = ?"
+        params = [batch_id]
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        return [dict(zip(("id", "rule_id", "package", "status", "attempts", "last_error"), row))
+                for row in self._query(sql + " ORDER BY id", params)]
+
+    def progress(self, batch_id):
+        """
+        @return dict - {状态: 任务数, "total": 任务总数, "rules": 已生成的规则数}
+        """
+        counts = dict.fromkeys(JOB_STATES, 0)
+        for status, count in self._query("SELECT status, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY status",
+                                         (batch_id,)):
+            counts[status] = count
+        counts["total"] = sum(counts[state] for state in JOB_STATES)
+        counts["rules"] = self._query("SELECT COUNT(*) FROM results JOIN jobs ON jobs.id = results.job_id "
+                                      "WHERE jobs.batch_id = ?", (batch_id,))[0][0]
+        return counts
+
+    def close(self):
+        with self.lock:
+            self.db.close()
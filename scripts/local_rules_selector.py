@@ -10,20 +10,58 @@ import sys
 import json
 import logging
 import argparse
-import requests
+import signal
+import threading
 import glob
 from pathlib import Path
 import time
 from urllib.parse import urlparse
 import re
+from concurrent.futures import ThreadPoolExecutor
 
 # 导入配置管理模块
 try:
-    from config import get_model_config, save_config
+    from config import get_model_config, save_config, get_profile_config, select_profile, load_config, on_config_change, watch_config
+    from model_client import stream_chat_completion, ModelRequestError, ModelDeadlineExceeded
+    from model_client import get_endpoints, endpoint_key, get_endpoint_stats, HEDGE_DEFAULT_DELAY
+    from token_estimator import count_tokens, count_message_tokens
+    from rate_limiter import get_scheduler, PRIORITIES, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    from rule_merger import cluster_rules, merge_cluster, merge_rule_contents, split_globs
+    from glob_analyzer import analyze_rules_globs, print_glob_report
+    from rule_query import RuleIndex, normalize_term
+    from progress_events import enable_events, emit_event, EVENT_FORMATS
+    from import_sampler import SourceSampler
+    from tree_sampler import TreeSampler
+    from generation_pipeline import StreamPipeline, RuleWriter, render_mdc, write_rule_file, get_pipeline_metrics, output_dir_lock
+    from response_cache import ResponseCache, cache_key, single_flight, VERSIONS_DIR
+    from rule_patch import source_diff, diff_worth_patching, validate_patch_op, apply_rule_patch
+    from project_watcher import ProjectWatcher
+    from rule_ingest import ingest_mdc_files
+    from job_queue import JobQueue
+    from catalog_query import CatalogQuery, CatalogService, DEFAULT_FIELDS, DEFAULT_PAGE_SIZE
+    from rule_store import load_catalog, hydrate_rules, resolve_catalog, is_store, build_store_from_files, DEFAULT_STORE, USER_OVERLAY
 except ImportError:
     # 如果无法直接导入，尝试从scripts目录导入
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from config import get_model_config, save_config
+    from config import get_model_config, save_config, get_profile_config, select_profile, load_config, on_config_change, watch_config
+    from model_client import stream_chat_completion, ModelRequestError, ModelDeadlineExceeded
+    from model_client import get_endpoints, endpoint_key, get_endpoint_stats, HEDGE_DEFAULT_DELAY
+    from token_estimator import count_tokens, count_message_tokens
+    from rate_limiter import get_scheduler, PRIORITIES, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    from rule_merger import cluster_rules, merge_cluster, merge_rule_contents, split_globs
+    from glob_analyzer import analyze_rules_globs, print_glob_report
+    from rule_query import RuleIndex, normalize_term
+    from progress_events import enable_events, emit_event, EVENT_FORMATS
+    from import_sampler import SourceSampler
+    from tree_sampler import TreeSampler
+    from generation_pipeline import StreamPipeline, RuleWriter, render_mdc, write_rule_file, get_pipeline_metrics, output_dir_lock
+    from response_cache import ResponseCache, cache_key, single_flight, VERSIONS_DIR
+    from rule_patch import source_diff, diff_worth_patching, validate_patch_op, apply_rule_patch
+    from project_watcher import ProjectWatcher
+    from rule_ingest import ingest_mdc_files
+    from job_queue import JobQueue
+    from catalog_query import CatalogQuery, CatalogService, DEFAULT_FIELDS, DEFAULT_PAGE_SIZE
+    from rule_store import load_catalog, hydrate_rules, resolve_catalog, is_store, build_store_from_files, DEFAULT_STORE, USER_OVERLAY
 
 # 设置控制台编码，避免乱码
 if sys.platform == 'win32':
@@ -60,13 +98,59 @@ logger = logging.getLogger(__name__)
 MODEL_TIMEOUT = 60  # API调用超时时间（秒）
 MAX_RETRIES = 2     # 最大重试次数
 
-def load_rules_from_json(json_path):
+# 子包边界识别所用的清单文件
+PACKAGE_MANIFESTS = [
+    'package.json', 'pyproject.toml', 'setup.py', 'requirements.txt',
+    'go.mod', 'Cargo.toml', 'pom.xml', 'build.gradle', 'composer.json', 'Gemfile'
+]
+PACKAGE_SCAN_DEPTH = 4  # 子包检测的最大目录深度
+IGNORED_DIRS = ['node_modules', 'venv', 'env', '__pycache__', 'dist', 'build', 'target', 'vendor']
+
+# 超长规则分块处理设置
+CHUNK_MAX_CHARS = 6000  # 单个分块的最大字符数
+CHUNK_WORKERS = 4       # 并发定制分块的最大线程数
+
+# 输出长度估计与续写设置
+TOKENS_PER_RULE = 220         # 每条生成规则（4-6个条目）的平均输出token数
+OUTPUT_TOKENS_MARGIN = 1.3    # 输出估计的余量系数
+MIN_OUTPUT_TOKENS = 512       # 单次请求的最小max_tokens
+MAX_OUTPUT_TOKENS = 4096      # 未配置max_tokens时的输出上限
+MAX_EXPECTED_RULES = 12       # 预计规则数上限
+MAX_CONTINUATIONS = 3         # 输出被截断时最多续写的次数
+MAX_PROMPT_DEPENDENCIES = 40  # 提示词中列出的声明依赖数量上限
+ERROR_RULE_NAME = "error-rule.mdc"  # 生成出错时产出的占位规则名称
+# 提前结束模型输出的原因，见StreamPipeline
+STOP_REASONS = {"array_end": "JSON数组已结束", "max_items": "达到规则数上限", "max_bullets": "达到条目数上限"}
+
+# 执行计划（--plan）的耗时预估参数
+PLAN_OUTPUT_TOKENS_PER_SECOND = 40  # 模型输出速度（token/秒）
+
+# 项目文件统计方式：auto（文件数超过上限时改为近似统计）、exact（完整遍历）、approximate（随机探测目录估计）
+SCAN_MODES = ['auto', 'exact', 'approximate']
+EXACT_SCAN_FILE_LIMIT = 100000  # auto模式下完整遍历的文件数上限，超过后改为近似统计
+_scan_mode = 'auto'
+
+# 预生成（--prefetch）的规则推荐参数
+PREFETCH_WEIGHTS = {"framework": 3, "library": 2, "language": 2, "dependency": 1}  # 各类项目特征命中规则标签时的权重
+# 项目特征名称与规则标签的对应关系
+PREFETCH_TERM_ALIASES = {
+    'next': 'nextjs', 'nuxtjs': 'nuxt', 'tailwindcss': 'tailwind', 'sveltejs': 'sveltekit',
+    'react-dom': 'react', 'vue-router': 'vue', 'supabase-js': 'supabase', 'pixijs': 'pixi.js'
+}
+PREFETCH_EXTENSION_TERMS = {
+    '.ts': 'typescript', '.tsx': 'typescript', '.js': 'javascript', '.jsx': 'javascript', '.py': 'python',
+    '.go': 'go', '.rs': 'rust', '.vue': 'vue', '.svelte': 'svelte', '.sol': 'solidity'
+}
+PARENT_CHECK_INTERVAL = 2.0  # 后台任务检查父进程是否退出的间隔（秒）
+
+def load_rules_from_json(json_path, with_content=True):
     """
-    从JSON文件加载规则数据
+    从规则库（叠加覆盖层）或JSON文件加载规则数据
+    
+    @param with_content - 为False时规则库中的规则不解压正文，使用前需调用hydrate_rules
     """
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            rules = json.load(f)
+        rules = load_catalog(json_path, with_content)
         
         # 预处理规则，确保格式一致
         processed_rules = []
@@ -89,8 +173,8 @@ def load_rules_from_json(json_path):
                 if 'globs' not in rule:
                     rule['globs'] = '**/*.{js,ts,jsx,tsx}'
                 
-                # 确保有content字段
-                if 'content' not in rule:
+                # 确保有content字段（延迟加载的规则在hydrate_rules时解压）
+                if 'content' not in rule and not rule.get('content_id'):
                     rule['content'] = '- 无规则内容'
                 
                 processed_rules.append(rule)
@@ -167,22 +251,50 @@ def select_rules(rules, max_rules):
     
     return selected_rules
 
-def get_project_info(workspace_path):
+def set_scan_mode(mode):
+    """
+    设置项目文件统计方式，见SCAN_MODES
+    """
+    global _scan_mode
+    if mode not in SCAN_MODES:
+        raise ValueError(f"不支持的统计方式: {mode}")
+    _scan_mode = mode
+
+def get_project_info(workspace_path, exclude_dirs=None, scan_mode=None):
     """
     分析项目结构，获取项目信息
+    
+    超大的目录树使用近似统计：随机探测目录估计各扩展名的文件数和文件总数，
+    此时project_info中estimated为True，并带有95%置信区间（total_files_ci和各文件类型的ci）
+    
+    @param workspace_path - 项目（或子包）根目录
+    @param exclude_dirs - 需要跳过的目录绝对路径（例如嵌套的子包）
+    @param scan_mode - 文件统计方式，为空时使用set_scan_mode设置的方式
     """
     project_info = {
         "file_types": [],
         "framework_hints": [],
         "total_files": 0,
-        "directory_structure": []
+        "directory_structure": [],
+        "library_usage": [],
+        "dependencies": []
     }
+    exclude_dirs = set(os.path.normpath(d) for d in (exclude_dirs or []))
+    
+    scan_mode = scan_mode or _scan_mode
+    
+    # 忽略隐藏目录、node_modules以及嵌套子包
+    def skip_dir(name, path):
+        return name.startswith('.') or name == 'node_modules' or os.path.normpath(path) in exclude_dirs
     
-    # 检测文件类型和数量
+    # 检测文件类型和数量，同时收集用于导入语句采样的候选源文件
     file_types = {}
-    for root, dirs, files in os.walk(workspace_path):
-        # 忽略隐藏目录和node_modules
-        dirs[:] = [d for d in dirs if not d.startswith('.') and d != 'node_modules']
+    sampler = SourceSampler()
+    approximate = scan_mode == 'approximate'
+    file_limit = EXACT_SCAN_FILE_LIMIT if scan_mode == 'auto' else None
+    walk = os.walk(workspace_path) if not approximate else []
+    for root, dirs, files in walk:
+        dirs[:] = [d for d in dirs if not skip_dir(d, os.path.join(root, d))]
         
         for file in files:
             ext = os.path.splitext(file)[1].lower()
@@ -192,10 +304,34 @@ def get_project_info(workspace_path):
                 else:
                     file_types[ext] = 1
                 project_info["total_files"] += 1
+                sampler.offer(os.path.join(root, file), ext)
+        
+        if file_limit and project_info["total_files"] > file_limit:
+            logger.info(f"文件数超过{file_limit}，改为近似统计: {workspace_path}")
+            approximate = True
+            break
+    
+    # 近似统计：在固定预算内随机探测目录，耗时与项目规模无关
+    if approximate:
+        sampler = SourceSampler()
+        estimate = TreeSampler(workspace_path, skip_dir, sampler.offer).estimate()
+        file_types = estimate["file_types"]
+        project_info["total_files"] = estimate["total_files"]
+        project_info["estimated"] = True
+        project_info["total_files_ci"] = estimate["total_files_ci"]
+    
+    # 统计源码中实际导入的库
+    try:
+        project_info["library_usage"] = sampler.collect()
+    except Exception as e:
+        logger.debug(f"导入语句采样失败: {str(e)}")
     
     # 选择最常见的5种文件类型
     sorted_types = sorted(file_types.items(), key=lambda x: x[1], reverse=True)
     project_info["file_types"] = [{"extension": ext, "count": count} for ext, count in sorted_types[:5]]
+    if approximate:
+        for item in project_info["file_types"]:
+            item["ci"] = estimate["file_types_ci"][item["extension"]]
     
     # 检测可能的框架
     framework_hints = []
@@ -206,6 +342,7 @@ def get_project_info(workspace_path):
             with open(os.path.join(workspace_path, 'package.json'), 'r', encoding='utf-8') as f:
                 pkg_data = json.load(f)
                 deps = {**pkg_data.get('dependencies', {}), **pkg_data.get('devDependencies', {})}
+                project_info["dependencies"].extend(deps)
                 
                 if 'react' in deps:
                     framework_hints.append("React")
@@ -225,6 +362,10 @@ def get_project_info(workspace_path):
         try:
             with open(os.path.join(workspace_path, 'requirements.txt'), 'r', encoding='utf-8') as f:
                 content = f.read()
+                for line in content.splitlines():
+                    match = re.match(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)', line)
+                    if match:
+                        project_info["dependencies"].append(match.group(1).lower())
                 if 'django' in content.lower():
                     framework_hints.append("Django")
                 if 'flask' in content.lower():
@@ -234,18 +375,115 @@ def get_project_info(workspace_path):
         except:
             pass
     
+    # 检测pyproject.toml中声明的Python框架
+    if os.path.exists(os.path.join(workspace_path, 'pyproject.toml')):
+        try:
+            with open(os.path.join(workspace_path, 'pyproject.toml'), 'r', encoding='utf-8') as f:
+                content = f.read().lower()
+                for key, hint in (('django', "Django"), ('flask', "Flask"), ('fastapi', "FastAPI")):
+                    if key in content and hint not in framework_hints:
+                        framework_hints.append(hint)
+        except:
+            pass
+    
+    # 检测其他语言的项目清单
+    if os.path.exists(os.path.join(workspace_path, 'go.mod')):
+        framework_hints.append("Go")
+    if os.path.exists(os.path.join(workspace_path, 'Cargo.toml')):
+        framework_hints.append("Rust")
+    
     project_info["framework_hints"] = framework_hints
+    project_info["dependencies"] = sorted(set(project_info["dependencies"]))
     
     # 获取目录结构
     base_dirs = [d for d in os.listdir(workspace_path) 
                 if os.path.isdir(os.path.join(workspace_path, d)) 
                 and not d.startswith('.') 
-                and d not in ['node_modules', 'venv', 'env', '__pycache__']]
+                and d not in ['node_modules', 'venv', 'env', '__pycache__']
+                and os.path.normpath(os.path.join(workspace_path, d)) not in exclude_dirs]
     
     project_info["directory_structure"] = base_dirs
     
     return project_info
 
+def project_fingerprint(project_info):
+    """
+    计算项目信息中影响规则生成的部分的指纹
+    
+    只包含文件类型、框架、依赖、目录和实际使用的库等名称，不包含文件数量，
+    新增普通源文件不会使所有规则失效
+    
+    @return str
+    """
+    return cache_key({
+        "package": project_info.get('package_path', '.'),
+        "extensions": sorted(item['extension'] for item in project_info['file_types']),
+        "frameworks": sorted(project_info['framework_hints']),
+        "directories": sorted(project_info['directory_structure']),
+        "libraries": sorted(item['name'] for item in project_info.get('library_usage', [])),
+        "dependencies": project_info.get('dependencies', [])
+    })
+
+def find_packages(workspace_path, max_depth=PACKAGE_SCAN_DEPTH):
+    """
+    根据清单文件检测工作区中的子包边界（适用于monorepo）
+    
+    @param workspace_path - 工作区根目录
+    @param max_depth - 最大扫描深度
+    @return List[str] - 子包相对路径列表，工作区根目录记为'.'
+    """
+    packages = []
+    for root, dirs, files in os.walk(workspace_path):
+        rel_path = os.path.relpath(root, workspace_path)
+        depth = 0 if rel_path == '.' else rel_path.count(os.sep) + 1
+        
+        # 忽略隐藏目录和依赖目录，超过深度时不再继续向下扫描
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in IGNORED_DIRS] if depth < max_depth else []
+        
+        if any(manifest in files for manifest in PACKAGE_MANIFESTS):
+            packages.append(rel_path.replace(os.sep, '/'))
+    
+    return sorted(packages)
+
+def get_packages_info(workspace_path, packages, only=None):
+    """
+    并行分析每个子包，为每个子包生成独立的项目信息
+    
+    @param workspace_path - 工作区根目录
+    @param packages - find_packages返回的子包相对路径列表
+    @param only - 只分析其中的部分子包（监听模式下重新分析发生变化的子包）
+    @return List[dict] - [{"path": 子包路径, "project_info": 项目信息}]
+    """
+    def analyze_package(package):
+        package_dir = os.path.normpath(os.path.join(workspace_path, package))
+        # 父包的统计中不包含嵌套子包的文件
+        nested = [os.path.join(workspace_path, p) for p in packages
+                  if p != package and (package == '.' or p.startswith(package + '/'))]
+        project_info = get_project_info(package_dir, exclude_dirs=nested)
+        project_info["package_path"] = package
+        return {"path": package, "project_info": project_info}
+    
+    targets = [package for package in packages if only is None or package in only]
+    with ThreadPoolExecutor(max_workers=min(8, max(1, len(targets)))) as executor:
+        return list(executor.map(analyze_package, targets))
+
+def scope_globs(glob_pattern, package_path):
+    """
+    将glob限定在指定子包目录下
+    
+    @example scope_globs('**/*.{ts,tsx}', 'apps/web') => 'apps/web/**/*.{ts,tsx}'
+    """
+    if not package_path or package_path == '.':
+        return glob_pattern
+    scoped = []
+    for pattern in split_globs(glob_pattern) or ['**/*']:
+        # 去掉开头的./和/，避免产生重复分隔符
+        pattern = re.sub(r'^(\./|/)+', '', pattern)
+        if not pattern.startswith(package_path + '/'):
+            pattern = f"{package_path}/{pattern}"
+        scoped.append(pattern)
+    return ','.join(scoped)
+
 def convert_to_markdown(content):
     """
     将规则内容转换为格式良好的Markdown
@@ -302,18 +540,167 @@ def convert_to_markdown(content):
         # 其他类型，转为字符串后添加减号
         return f"- {str(content)}"
 
-def analyze_with_ai(content, project_info, config):
+def split_rule_content(content, max_chars=CHUNK_MAX_CHARS):
     """
-    使用AI模型分析内容并生成规则，使用流式处理实时生成规则文件
+    按章节和标题边界将超长规则内容切分为多个分块
     
-    @param content - 需要分析的内容
-    @param project_info - 项目信息
-    @param config - AI模型配置
+    章节以Markdown标题或无缩进的非列表行开始，代码块内部不会被切分
+    
+    @param content - 原始规则内容
+    @param max_chars - 单个分块的最大字符数
+    @return List[str] - 分块列表，内容较短时只有一个分块
+    """
+    if not isinstance(content, str) or len(content) <= max_chars:
+        return [content]
+    
+    # 先按章节边界切分
+    sections = []
+    current = []
+    in_code = False
+    for line in content.split('\n'):
+        stripped = line.strip()
+        is_heading = stripped.startswith('#') or (
+            stripped and line[0] not in ' \t' and not stripped.startswith(('-', '*', '```'))
+        )
+        if is_heading and not in_code and current:
+            sections.append('\n'.join(current))
+            current = []
+        if stripped.startswith('```'):
+            in_code = not in_code
+        current.append(line)
+    if current:
+        sections.append('\n'.join(current))
+    
+    # 将章节合并为不超过上限的分块，单个超长章节按行继续拆分
+    chunks = []
+    buffer = ''
+    for section in sections:
+        pieces = [section]
+        if len(section) > max_chars:
+            pieces = []
+            piece = ''
+            for line in section.split('\n'):
+                if piece and len(piece) + len(line) + 1 > max_chars:
+                    pieces.append(piece)
+                    piece = ''
+                piece = f"{piece}\n{line}" if piece else line
+            if piece:
+                pieces.append(piece)
+        
+        for piece in pieces:
+            if buffer and len(buffer) + len(piece) + 1 > max_chars:
+                chunks.append(buffer)
+                buffer = ''
+            buffer = f"{buffer}\n{piece}" if buffer else piece
+    if buffer:
+        chunks.append(buffer)
+    
+    return [chunk for chunk in chunks if chunk.strip()] or [content]
+
+def merge_rule_sets(rule_sets):
+    """
+    合并多个分块生成的规则集合：同名规则合并为一条，只去除重复的顶层条目，代码块、缩进等其余内容原样保留
+    
+    @param rule_sets - List[List[Tuple[str, str, str, str]]]，按分块顺序排列
+    @return List[Tuple[str, str, str, str]] - 合并后的规则元组
+    """
+    merged = {}
+    for rule_set in rule_sets:
+        for name, description, glob_pattern, content in rule_set:
+            key = name.lower()
+            if key.endswith('.mdc'):
+                key = key[:-4]
+            
+            if key not in merged:
+                merged[key] = {
+                    "name": name,
+                    "description": description,
+                    "globs": split_globs(glob_pattern),
+                    "contents": []
+                }
+            entry = merged[key]
+            
+            # 合并glob，保持原有顺序
+            for pattern in split_globs(glob_pattern):
+                if pattern not in entry["globs"]:
+                    entry["globs"].append(pattern)
+            
+            entry["contents"].append(str(content))
+    
+    # 存在有效规则时丢弃出错的分块结果
+    if any(not key.startswith('error-rule') for key in merged):
+        merged = {key: value for key, value in merged.items() if not key.startswith('error-rule')}
+    
+    return [
+        (entry["name"], entry["description"], ','.join(entry["globs"]) or '**/*',
+         merge_rule_contents(entry["contents"], near=False))
+        for entry in merged.values()
+    ]
+
+def analyze_with_ai_chunked(chunks, project_info, config, priority=PRIORITY_INTERACTIVE, outcome=None, resume=None):
+    """
+    分块定制规则（map-reduce）：各分块并发调用AI，最后合并去重
+    
+    只有一个分块时直接使用流式处理，保持逐条生成的特性
+    
+    @param chunks - split_rule_content返回的分块列表
+    @param resume - 中断前已生成的规则元组，只在单个分块时用于续写（多个分块的结果需要重新合并，忽略检查点）
     @yield Tuple[str, str, str, str] - 生成规则元组 (name, description, globs, content)
     """
-    try:
-        # 准备系统提示词
-        system_prompt = """你是一个专业的代码分析助手，专门负责创建和组织 Cursor MDC 规则文件。
+    if len(chunks) == 1:
+        yield from analyze_with_ai(convert_to_markdown(chunks[0]), project_info, config, priority, outcome, resume)
+        return
+    
+    logger.info(f"规则内容较长，分为{len(chunks)}个分块并发处理...")
+    
+    def analyze_chunk(chunk):
+        return list(analyze_with_ai(convert_to_markdown(chunk), project_info, config, priority, outcome))
+    
+    # 总耗时取决于最慢的分块，而不是一次超长请求
+    with ThreadPoolExecutor(max_workers=min(CHUNK_WORKERS, len(chunks))) as executor:
+        rule_sets = list(executor.map(analyze_chunk, chunks))
+    
+    logger.info(f"分块处理完成，共{sum(len(r) for r in rule_sets)}条规则，开始合并...")
+    # 各分块分别受规则数上限约束，合并后的结果同样不超过上限
+    yield from merge_rule_sets(rule_sets)[:stream_limits(config)[0]]
+
+def output_tokens_limit(config):
+    """单次请求允许的最大输出token数，取自配置中的max_tokens"""
+    return int(config.get('max_tokens') or MAX_OUTPUT_TOKENS)
+
+def stream_limits(config):
+    """
+    单个源规则最多生成的规则数和每条规则最多保留的顶层条目数
+    
+    @return Tuple[int | None, int | None] - 配置为0时对应项为None（不限制）
+    """
+    return int(config.get('max_rules_per_source') or 0) or None, int(config.get('max_bullets_per_rule') or 0) or None
+
+def estimate_output_tokens(content, config):
+    """
+    根据源规则长度和预计生成的规则数量估计本次请求需要的max_tokens
+    
+    预计规则数按源内容的章节和条目数量估算（不超过配置的规则数上限），每条规则约TOKENS_PER_RULE个token，
+    再加上余量，结果限制在[MIN_OUTPUT_TOKENS, max_tokens配置]之间
+    
+    @return int
+    """
+    estimate = int(expected_rule_count(content, stream_limits(config)[0]) * TOKENS_PER_RULE * OUTPUT_TOKENS_MARGIN)
+    return max(MIN_OUTPUT_TOKENS, min(estimate, output_tokens_limit(config)))
+
+def expected_rule_count(content, max_rules=None):
+    """按源内容的章节、条目数量和长度估计模型将生成的规则数，max_rules为配置的规则数上限"""
+    lines = [line.strip() for line in str(content).split('\n') if line.strip()]
+    headings = sum(1 for line in lines if line.startswith('#'))
+    items = sum(1 for line in lines if re.match(r'^([-*+]|\d+\.)\s', line))
+    expected_rules = max(2, headings, -(-items // 6), count_tokens(content) // 600)
+    return min(expected_rules, MAX_EXPECTED_RULES, max_rules or MAX_EXPECTED_RULES)
+
+def build_system_prompt():
+    """
+    生成规则所用的系统提示词（命名、globs、描述和内容规范）
+    """
+    return """你是一个专业的代码分析助手，专门负责创建和组织 Cursor MDC 规则文件。
 你需要将输入的内容转换为多个规则，每个规则都应该遵循以下规范：
 
 1. 命名规范（name）：
@@ -346,16 +733,46 @@ def analyze_with_ai(content, project_info, config):
 
 请直接返回 JSON 数组，不要添加任何 Markdown 格式。"""
 
-        # 准备项目信息字符串
-        project_info_str = f"""项目信息:
-- 主要文件类型: {', '.join([f"{item['extension']}({item['count']}个)" for item in project_info['file_types']])}
+def format_project_info(project_info):
+    """
+    把项目信息格式化为提示词中的项目信息段落
+    """
+    # 近似统计的数量标注为估计值
+    approx = '约' if project_info.get('estimated') else ''
+    total_files = f"{approx}{project_info['total_files']}"
+    if project_info.get('total_files_ci'):
+        total_files += f"（估计值，95%置信区间 {project_info['total_files_ci'][0]}-{project_info['total_files_ci'][1]}）"
+    project_info_str = f"""项目信息:
+- 主要文件类型: {', '.join([f"{item['extension']}({approx}{item['count']}个)" for item in project_info['file_types']])}
 - 检测到的框架/库: {', '.join(project_info['framework_hints']) if project_info['framework_hints'] else '未检测到明确框架'}
 - 目录结构: {', '.join(project_info['directory_structure'])}
-- 文件总数: {project_info['total_files']}
+- 文件总数: {total_files}
 """
+    # 源码中实际导入的库（抽样统计）
+    if project_info.get('library_usage'):
+        libraries = ', '.join([f"{item['name']}({item['files']}个文件)" for item in project_info['library_usage']])
+        project_info_str += f"- 代码中实际使用的库: {libraries}\n"
+    if project_info.get('dependencies'):
+        project_info_str += f"- 声明的依赖: {', '.join(project_info['dependencies'][:MAX_PROMPT_DEPENDENCIES])}\n"
+    # monorepo中的子包：glob_pattern需要相对于子包目录编写，由调用方统一加上子包路径前缀
+    package_path = project_info.get('package_path')
+    if package_path and package_path != '.':
+        project_info_str += f"- 子包路径: {package_path}（生成的规则仅作用于该子包，glob_pattern 请相对于子包目录编写）\n"
+    return project_info_str
 
-        # 准备用户提示内容
-        user_prompt = f"""分析以下内容并创建多个 Cursor 规则文件 (.mdc)，参考以下示例格式：
+def build_prompts(content, project_info):
+    """
+    构建生成规则所用的系统提示词和用户提示词
+    
+    @param content - 转换为Markdown后的规则内容
+    @param project_info - 项目信息
+    @return Tuple[str, str] - (系统提示词, 用户提示词)
+    """
+    system_prompt = build_system_prompt()
+    project_info_str = format_project_info(project_info)
+
+    # 准备用户提示内容
+    user_prompt = f"""分析以下内容并创建多个 Cursor 规则文件 (.mdc)，参考以下示例格式：
 
 {{
   "name": "nextjs-best-practices",
@@ -378,135 +795,456 @@ def analyze_with_ai(content, project_info, config):
 {content}
 
 返回一个有效的 JSON 数组，每个规则对象必须包含上述四个字段，content内容必须以中文返回，并严格遵循示例格式。"""
+    
+    return system_prompt, user_prompt
+
+def continuation_messages(system_prompt, user_prompt, previous_output, generated_names):
+    """构建续写请求的消息：此前的输出作为assistant消息，要求模型只生成剩余的规则"""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+        {"role": "assistant", "content": previous_output},
+        {"role": "user", "content": f"输出不完整。请继续生成剩余的规则，不要重复已生成的规则（{', '.join(generated_names) or '无'}），"
+                                    f"只返回由剩余规则组成的 JSON 数组。"}
+    ]
 
-        # 调用 API
-        model_url = config.get('model_url')
-        api_key = config.get('api_key')
-        model_name = config.get('model_name')
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": model_name,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.2,
-            "max_tokens": 2048,
-            "top_p": 0.95,
-            "n": 1,
-            "stream": True,
-            "stop": None
-        }
+def analyze_with_ai(content, project_info, config, priority=PRIORITY_INTERACTIVE, outcome=None, resume=None):
+    """
+    使用AI模型分析内容并生成规则，使用流式处理实时生成规则文件
+    
+    @param content - 需要分析的内容
+    @param project_info - 项目信息
+    @param config - AI模型配置
+    @param priority - 调用优先级，交互请求优先于后台批量任务
+    @param outcome - 可选的状态字典，生成不完整（出错、超时或多次续写后仍被截断）时将其中的complete置为False，
+                     出错时error为错误信息
+    @param resume - 中断前已生成的规则元组（检查点），给出时第一次请求即为续写请求，只生成剩余的规则，
+                    已生成的规则不再产出
+    @yield Tuple[str, str, str, str] - 生成规则元组 (name, description, globs, content)
+    """
+    try:
+        system_prompt, user_prompt = build_prompts(content, project_info)
+        
+        # 按源规则长度估计输出大小，避免小规则占用过多的输出额度
+        max_tokens = estimate_output_tokens(content, config)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        scheduler = get_scheduler(config)
+        # 达到规则数或条目数上限后提前结束输出
+        max_rules, max_bullets = stream_limits(config)
         
         logger.info("正在调用 AI API（流式处理模式）...")
-        response = requests.post(model_url, headers=headers, json=data, stream=True)
+        request_started = time.time()
+        generated_names = []
+        if resume:
+            # 从检查点继续：把已生成的规则当作此前的输出发送续写请求
+            generated_names = [rule_tuple[0] for rule_tuple in resume]
+            logger.info(f"从检查点继续，已生成{len(generated_names)}条规则")
+            messages = continuation_messages(system_prompt, user_prompt, rules_json(resume).rstrip()[:-1].rstrip(),
+                                             generated_names)
         
-        if response.status_code != 200:
-            logger.error(f"API 调用失败: {response.status_code}")
-            logger.error(f"错误信息: {response.text}")
-            return
-            
-        # 用于存储JSON文本
-        json_text = ""
-        in_json = False
+        def on_first_token():
+            if attempt == 0:
+                emit_event("first_token", latency=round(time.time() - request_started, 3))
         
-        # 处理流式响应
-        for line in response.iter_lines():
-            if line:
-                try:
-                    if line.startswith(b"data: "):
-                        json_str = line[6:].decode('utf-8')
-                        if json_str.strip() == "[DONE]":
-                            break
-                            
-                        chunk = json.loads(json_str)
-                        if "choices" in chunk and chunk["choices"]:
-                            content_delta = chunk["choices"][0].get("delta", {}).get("content", "")
-                            if content_delta:
-                                # 检测JSON数组的开始和结束
-                                if '[' in content_delta:
-                                    in_json = True
-                                
-                                if in_json:
-                                    json_text += content_delta
-                                    
-                                    # 尝试解析完整的JSON对象
-                                    if '},' in json_text or '}]' in json_text:
-                                        try:
-                                            # 提取可能完整的JSON对象
-                                            while True:
-                                                obj_start = json_text.find('{')
-                                                obj_end = json_text.find('},')
-                                                if obj_end == -1:
-                                                    obj_end = json_text.find('}]')
-                                                
-                                                if obj_start != -1 and obj_end != -1:
-                                                    obj_text = json_text[obj_start:obj_end+1]
-                                                    try:
-                                                        rule = json.loads(obj_text)
-                                                        # 生成规则元组
-                                                        yield (
-                                                            rule.get("name", "unknown"),
-                                                            rule.get("description", ""),
-                                                            rule.get("glob_pattern", "**/*"),
-                                                            rule.get("content", "")
-                                                        )
-                                                        # 移除已处理的对象
-                                                        json_text = json_text[obj_end+1:]
-                                                    except json.JSONDecodeError:
-                                                        break
-                                                else:
-                                                    break
-                                        except Exception as e:
-                                            logger.warning(f"解析规则时出错: {str(e)}")
-                                            
-                except Exception as e:
-                    logger.warning(f"处理数据块时出错: {str(e)}")
-                    continue
+        for attempt in range(MAX_CONTINUATIONS + 1):
+            remaining = max_rules - len(generated_names) if max_rules else None
+            if remaining is not None and remaining <= 0:
+                logger.info(f"已达到规则数上限({max_rules})，不再续写")
+                break
+            # 调用 API（多端点时按延迟路由，必要时发送对冲请求）
+            data = {
+                "model": config.get('model_name'),
+                "messages": messages,
+                "temperature": config.get('temperature', 0.2),
+                "max_tokens": max_tokens,
+                "top_p": 0.95,
+                "n": 1,
+                "stream": True,
+                "stop": None
+            }
+            
+            # 按优先级排队，并遵守请求数和token数限额
+            waited = scheduler.acquire(count_message_tokens(messages) + max_tokens, priority)
+            if waited >= 1:
+                logger.info(f"限流排队等待了{waited:.1f}秒")
+            
+            # 读取和解析在独立线程中进行，调用方写文件变慢不会阻塞网络读取
+            pipeline = StreamPipeline(stream_chat_completion(config, data), on_first_token,
+                                      max_items=remaining, max_bullets=max_bullets)
+            attempt_count = len(generated_names)
+            interrupted = None
+            try:
+                for rule_tuple in pipeline:
+                    if (attempt > 0 or resume) and rule_tuple[0] in generated_names:
+                        # 续写时模型重复输出的规则
+                        continue
+                    emit_event("rule_parsed", name=rule_tuple[0])
+                    generated_names.append(rule_tuple[0])
+                    yield rule_tuple
+            except ModelDeadlineExceeded:
+                raise
+            except ModelRequestError as e:
+                # 响应流中途中断：已收到的内容可用时保留，只请求剩余部分
+                if not generated_names and not pipeline.partial_text():
+                    raise
+                interrupted = e
+            
+            if pipeline.stopped_early:
+                logger.info(f"已提前结束模型输出（{STOP_REASONS.get(pipeline.stopped_early, pipeline.stopped_early)}），"
+                            f"共{len(generated_names)}条规则")
+                emit_event("stream_stopped", reason=pipeline.stopped_early, generated=len(generated_names),
+                           elapsed=round(time.time() - request_started, 3))
+            if interrupted is None and not pipeline.truncated:
+                break
+            
+            # 被截断的最后一个规则对象中名称和内容都已收到时恢复该规则
+            salvaged = pipeline.salvage()
+            if salvaged and salvaged[0] not in generated_names:
+                logger.info(f"从不完整的输出中恢复了规则: {salvaged[0]}")
+                emit_event("rule_parsed", name=salvaged[0], salvaged=True)
+                generated_names.append(salvaged[0])
+                yield salvaged
+            
+            if interrupted is not None:
+                logger.warning(f"响应流中断，已保留{len(generated_names)}条规则: {str(interrupted)}")
+                if interrupted.status_code == 429:
+                    scheduler.backoff(interrupted.retry_after)
+            elif pipeline.finish_reason == "length" and len(generated_names) == attempt_count:
+                # 输出因长度限制被截断且没有任何进展：提高max_tokens后续写
+                if max_tokens >= output_tokens_limit(config):
+                    logger.warning("单条规则超过输出长度上限，无法继续生成")
+                    break
+                max_tokens = output_tokens_limit(config)
+            if attempt == MAX_CONTINUATIONS:
+                logger.warning(f"输出多次被截断或中断，已生成{len(generated_names)}条规则，停止续写")
+                if outcome is not None:
+                    outcome["complete"] = False
+                break
+            # 从最后一条完整规则之后续写，而不是重新生成
+            logger.info(f"输出不完整，已生成{len(generated_names)}条规则，发送续写请求...")
+            emit_event("continuation", generated=len(generated_names), max_tokens=max_tokens)
+            messages = continuation_messages(system_prompt, user_prompt,
+                                             pipeline.complete_text() if len(generated_names) > attempt_count else '[',
+                                             generated_names)
         
+    except ModelDeadlineExceeded as e:
+        # 超过截止时间时不再生成规则，没有生成任何规则时由调用方回退到原始规则
+        logger.warning(f"AI 生成超时，将使用原始规则: {str(e)}")
+        emit_event("error", stage="model", message=str(e), recoverable=True)
+        if outcome is not None:
+            outcome["complete"] = False
+            outcome["error"] = str(e)
+    except ModelRequestError as e:
+        logger.error(f"API 调用失败: {str(e)}")
+        if outcome is not None:
+            outcome["complete"] = False
+            outcome["error"] = str(e)
+        emit_event("error", stage="model", message=str(e), status_code=e.status_code, recoverable=True)
+        if e.status_code == 429:
+            get_scheduler(config).backoff(e.retry_after)
     except Exception as e:
         logger.error(f"AI 分析出错: {str(e)}")
-        yield ("error-rule.mdc", f"Error: {str(e)}", "**/*", "- 处理出错，请检查日志")
+        emit_event("error", stage="model", message=str(e), recoverable=True)
+        if outcome is not None:
+            outcome["complete"] = False
+            outcome["error"] = str(e)
+        yield (ERROR_RULE_NAME, f"Error: {str(e)}", "**/*", "- 处理出错，请检查日志")
+
+def rules_json(rules):
+    """把生成规则元组序列化为与模型输出格式相同的JSON数组文本"""
+    return json.dumps([
+        {"name": name, "glob_pattern": glob_pattern, "description": description, "content": content}
+        for name, description, glob_pattern, content in rules
+    ], ensure_ascii=False, indent=1)
+
+def build_patch_prompts(diff, prior_rules, project_info):
+    """
+    构建增量生成所用的提示词：此前生成的规则加上源规则的行差异，要求模型只返回修改操作
+    
+    @param diff - source_diff返回的差异文本
+    @param prior_rules - List[Tuple[str, str, str, str]] 上一次生成的规则
+    @return Tuple[str, str] - (系统提示词, 用户提示词)
+    """
+    previous = rules_json(prior_rules)
+    
+    user_prompt = f"""此前已根据源规则生成了以下 Cursor 规则：
+
+{previous}
+
+{format_project_info(project_info)}
+源规则随后做了如下修改（unified diff 格式，- 开头为删除的行，+ 开头为新增的行）：
+
+{diff}
+
+请只根据这些修改更新上述规则，返回一个 JSON 数组，每个元素是一个修改操作：
+- {{"op": "update", "name": "规则名称", ...}}：只给出需要修改的字段（description、glob_pattern、content），content 需给出修改后的完整内容
+- {{"op": "add", "name": "...", "glob_pattern": "...", "description": "...", "content": "..."}}：新增规则
+- {{"op": "remove", "name": "规则名称"}}：删除不再适用的规则
+
+不受修改影响的规则不要返回，没有需要修改的规则时返回 []。content内容必须以中文返回。"""
+    
+    return build_system_prompt(), user_prompt
+
+def patch_output_tokens(prior_rules, config):
+    """增量生成的max_tokens：最坏情况下需要重写全部规则并新增一条"""
+    estimate = int((len(prior_rules) + 1) * TOKENS_PER_RULE * OUTPUT_TOKENS_MARGIN)
+    return max(MIN_OUTPUT_TOKENS, min(estimate, output_tokens_limit(config)))
+
+def patch_with_ai(diff, prior_rules, project_info, config, priority=PRIORITY_INTERACTIVE):
+    """
+    基于源规则的差异增量更新此前生成的规则：只发送差异和上一次的生成结果，模型返回修改操作后在本地应用
+    
+    @param diff - source_diff返回的差异文本
+    @param prior_rules - List[Tuple[str, str, str, str]] 上一次生成的规则
+    @return List[Tuple[str, str, str, str]] | None - 应用修改后的完整规则列表，
+            调用失败、输出不完整或没有返回JSON数组时返回None，由调用方改为完整生成
+    """
+    system_prompt, user_prompt = build_patch_prompts(diff, prior_rules, project_info)
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    max_tokens = patch_output_tokens(prior_rules, config)
+    data = {
+        "model": config.get('model_name'),
+        "messages": messages,
+        "temperature": config.get('temperature', 0.2),
+        "max_tokens": max_tokens,
+        "top_p": 0.95,
+        "n": 1,
+        "stream": True,
+        "stop": None
+    }
+    
+    scheduler = get_scheduler(config)
+    waited = scheduler.acquire(count_message_tokens(messages) + max_tokens, priority)
+    if waited >= 1:
+        logger.info(f"限流排队等待了{waited:.1f}秒")
+    
+    request_started = time.time()
+    pipeline = StreamPipeline(stream_chat_completion(config, data),
+                              lambda: emit_event("first_token", latency=round(time.time() - request_started, 3)),
+                              validate=validate_patch_op)
+    try:
+        ops = list(pipeline)
+    except ModelRequestError as e:
+        logger.warning(f"增量生成请求失败: {str(e)}")
+        if e.status_code == 429:
+            scheduler.backoff(e.retry_after)
+        return None
+    
+    if pipeline.truncated or not pipeline.scanner.started:
+        logger.warning("增量生成的输出不完整或格式不正确")
+        return None
+    
+    rules = apply_rule_patch(prior_rules, ops)
+    emit_event("patch", ops=len(ops), rules=len(rules), elapsed=round(time.time() - request_started, 3))
+    logger.info(f"增量生成完成: {len(ops)}个修改操作，共{len(rules)}条规则")
+    return rules or None
+
+def package_rule(rule_tuple, package_path):
+    """子包规则加上包路径前缀，避免不同子包的同名规则互相覆盖，globs限定在子包目录下"""
+    name, description, glob_pattern, content = rule_tuple
+    if package_path != '.':
+        name = f"{package_path.replace('/', '-')}-{name}"
+        glob_pattern = scope_globs(glob_pattern, package_path)
+    return name, description, glob_pattern, content
+
+def write_mdc_file(output_dir, name, description, glob_pattern, content):
+    """
+    将规则写入MDC文件
+    
+    @return str - 写入的文件路径
+    """
+    filename, data = render_mdc(name, description, glob_pattern, content)
+    return write_rule_file(output_dir, filename, data)
+
+def analyze_workspace(workspace_path, detect_packages=True):
+    """
+    分析工作区，monorepo中每个子包返回独立的项目信息
+    
+    @return List[dict] - [{"path": 子包路径, "project_info": 项目信息}]，单包项目只有一项且路径为'.'
+    """
+    packages = find_packages(workspace_path) if detect_packages else []
+    
+    if not packages or packages == ['.']:
+        return [{"path": '.', "project_info": get_project_info(workspace_path)}]
+    
+    logger.info(f"检测到monorepo，共{len(packages)}个子包: {', '.join(packages)}")
+    return get_packages_info(workspace_path, packages)
+
+def consolidate_generated_rules(generated, output_dir):
+    """
+    合并本次生成的相似规则（例如多个源规则各自生成的typescript-best-practices），
+    只重写包含多条规则的簇对应的文件，并删除这些簇中被合并掉的文件，其余规则文件保持不变
+    
+    @param generated - List[Tuple[str, str, str, str]] 本次AI生成的规则元组
+    @return int - 合并后的规则数量
+    """
+    clusters = [cluster for cluster in cluster_rules(generated) if len(cluster) > 1]
+    if not clusters:
+        return len(generated)
+    
+    merged_count = len(generated) - sum(len(cluster) - 1 for cluster in clusters)
+    logger.info(f"合并相似规则: {len(generated)} 条 -> {merged_count} 条")
+    for cluster in clusters:
+        members = [generated[i] for i in cluster]
+        kept_path = write_mdc_file(output_dir, *merge_cluster(members))
+        for name, _, _, _ in members:
+            path = os.path.join(output_dir, name if name.endswith('.mdc') else f"{name}.mdc")
+            if path != kept_path and os.path.exists(path):
+                os.remove(path)
+                logger.info(f"已删除被合并的规则文件: {path}")
+                emit_event("file_removed", path=path, reason="merged")
+    return merged_count
+
+def generate_package_rules(rule_data, chunks, package, config, priority=PRIORITY_INTERACTIVE, cache=None,
+                           use_cache=True, versions=None, outcome=None, resume=None):
+    """
+    为一个子包生成规则：输入未变化时直接使用缓存，否则调用AI生成并写入缓存
+    
+    多个进程同时生成相同的规则（相同的源规则内容、项目指纹和模型）时只有一个进程调用模型，
+    其他进程等待它完成后直接使用它的结果
+    
+    源规则只做了小幅修改、项目和模型都未变化时，只把源规则的差异和上一次的生成结果发给模型，
+    由模型返回修改操作后在本地应用，失败时改为完整生成
+    
+    @param chunks - split_rule_content返回的分块列表
+    @param package - {"path": 子包路径, "project_info": 项目信息}
+    @param cache - ResponseCache实例，为None时不使用缓存也不合并并发请求
+    @param use_cache - 是否读取生成之前已有的缓存
+    @param versions - 记录每个源规则上一次生成所用源内容的ResponseCache实例，为None时不做增量生成
+    @param outcome - 可选的状态字典，生成不完整时将其中的complete置为False
+    @param resume - 中断前已生成的规则元组（批量任务的检查点），只生成剩余的规则；
+                    这些规则会先被产出，产出的始终是完整的规则集合
+    @yield Tuple[str, str, str, str] - 生成规则元组（未加子包前缀）
+    """
+    package_path = package['path']
+    if outcome is None:
+        outcome = {"complete": True}
+    # 多个分块的结果需要重新合并，此时不从检查点续写
+    resume = list(resume or []) if len(chunks) == 1 else []
+    if cache is None:
+        yield from resume
+        yield from analyze_with_ai_chunked(chunks, package['project_info'], config, priority, outcome, resume)
+        return
+    
+    content = rule_data.get('content', '')
+    rule_id = rule_data.get('slug', rule_data.get('name'))
+    fingerprint = project_fingerprint(package['project_info'])
+    key = cache_key(content, fingerprint, config.get('model_name'))
+    # 同一源规则在相同项目指纹和模型下的上一次生成，不包含源内容，源规则修改后仍能找到
+    version_key = cache_key(rule_id, fingerprint, config.get('model_name'))
+    previous = versions.entry(version_key) if versions is not None else None
+    
+    def remember(rules):
+        if versions is not None and (previous is None or previous.get("source") != content):
+            versions.put(version_key, rules, source=content, rule=rule_id, package=package_path,
+                         model=config.get('model_name'))
+    
+    flight_started = time.time()
+    with single_flight(key) as waited:
+        # 等待过其他进程时读取它刚写入的结果（即使不使用已有缓存）
+        cached = None
+        if use_cache:
+            cached = cache.get(key)
+        elif waited:
+            cached = cache.get(key, newer_than=flight_started)
+        
+        if cached is not None:
+            source = "其他进程" if waited and not use_cache else "缓存"
+            logger.info(f"使用{source}的生成结果[{package_path}]: {len(cached)}条规则")
+            yield from cached
+            remember(cached)
+            return
+        
+        # 源规则小幅修改：基于差异增量生成（从检查点续写时不适用）
+        if use_cache and not resume and previous is not None and previous.get("source") != content:
+            diff, changed = source_diff(previous.get("source", ''), content)
+            if diff_worth_patching(content, changed):
+                logger.info(f"源规则有{changed}行变化，基于差异增量生成[{package_path}]...")
+                patched = patch_with_ai(diff, [tuple(rule) for rule in previous["rules"]], package['project_info'],
+                                        config, priority)
+                if patched:
+                    yield from patched
+                    cache.put(key, patched, rule=rule_id, package=package_path, model=config.get('model_name'),
+                              patched=True)
+                    remember(patched)
+                    return
+                logger.info("增量生成失败，改为完整生成")
+        
+        fresh = list(resume)
+        yield from resume
+        for rule_tuple in analyze_with_ai_chunked(chunks, package['project_info'], config, priority, outcome, resume):
+            fresh.append(rule_tuple)
+            yield rule_tuple
+        
+        # 出错或只生成了部分规则时不写入缓存，下次重新生成
+        if fresh and outcome["complete"]:
+            cache.put(key, fresh, rule=rule_id, package=package_path, model=config.get('model_name'))
+            remember(fresh)
 
-def process_selected_rules(selected_rules, workspace_path, use_ai=True):
+def process_selected_rules(selected_rules, workspace_path, use_ai=True, output_dir=None, detect_packages=True,
+                           priority=PRIORITY_INTERACTIVE, merge_similar=True, use_cache=True, packages_info=None,
+                           profile=None):
     """
     处理选中的规则，使用AI定制内容并保存为MDC文件
     采用流式处理方式，每处理完一个规则就立即保存
+    monorepo中按子包分别定制，生成的globs限定在对应子包目录下
+    全部处理完成后合并相似规则，避免多个源规则生成重复的规则文件
+    源规则内容、项目指纹和模型都未变化时直接使用缓存的生成结果，源规则小幅修改时基于差异增量生成
+    
+    @param packages_info - 已分析好的项目信息（监听模式下只传入发生变化的子包），为空时重新分析工作区
+    @param profile - 显式指定的模型配置名称，为空时按配置中的路由规则为每条规则选择
     """
     if not selected_rules:
         logger.warning("没有选择任何规则")
         return
     
     # 准备输出目录
-    output_dir = os.path.join(workspace_path, '.cursor', 'rules')
+    output_dir = output_dir or os.path.join(workspace_path, '.cursor', 'rules')
     os.makedirs(output_dir, exist_ok=True)
     
     # 获取AI模型配置
     config = get_model_config() if use_ai else None
     
     # 项目分析
+    started = time.time()
     logger.info("分析项目结构中...")
-    project_info = get_project_info(workspace_path)
-    logger.info(f"项目分析完成: 检测到{len(project_info['file_types'])}种主要文件类型, {len(project_info['framework_hints'])}种框架/库")
+    emit_event("phase_start", phase="analyze_project")
+    if packages_info is None:
+        packages_info = analyze_workspace(workspace_path, detect_packages)
+    for package in packages_info:
+        project_info = package['project_info']
+        logger.info(f"项目分析完成[{package['path']}]: 检测到{len(project_info['file_types'])}种主要文件类型, {len(project_info['framework_hints'])}种框架/库")
+    emit_event("phase_end", phase="analyze_project", packages=[package['path'] for package in packages_info],
+               elapsed=round(time.time() - started, 3))
     
     # 计算总规则数量
     total_rules = len(selected_rules)
     successful = 0
-    rules_generated = 0
+    generated = []
+    
+    # 规则文件由后台线程批量写入
+    writer = RuleWriter(output_dir)
+    # 不读取缓存时仍然写入缓存，用于把生成结果交给等待中的其他进程
+    cache = ResponseCache() if config else None
+    # 每个源规则上一次生成所用的源内容，源规则小幅修改时基于差异增量生成
+    versions = ResponseCache(VERSIONS_DIR) if config else None
     
     # 逐个处理每条规则
     for i, rule in enumerate(selected_rules):
+        rule_started = time.time()
         try:
             # 确保规则是标准格式
             rule_data = prep_rule_data(rule)
             
             rule_name = rule_data.get('name', 'Unknown')
             logger.info(f"处理规则: {rule_name}")
+            emit_event("phase_start", phase="generate", rule=rule_data.get('slug', rule_name), index=i + 1, total=total_rules)
             
             # 使用AI定制规则内容
             if use_ai and config:
@@ -515,106 +1253,633 @@ def process_selected_rules(selected_rules, workspace_path, use_ai=True):
                 # 获取规则内容
                 rule_content = rule_data.get('content', '- 没有提供规则内容')
                 
-                # 将规则内容转换为Markdown格式
-                markdown_content = convert_to_markdown(rule_content)
+                # 按规则大小、标签或显式指定选择模型配置，短规则使用更快的模型
+                rule_config = get_profile_config(config, select_profile(config, rule_data, len(rule_content), profile))
+                if rule_config.get('profile'):
+                    logger.info(f"使用模型配置: {rule_config['profile']} ({rule_config.get('model_name')})")
                 
-                # 调用AI分析规则内容并生成多个规则
-                for rule_tuple in analyze_with_ai(markdown_content, project_info, config):
-                    # 处理并保存规则
-                    name, description, glob_pattern, content = rule_tuple
-                    
-                    # 确保name以.mdc结尾
-                    if not name.endswith('.mdc'):
-                        name = f"{name}.mdc"
-                    
-                    # 创建MDC内容
-                    mdc_content = f"""---
-name: {name}
-description: {description}
-globs: {glob_pattern}
----
-
-{content}
-"""
-                    
-                    # 保存MDC文件
-                    output_path = os.path.join(output_dir, name)
-                    with open(output_path, 'wb') as f:
-                        f.write(mdc_content.encode('utf-8'))
+                # 超长规则按章节切分，分块并发定制
+                chunks = split_rule_content(rule_content)
+                
+                rules_generated = 0
+                for package in packages_info:
+                    package_path = package['path']
                     
-                    rules_generated += 1
-                    successful += 1
-                    logger.info(f"已创建规则文件: {output_path}")
+                    # 调用AI分析规则内容并生成多个规则（优先使用缓存或其他进程的相同生成结果）
+                    for rule_tuple in generate_package_rules(rule_data, chunks, package, rule_config, priority,
+                                                             cache, use_cache, versions):
+                        # 处理并保存规则，子包规则加上包路径前缀
+                        name, description, glob_pattern, content = package_rule(rule_tuple, package_path)
+                        
+                        writer.submit(name, description, glob_pattern, content)
+                        generated.append((name, description, glob_pattern, content))
+                        rules_generated += 1
+                        successful += 1
                 
                 if rules_generated > 0:
                     logger.info(f"已处理 {rules_generated} 个规则...")
+                    emit_event("phase_end", phase="generate", rule=rule_data.get('slug', rule_name), generated=rules_generated,
+                               fallback=False, elapsed=round(time.time() - rule_started, 3))
                 else:
                     # 如果没有生成规则，直接保存原始规则
                     logger.info("未能生成规则，使用原始规则...")
                     
                     # 保存原始规则
-                    name = rule_data.get('name', 'unknown_rule.mdc')
-                    description = rule_data.get('description', 'Auto-generated rule')
-                    glob_pattern = rule_data.get('globs', '**/*')
-                    content = rule_data.get('content', '- No rule content')
-                    
-                    # 确保name以.mdc结尾
-                    if not name.endswith('.mdc'):
-                        name = f"{name}.mdc"
-                    
-                    # 创建MDC内容
-                    mdc_content = f"""---
-name: {name}
-description: {description}
-globs: {glob_pattern}
----
-
-{content}
-"""
-                    
-                    # 保存MDC文件
-                    output_path = os.path.join(output_dir, name)
-                    with open(output_path, 'wb') as f:
-                        f.write(mdc_content.encode('utf-8'))
-                    
+                    writer.submit(
+                        rule_data.get('name', 'unknown_rule.mdc'),
+                        rule_data.get('description', 'Auto-generated rule'),
+                        rule_data.get('globs', '**/*'),
+                        rule_data.get('content', '- No rule content')
+                    )
                     successful += 1
-                    logger.info(f"已创建规则文件: {output_path}")
+                    emit_event("phase_end", phase="generate", rule=rule_data.get('slug', rule_name), generated=0,
+                               fallback=True, elapsed=round(time.time() - rule_started, 3))
             else:
                 # 不使用AI，直接保存规则
-                name = rule_data.get('name', 'unknown_rule.mdc')
-                description = rule_data.get('description', 'Auto-generated rule')
-                glob_pattern = rule_data.get('globs', '**/*')
-                content = rule_data.get('content', '- No rule content')
-                
-                # 确保name以.mdc结尾
-                if not name.endswith('.mdc'):
-                    name = f"{name}.mdc"
-                
-                # 创建MDC内容
-                mdc_content = f"""---
-name: {name}
-description: {description}
-globs: {glob_pattern}
----
-
-{content}
-"""
-                
-                # 保存MDC文件
-                output_path = os.path.join(output_dir, name)
-                with open(output_path, 'wb') as f:
-                    f.write(mdc_content.encode('utf-8'))
-                
+                writer.submit(
+                    rule_data.get('name', 'unknown_rule.mdc'),
+                    rule_data.get('description', 'Auto-generated rule'),
+                    rule_data.get('globs', '**/*'),
+                    rule_data.get('content', '- No rule content')
+                )
                 successful += 1
-                logger.info(f"已创建规则文件: {output_path}")
+                emit_event("phase_end", phase="generate", rule=rule_data.get('slug', rule_name), generated=0,
+                           fallback=True, elapsed=round(time.time() - rule_started, 3))
                 
         except Exception as e:
             logger.error(f"处理规则时出错: {str(e)}")
+            emit_event("error", stage="generate", rule=rule.get('slug') if isinstance(rule, dict) else None,
+                       message=str(e), recoverable=False)
+    
+    # 等待后台写入完成，合并阶段需要覆盖和删除这些文件
+    failed_writes = writer.close()
+    successful -= len(failed_writes)
+    
+    # 合并相似规则
+    if merge_similar and len(generated) > 1:
+        emit_event("phase_start", phase="merge")
+        try:
+            with output_dir_lock(output_dir):
+                successful -= len(generated) - consolidate_generated_rules(generated, output_dir)
+        except Exception as e:
+            logger.error(f"合并相似规则时出错: {str(e)}")
+            emit_event("error", stage="merge", message=str(e), recoverable=True)
+        emit_event("phase_end", phase="merge")
     
     # 总结处理结果
     logger.info(f"成功处理完成! 共创建了 {successful} 个规则文件。")
+    metrics = None
+    if config:
+        metrics = get_scheduler(config).get_metrics()
+        logger.info(f"调度统计: 调用{metrics['acquired']}次, 平均等待{metrics['avg_wait']:.2f}秒, "
+                    f"最长等待{metrics['max_wait']:.2f}秒, 最大队列深度{metrics['max_queue_depth']}")
+    pipeline_metrics = get_pipeline_metrics()
+    logger.debug(f"流水线统计: {json.dumps(pipeline_metrics, ensure_ascii=False)}")
+    cache_stats = {"hits": cache.hits, "misses": cache.misses} if cache else None
+    if cache and cache.hits:
+        logger.info(f"缓存命中{cache.hits}次，未命中{cache.misses}次")
+    emit_event("stats", rules=total_rules, files=successful, generated=len(generated),
+               elapsed=round(time.time() - started, 3), scheduler=metrics, pipeline=pipeline_metrics, cache=cache_stats)
     logger.info("处理完成!")
 
+def watch_workspace(selected_rules, workspace_path, output_dir, detect_packages=True, priority=PRIORITY_INTERACTIVE,
+                    merge_similar=True, use_cache=True, profile=None):
+    """
+    监听模式：先生成一次规则，之后在清单文件或源码变化时增量更新
+    
+    只重新分析包含变化文件的子包，子包的项目指纹发生变化时才重新生成该子包的规则；
+    清单文件的增删导致子包边界变化时重新分析整个工作区。按Ctrl+C退出
+    """
+    packages = (find_packages(workspace_path) if detect_packages else []) or ['.']
+    packages_info = analyze_workspace(workspace_path, detect_packages)
+    fingerprints = {package['path']: project_fingerprint(package['project_info']) for package in packages_info}
+    process_selected_rules(selected_rules, workspace_path, True, output_dir, detect_packages, priority,
+                           merge_similar, use_cache, packages_info, profile)
+    
+    watcher = ProjectWatcher(workspace_path, IGNORED_DIRS, [output_dir])
+    # 配置文件变化后，下一次重新生成使用新的配置
+    unsubscribe = on_config_change(lambda config, changed: logger.info(f"模型配置已更新（{', '.join(changed)}），下一次重新生成时生效"))
+    watch_config()
+    print("正在监听项目变化，按 Ctrl+C 退出...")
+    try:
+        for changed in watcher.changes():
+            emit_event("phase_start", phase="watch_change", files=len(changed) if changed is not None else None)
+            
+            # 清单文件变化可能新增或删除子包
+            if changed is None or any(os.path.basename(path) in PACKAGE_MANIFESTS for path in changed):
+                new_packages = (find_packages(workspace_path) if detect_packages else []) or ['.']
+                if new_packages != packages:
+                    logger.info(f"子包结构发生变化: {', '.join(new_packages)}")
+                    packages = new_packages
+                    changed = None
+            
+            if changed is None:
+                affected = set(packages)
+            else:
+                # 变化文件归属到最深的包含它的子包
+                affected = set()
+                for path in changed:
+                    owners = [p for p in packages if p == '.' or path == p or path.startswith(p + '/')]
+                    if owners:
+                        affected.add(max(owners, key=len))
+            
+            if packages == ['.']:
+                updated = [{"path": '.', "project_info": get_project_info(workspace_path)}] if affected else []
+            else:
+                updated = get_packages_info(workspace_path, packages, only=affected)
+            
+            stale = []
+            for package in updated:
+                fingerprint = project_fingerprint(package['project_info'])
+                if fingerprints.get(package['path']) != fingerprint:
+                    fingerprints[package['path']] = fingerprint
+                    stale.append(package)
+            for path in list(fingerprints):
+                if path not in packages:
+                    del fingerprints[path]
+            
+            if not stale:
+                logger.info(f"检测到{len(changed) if changed is not None else '大量'}个文件变化，项目指纹未变化，无需重新生成")
+                emit_event("phase_end", phase="watch_change", regenerated=[])
+                continue
+            
+            logger.info(f"项目指纹发生变化，重新生成规则: {', '.join(package['path'] for package in stale)}")
+            emit_event("phase_end", phase="watch_change", regenerated=[package['path'] for package in stale])
+            process_selected_rules(selected_rules, workspace_path, True, output_dir, detect_packages, priority,
+                                   merge_similar, use_cache, stale, profile)
+    except KeyboardInterrupt:
+        print("\n已停止监听")
+    finally:
+        unsubscribe()
+        watcher.close()
+
+def plan_selected_rules(selected_rules, workspace_path, detect_packages=True, use_cache=True, profile=None,
+                        packages_info=None):
+    """
+    执行计划（--plan）：不调用模型、不写入任何文件，预估处理选中规则所需的请求数、token数、费用和耗时
+    
+    输入token数按实际使用的系统提示词、项目信息和convert_to_markdown输出离线估算；
+    缓存命中按当前缓存内容判断，源规则小幅修改时按增量生成（差异加上一次的生成结果）估算；
+    耗时按规则逐条处理、分块并发以及限流配置估算
+    
+    @param packages_info - 已分析好的项目信息，为空时重新分析工作区
+    @return dict - {"items": 每条规则每个子包的预估, "totals": 汇总}
+    """
+    # 使用load_config而不是get_model_config，配置不完整时也不提示输入
+    config = load_config()
+    if packages_info is None:
+        packages_info = analyze_workspace(workspace_path, detect_packages)
+    cache = ResponseCache()
+    versions = ResponseCache(VERSIONS_DIR)
+    stats = get_endpoint_stats()
+    
+    items = []
+    for rule in selected_rules:
+        rule_data = prep_rule_data(rule)
+        rule_content = rule_data.get('content', '- 没有提供规则内容')
+        rule_config = get_profile_config(config, select_profile(config, rule_data, len(rule_content), profile))
+        chunks = split_rule_content(rule_content)
+        
+        # 首个token延迟取最快端点的历史平均值，没有记录时使用默认对冲等待时间
+        latencies = [stats.stats.get(endpoint_key(endpoint), {}).get('ewma') for endpoint in get_endpoints(rule_config)]
+        first_token = min([latency for latency in latencies if latency] or [HEDGE_DEFAULT_DELAY])
+        
+        for package in packages_info:
+            key = cache_key(rule_content, project_fingerprint(package['project_info']), rule_config.get('model_name'))
+            cached = use_cache and cache.contains(key)
+            
+            # 上一次生成后源规则只做了小幅修改时按增量生成估算
+            patch_diff = None
+            if use_cache and not cached:
+                previous = versions.entry(cache_key(rule_data.get('slug', rule_data.get('name')),
+                                                    project_fingerprint(package['project_info']),
+                                                    rule_config.get('model_name')))
+                if previous is not None and previous.get("source") != rule_content:
+                    diff, changed = source_diff(previous.get("source", ''), rule_content)
+                    if diff_worth_patching(rule_content, changed):
+                        patch_diff = (diff, [tuple(rule) for rule in previous["rules"]])
+            
+            input_tokens = output_tokens = reserved_tokens = requests_count = 0
+            chunk_seconds = []
+            if patch_diff is not None:
+                diff, prior_rules = patch_diff
+                system_prompt, user_prompt = build_patch_prompts(diff, prior_rules, package['project_info'])
+                input_tokens = count_message_tokens([
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ])
+                # 只有受修改影响的规则需要重新输出
+                output_tokens = min(len(prior_rules) + 1, expected_rule_count(diff)) * TOKENS_PER_RULE
+                reserved_tokens = patch_output_tokens(prior_rules, rule_config)
+                requests_count = 1
+                chunk_seconds.append(first_token + output_tokens / PLAN_OUTPUT_TOKENS_PER_SECOND)
+            for chunk in ([] if patch_diff is not None else chunks):
+                markdown = convert_to_markdown(chunk)
+                system_prompt, user_prompt = build_prompts(markdown, package['project_info'])
+                chunk_input = count_message_tokens([
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ])
+                chunk_output = expected_rule_count(markdown, stream_limits(rule_config)[0]) * TOKENS_PER_RULE
+                max_tokens = estimate_output_tokens(markdown, rule_config)
+                # 预计输出超过max_tokens时需要续写
+                chunk_requests = -(-chunk_output // max_tokens)
+                
+                input_tokens += chunk_input * chunk_requests
+                output_tokens += chunk_output
+                reserved_tokens += max_tokens * chunk_requests
+                requests_count += chunk_requests
+                chunk_seconds.append(chunk_requests * first_token + chunk_output / PLAN_OUTPUT_TOKENS_PER_SECOND)
+            
+            # 分块按CHUNK_WORKERS并发，耗时近似为按并发度分组后各组最慢分块之和
+            chunk_seconds.sort(reverse=True)
+            seconds = sum(chunk_seconds[::CHUNK_WORKERS])
+            
+            cost = (input_tokens * float(rule_config.get('input_price_per_1k') or 0)
+                    + output_tokens * float(rule_config.get('output_price_per_1k') or 0)) / 1000
+            items.append({
+                "rule": rule_data.get('slug', rule_data.get('name')),
+                "package": package['path'],
+                "profile": rule_config.get('profile'),
+                "model": rule_config.get('model_name'),
+                "chunks": len(chunks),
+                "cached": cached,
+                "patch": patch_diff is not None,
+                "requests": 0 if cached else requests_count,
+                "input_tokens": 0 if cached else input_tokens,
+                "output_tokens": 0 if cached else output_tokens,
+                "reserved_tokens": 0 if cached else reserved_tokens,
+                "cost": 0.0 if cached else cost,
+                "seconds": 0.0 if cached else seconds,
+                "priced": bool(rule_config.get('input_price_per_1k') or rule_config.get('output_price_per_1k'))
+            })
+    
+    totals = {field: sum(item[field] for item in items)
+              for field in ("requests", "input_tokens", "output_tokens", "reserved_tokens", "cost", "seconds")}
+    totals["cache_hits"] = sum(1 for item in items if item["cached"])
+    totals["patches"] = sum(1 for item in items if item["patch"])
+    totals["priced"] = any(item["priced"] for item in items)
+    
+    # 规则逐条处理，总耗时至少为各规则耗时之和，并受请求数和token数限额约束
+    lower_bounds = [totals["seconds"]]
+    if config.get('rpm_limit'):
+        lower_bounds.append(totals["requests"] / float(config['rpm_limit']) * 60)
+    if config.get('tpm_limit'):
+        lower_bounds.append((totals["input_tokens"] + totals["reserved_tokens"]) / float(config['tpm_limit']) * 60)
+    totals["seconds"] = max(lower_bounds)
+    
+    return {"items": items, "totals": totals}
+
+def print_plan(plan):
+    """
+    打印执行计划
+    """
+    print(f"\n{'规则':<32}{'子包':<16}{'模型':<20}{'请求':>6}{'输入token':>12}{'输出token':>12}{'耗时':>8}")
+    print("-" * 106)
+    for item in plan["items"]:
+        model = item["model"] if not item["profile"] else f"{item['profile']}:{item['model']}"
+        if item["cached"]:
+            print(f"{str(item['rule'])[:30]:<32}{item['package'][:14]:<16}{str(model)[:18]:<20}{'命中缓存':>6}")
+            continue
+        print(f"{str(item['rule'])[:30]:<32}{item['package'][:14]:<16}{str(model)[:18]:<20}{item['requests']:>6}"
+              f"{item['input_tokens']:>12}{item['output_tokens']:>12}{item['seconds']:>7.0f}s")
+    print("-" * 106)
+    totals = plan["totals"]
+    print(f"模型请求: {totals['requests']}次（缓存命中{totals['cache_hits']}项，增量生成{totals['patches']}项）")
+    print(f"输入token: 约{totals['input_tokens']}，输出token: 约{totals['output_tokens']}（预留max_tokens合计{totals['reserved_tokens']}）")
+    if totals["priced"]:
+        print(f"预计费用: {totals['cost']:.4f}")
+    else:
+        print("预计费用: 未配置价格（config.json中的input_price_per_1k/output_price_per_1k）")
+    print(f"预计耗时: 约{totals['seconds']:.0f}秒")
+    print("以上为离线估算，未调用模型，也未写入任何文件")
+
+def project_terms(packages_info):
+    """
+    把项目特征（框架、实际使用的库、声明的依赖和主要语言）转换为带权重的规则标签，用于推荐规则
+    
+    @return dict - {归一化的标签: 权重}，同一标签取各来源中的最大权重
+    """
+    weights = {}
+    
+    def add(value, weight):
+        name = normalize_term(value)
+        terms = {name, name.replace('.', '')}
+        # 带作用域的npm包（例如@nestjs/core）同时使用作用域名和包名
+        if name.startswith('@') and '/' in name:
+            terms.update(name[1:].split('/', 1))
+        terms.update([PREFETCH_TERM_ALIASES[term] for term in terms if term in PREFETCH_TERM_ALIASES])
+        for term in terms:
+            if term:
+                weights[term] = max(weights.get(term, 0), weight)
+    
+    for package in packages_info:
+        project_info = package['project_info']
+        for hint in project_info['framework_hints']:
+            add(hint, PREFETCH_WEIGHTS["framework"])
+        for item in project_info.get('library_usage') or []:
+            add(item['name'], PREFETCH_WEIGHTS["library"])
+        for dependency in project_info.get('dependencies') or []:
+            add(dependency, PREFETCH_WEIGHTS["dependency"])
+        for item in project_info['file_types']:
+            language = PREFETCH_EXTENSION_TERMS.get(item['extension'])
+            if language:
+                add(language, PREFETCH_WEIGHTS["language"])
+    return weights
+
+def install_cancel_handlers():
+    """
+    把SIGTERM/SIGHUP转换为KeyboardInterrupt，使长时间运行的后台任务能在工作区关闭时正常清理后退出；
+    父进程（VSCode扩展宿主）意外退出时同样结束
+    """
+    def on_signal(signum, frame):
+        raise KeyboardInterrupt
+    
+    for name in ('SIGTERM', 'SIGHUP'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), on_signal)
+    
+    if os.name == 'nt':
+        return
+    parent = os.getppid()
+    
+    def watch_parent():
+        while os.getppid() == parent:
+            time.sleep(PARENT_CHECK_INTERVAL)
+        logger.info("父进程已退出，停止后台任务")
+        # 使用真实信号而不是interrupt_main，阻塞在网络读取或队列上的主线程也能被唤醒
+        os.kill(os.getpid(), signal.SIGTERM)
+    
+    threading.Thread(target=watch_parent, name="parent-watch", daemon=True).start()
+
+def prefetch_rules(rules, workspace_path, limit=None, max_tokens=None, detect_packages=True, profile=None):
+    """
+    预生成（--prefetch）：根据项目特征推荐最可能被选择的规则，以后台优先级生成定制结果并只写入缓存，
+    之后点击这些规则时直接使用缓存（或等待正在进行的预生成），不再从头等待模型
+    
+    按执行计划的预估值控制花费：已缓存的规则不计入，累计预估token数或费用超过上限的规则被跳过。
+    收到SIGTERM（工作区关闭时扩展结束进程）或Ctrl+C时停止，未完成的生成不会写入缓存
+    
+    @param limit - 推荐的规则数量，为空时使用配置中的prefetch_count
+    @param max_tokens - 预估token数（输入加输出）上限，为空时使用配置中的prefetch_max_tokens
+    @return dict - 预生成统计
+    """
+    stats = {"recommended": [], "generated": 0, "cached": 0, "over_budget": 0, "failed": 0,
+             "estimated_tokens": 0, "estimated_cost": 0.0, "cancelled": False}
+    
+    # 后台任务不能交互式提示输入配置
+    config = load_config()
+    if not (config.get('model_url') or config.get('endpoints')) or not config.get('api_key'):
+        logger.warning("模型配置不完整，跳过预生成")
+        return stats
+    limit = limit or int(config.get('prefetch_count') or 0)
+    max_tokens = int(config.get('prefetch_max_tokens') or 0) if max_tokens is None else max_tokens
+    max_cost = float(config.get('prefetch_max_cost') or 0)
+    
+    install_cancel_handlers()
+    try:
+        packages_info = analyze_workspace(workspace_path, detect_packages)
+        recommended = RuleIndex(rules).recommend(project_terms(packages_info), limit)
+        stats["recommended"] = [rule.get('slug', rule.get('name')) for rule, _ in recommended]
+        if not recommended:
+            logger.info("没有与项目特征匹配的规则，无需预生成")
+            return stats
+        scored = ', '.join(f"{slug}({score})" for slug, (_, score) in zip(stats["recommended"], recommended))
+        logger.info(f"推荐预生成的规则: {scored}")
+        
+        # 按推荐顺序在花费上限内选择需要生成的规则和子包
+        selected = [prep_rule_data(rule) for rule, _ in recommended]
+        plan = plan_selected_rules(selected, workspace_path, detect_packages, True, profile, packages_info)
+        jobs = []
+        for item in plan["items"]:
+            if item["cached"]:
+                stats["cached"] += 1
+                continue
+            tokens = item["input_tokens"] + item["output_tokens"]
+            if (max_tokens and stats["estimated_tokens"] + tokens > max_tokens) or \
+                    (max_cost and item["priced"] and stats["estimated_cost"] + item["cost"] > max_cost):
+                stats["over_budget"] += 1
+                logger.info(f"超出预生成花费上限，跳过: {item['rule']}[{item['package']}]")
+                continue
+            stats["estimated_tokens"] += tokens
+            stats["estimated_cost"] += item["cost"]
+            jobs.append(item)
+        
+        packages = {package['path']: package for package in packages_info}
+        rule_data_by_id = {rule_data.get('slug', rule_data.get('name')): rule_data for rule_data in selected}
+        cache = ResponseCache()
+        versions = ResponseCache(VERSIONS_DIR)
+        for item in jobs:
+            rule_data = rule_data_by_id[item["rule"]]
+            rule_content = rule_data.get('content', '- 没有提供规则内容')
+            rule_config = get_profile_config(config, select_profile(config, rule_data, len(rule_content), profile))
+            logger.info(f"预生成规则: {item['rule']}[{item['package']}]")
+            outcome = sum(1 for _ in generate_package_rules(rule_data, split_rule_content(rule_content),
+                                                           packages[item["package"]], rule_config, PRIORITY_BACKGROUND,
+                                                           cache, True, versions))
+            if outcome:
+                stats["generated"] += 1
+            else:
+                stats["failed"] += 1
+    except KeyboardInterrupt:
+        stats["cancelled"] = True
+        logger.info("预生成已取消")
+    
+    stats["estimated_cost"] = round(stats["estimated_cost"], 6)
+    logger.info(f"预生成完成: 生成{stats['generated']}项，已缓存{stats['cached']}项，超出上限跳过{stats['over_budget']}项"
+                f"{'（已取消）' if stats['cancelled'] else ''}")
+    return stats
+
+def print_batch_progress(name, progress, elapsed=None, eta=None):
+    """输出批次进度"""
+    message = (f"批次 {name}: 完成{progress['done']}/{progress['total']}，失败{progress['failed']}，"
+               f"进行中{progress['running']}，待处理{progress['pending']}，已生成{progress['rules']}条规则")
+    if elapsed is not None:
+        message += f"，用时{elapsed:.0f}秒"
+    if eta is not None:
+        message += f"，预计剩余{eta:.0f}秒"
+    logger.info(message)
+
+def run_batch(rules, workspace_path, name, output_dir, detect_packages=True, workers=None, use_cache=True,
+              profile=None, retry_failed=False, merge_similar=True):
+    """
+    批量任务（--batch）：为大量规则（例如整个规则目录）定制生成，任务状态保存在 ~/.cursor-rules/jobs.db 中
+    
+    每条源规则在每个子包上是一个任务，多个任务以后台优先级并发执行。每生成一条规则立即写入检查点，
+    进程被中断或崩溃后用相同的批次名称再次运行即可继续：已完成的任务不再生成，未完成的任务只请求剩余的规则。
+    失败的任务按退避时间重试，超过最大尝试次数后标记为失败。任务完成后立即写入规则文件，
+    全部任务结束后合并整个批次中的相似规则
+    
+    @param rules - 本次加入批次的规则，已在批次中的任务保持原有的源规则内容和状态
+    @param name - 批次名称，同一工作区内唯一
+    @param workers - 并发执行的任务数，为空时使用配置中的batch_workers
+    @param retry_failed - 是否把此前失败的任务重新排队
+    @param merge_similar - 全部任务结束后是否合并相似规则
+    @return dict | None - 批次进度（见JobQueue.progress），模型配置不完整时返回None
+    """
+    # 批量任务通常无人值守，不能交互式提示输入配置
+    config = load_config()
+    if not (config.get('model_url') or config.get('endpoints')) or not config.get('api_key'):
+        logger.error("模型配置不完整，无法执行批量任务")
+        emit_event("error", stage="batch", message="模型配置不完整", recoverable=False)
+        return None
+    workers = max(1, workers or int(config.get('batch_workers') or 1))
+    max_attempts = max(1, int(config.get('batch_max_attempts') or 1))
+    interval = float(config.get('batch_progress_interval') or 0)
+    
+    install_cancel_handlers()
+    queue = JobQueue()
+    batch_id = writer = progress = None
+    in_flight = {}
+    stop = threading.Event()
+    try:
+        packages_info = analyze_workspace(workspace_path, detect_packages)
+        packages = {package['path']: package for package in packages_info}
+        selected = [prep_rule_data(rule) for rule in rules]
+        batch_id, added = queue.open_batch(name, workspace_path, [
+            (rule_data.get('slug', rule_data.get('name')), package['path'], rule_data)
+            for rule_data in selected for package in packages_info
+        ])
+        recovered = queue.recover(batch_id)
+        requeued = queue.retry_failed(batch_id) if retry_failed else 0
+        progress = queue.progress(batch_id)
+        logger.info(f"批次 {name}: 共{progress['total']}个任务，新增{added}个，已完成{progress['done']}个，"
+                    f"恢复中断的任务{recovered}个，重试失败的任务{requeued}个，并发数{workers}")
+        finished_before = progress['done'] + progress['failed']
+        
+        os.makedirs(output_dir, exist_ok=True)
+        writer = RuleWriter(output_dir)
+        cache = ResponseCache()
+        versions = ResponseCache(VERSIONS_DIR)
+        
+        def run_job(job):
+            rule_data = job["rule"]
+            package = packages.get(job["package"])
+            if package is None:
+                queue.fail(job["id"], f"工作区中已不存在子包: {job['package']}", job["attempts"])
+                return
+            rule_content = rule_data.get('content', '- 没有提供规则内容')
+            # 每个任务开始时取最新配置，运行中修改API密钥或模型不必重启批次（配置未变化时直接使用缓存）
+            current = load_config()
+            rule_config = get_profile_config(current, select_profile(current, rule_data, len(rule_content), profile))
+            if job["checkpoint"]:
+                logger.info(f"从检查点继续: {job['rule_id']}[{job['package']}]，已生成{len(job['checkpoint'])}条规则")
+            
+            outcome = {"complete": True}
+            for rule_tuple in generate_package_rules(rule_data, split_rule_content(rule_content), package, rule_config,
+                                                     PRIORITY_BACKGROUND, cache, use_cache, versions, outcome,
+                                                     job["checkpoint"]):
+                if stop.is_set():
+                    return
+                if rule_tuple[0] != ERROR_RULE_NAME:
+                    queue.checkpoint(job["id"], rule_tuple)
+            if stop.is_set():
+                return
+            
+            if not outcome["complete"]:
+                retry = queue.fail(job["id"], outcome.get("error") or "生成不完整", max_attempts)
+                logger.warning(f"任务未完成: {job['rule_id']}[{job['package']}]（第{job['attempts']}次尝试）"
+                               f"{'，稍后重试' if retry else '，已达到最大尝试次数'}")
+                emit_event("batch_job", batch=name, rule=job["rule_id"], package=job["package"],
+                           status="retry" if retry else "failed", attempts=job["attempts"])
+                return
+            
+            results = queue.results(job["id"])
+            if not results:
+                # 模型没有返回任何规则时保存原始规则
+                results = [(rule_data.get('name', 'unknown_rule.mdc'), rule_data.get('description', 'Auto-generated rule'),
+                            rule_data.get('globs', '**/*'), rule_data.get('content', '- No rule content'))]
+            for rule_tuple in results:
+                writer.submit(*package_rule(rule_tuple, job["package"]))
+            queue.complete(job["id"])
+            emit_event("batch_job", batch=name, rule=job["rule_id"], package=job["package"], status="done",
+                       rules=len(results), attempts=job["attempts"])
+        
+        def worker():
+            while not stop.is_set():
+                job = queue.claim(batch_id)
+                if job is None:
+                    wakeup = queue.next_wakeup(batch_id)
+                    if wakeup is None:
+                        return
+                    # 只剩等待重试的任务
+                    stop.wait(min(max(0.0, wakeup - time.time()), PARENT_CHECK_INTERVAL))
+                    continue
+                in_flight[job["id"]] = job
+                try:
+                    run_job(job)
+                except Exception as e:
+                    if not stop.is_set():
+                        logger.error(f"任务出错: {job['rule_id']}[{job['package']}]: {str(e)}")
+                        queue.fail(job["id"], e, max_attempts)
+                finally:
+                    in_flight.pop(job["id"], None)
+        
+        started = last_report = time.time()
+        
+        def report():
+            progress = queue.progress(batch_id)
+            elapsed = time.time() - started
+            finished = progress['done'] + progress['failed'] - finished_before
+            remaining = progress['pending'] + progress['running']
+            eta = remaining * elapsed / finished if finished and remaining else None
+            print_batch_progress(name, progress, elapsed, eta)
+            emit_event("batch_progress", batch=name, elapsed=round(elapsed, 3),
+                       eta=round(eta, 1) if eta is not None else None, **progress)
+            return progress
+        
+        threads = [threading.Thread(target=worker, name=f"batch-worker-{i}", daemon=True) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        # 主线程只等待和报告进度，以便及时响应Ctrl+C和SIGTERM
+        while any(thread.is_alive() for thread in threads):
+            next(thread for thread in threads if thread.is_alive()).join(min(interval or 1.0, 1.0))
+            if interval and time.time() - last_report >= interval:
+                last_report = time.time()
+                report()
+        # 合并阶段需要覆盖和删除已写入的文件
+        writer.close()
+        writer = None
+        progress = report()
+        
+        # 合并整个批次（包括之前的运行）生成的相似规则
+        generated = [package_rule(rule_tuple, package_path) for package_path, rule_tuple in queue.batch_results(batch_id)]
+        if merge_similar and not progress['pending'] and not progress['running'] and len(generated) > 1:
+            with output_dir_lock(output_dir):
+                consolidate_generated_rules(generated, output_dir)
+    except KeyboardInterrupt:
+        stop.set()
+        # 进行中的任务放回队列，已写入的检查点保留
+        for job_id in list(in_flight):
+            queue.release(job_id)
+        progress = queue.progress(batch_id) if batch_id is not None else None
+        logger.info(f"批次已中断，再次运行 --batch {name} 将从检查点继续")
+        if progress is not None:
+            progress["cancelled"] = True
+    finally:
+        if writer is not None:
+            writer.close()
+        queue.close()
+    return progress
+
+def print_batch_status(name, workspace_path):
+    """输出批次进度和失败任务的错误信息（--batch-status）"""
+    queue = JobQueue()
+    try:
+        batch_id = queue.find_batch(name, workspace_path)
+        if batch_id is None:
+            print(f"错误: 当前工作区没有名为 {name} 的批次")
+            return None
+        progress = queue.progress(batch_id)
+        print(f"批次 {name}: 共{progress['total']}个任务，完成{progress['done']}个，失败{progress['failed']}个，"
+              f"进行中{progress['running']}个，待处理{progress['pending']}个，已生成{progress['rules']}条规则")
+        for job in queue.jobs(batch_id, "failed"):
+            print(f"  失败: {job['rule_id']}[{job['package']}]（尝试{job['attempts']}次）: {job['last_error']}")
+        emit_event("batch_progress", batch=name, **progress)
+        return progress
+    finally:
+        queue.close()
+
 def prep_rule_data(rule):
     """
     预处理规则数据，确保格式统一
@@ -681,16 +1946,53 @@ def main():
     parser = argparse.ArgumentParser(description='本地规则选择器和生成工具')
     # 添加工作区位置参数（可选）
     parser.add_argument('workspace', nargs='?', default='.', help='项目工作区路径')
-    parser.add_argument('--rules-json', default='rules_data/rules.json', help='规则数据JSON文件路径')
+    parser.add_argument('--rules-json', help='规则库（.pack）或规则数据JSON文件路径，默认使用随扩展分发的rules_data/rules.pack（叠加覆盖层）')
     parser.add_argument('--workspace', dest='workspace_named', help='项目工作区路径（与位置参数二选一）')
-    parser.add_argument('--selected-rule', help='直接选择指定规则(通过slug)')
+    parser.add_argument('--selected-rule', nargs='+',
+                        help='直接选择规则：多个slug（空格或逗号分隔），或tag:/lib:条件及AND/OR/NOT表达式，例如 "tag:react AND NOT lib:vue"')
     parser.add_argument('--output-dir', help='自定义输出目录')
     parser.add_argument('--debug', action='store_true', help='启用调试模式，显示更多日志信息')
+    parser.add_argument('--single-package', action='store_true', help='将整个工作区视为单个项目，不检测monorepo子包')
+    parser.add_argument('--events', choices=EVENT_FORMATS, help='以机器可读格式（NDJSON）在标准输出实时输出进度事件')
+    parser.add_argument('--analyze-globs', action='store_true', help='分析已生成规则的globs匹配效果并给出收窄建议')
+    parser.add_argument('--no-merge', action='store_true', help='不合并相似的生成规则')
+    parser.add_argument('--priority', choices=list(PRIORITIES), default='interactive', help='模型调用优先级，后台批量任务请使用background')
+    parser.add_argument('--watch', action='store_true', help='生成后持续监听项目变化，只重新生成受影响的规则（需要配合--selected-rule）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用已缓存的生成结果')
+    parser.add_argument('--profile', help='为所有规则指定模型配置（config.json中profiles的名称），不使用路由规则')
+    parser.add_argument('--plan', action='store_true', help='只预估请求数、token数、费用和耗时，不调用模型也不写入文件')
+    parser.add_argument('--prefetch', nargs='?', type=int, const=0, metavar='N',
+                        help='按项目特征推荐N条规则，以后台优先级预先生成并写入缓存（不写入规则文件），省略N时使用配置中的prefetch_count')
+    parser.add_argument('--prefetch-max-tokens', type=int, metavar='TOKENS', help='预生成的预估token数上限，0表示不限制')
+    parser.add_argument('--scan-mode', choices=SCAN_MODES, default='auto',
+                        help='项目文件统计方式：auto在文件数超过上限时改为近似统计，approximate始终随机采样目录估计')
+    parser.add_argument('--ingest', nargs='+', metavar='DIR', help='把这些目录下已有的.mdc规则文件批量导入规则数据文件（按内容去重），使用规则库时导入到用户覆盖层')
+    parser.add_argument('--build-store', nargs='+', metavar='JSON', help='由这些JSON规则列表（同slug以后面的为准）构建规则库，输出到--rules-json指定的.pack文件或默认规则库')
+    parser.add_argument('--batch', metavar='NAME',
+                        help='以可恢复的批量任务生成规则（默认全部规则，可配合--selected-rule），中断后用相同名称再次运行即从检查点继续')
+    parser.add_argument('--batch-workers', type=int, metavar='N', help='批量任务的并发数，默认使用配置中的batch_workers')
+    parser.add_argument('--batch-retry-failed', action='store_true', help='把批次中此前失败的任务重新排队')
+    parser.add_argument('--batch-status', metavar='NAME', help='查看批量任务的进度和失败任务')
+    parser.add_argument('--query', action='store_true',
+                        help='以JSON输出一页规则（只包含--fields指定的字段），可配合--selected-rule筛选')
+    parser.add_argument('--fields', default=','.join(DEFAULT_FIELDS), help='--query返回的字段，逗号分隔')
+    parser.add_argument('--sort', default='title', help='--query的排序键（slug或title，前缀-表示降序）')
+    parser.add_argument('--cursor', help='--query上一页返回的next_cursor')
+    parser.add_argument('--limit', type=int, default=DEFAULT_PAGE_SIZE, help='--query每页的规则数')
+    parser.add_argument('--search', help='--query在slug、标题和标签中搜索的文本')
+    parser.add_argument('--get-rule', metavar='SLUG', help='以JSON输出单条规则的完整内容')
+    parser.add_argument('--serve', action='store_true', help='常驻查询模式：从标准输入逐行读取JSON请求，向标准输出逐行写入响应')
     args = parser.parse_args()
     
+    # 启用事件流后，标准输出只输出事件
+    if args.events:
+        enable_events(args.events)
+    
     # 如果同时提供了位置参数和命名参数形式的workspace，优先使用命名参数
     workspace_path = os.path.abspath(args.workspace_named if args.workspace_named else args.workspace)
     
+    set_scan_mode(args.scan_mode)
+    
     # 设置调试模式
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
@@ -700,68 +2002,169 @@ def main():
     if not os.path.isdir(workspace_path):
         logger.error(f"工作区路径不存在或不是目录: {workspace_path}")
         print(f"错误: 工作区路径不存在或不是目录 - {workspace_path}")
+        emit_event("error", stage="startup", message=f"工作区路径不存在或不是目录: {workspace_path}", recoverable=False)
         return
     
     # 设置输出目录
     if args.output_dir:
         output_dir = os.path.abspath(args.output_dir)
         logger.info(f"使用指定的输出目录: {output_dir}")
-        # 确保目录存在
-        os.makedirs(output_dir, exist_ok=True)
+        # 确保目录存在（执行计划不写入任何文件）
+        if not args.plan:
+            os.makedirs(output_dir, exist_ok=True)
     else:
         # 默认输出目录
         output_dir = os.path.join(workspace_path, '.cursor', 'rules')
     
-    # 确保规则JSON文件存在
-    rules_json_path = os.path.join(workspace_path, args.rules_json) if not os.path.isabs(args.rules_json) else args.rules_json
+    # 分析已生成规则的globs，不需要加载规则数据
+    if args.analyze_globs:
+        print_glob_report(analyze_rules_globs(workspace_path, output_dir))
+        return
     
-    # 尝试多种可能的规则文件名，增强兼容性
-    if not os.path.exists(rules_json_path):
-        logger.debug(f"指定的规则数据文件不存在，尝试替代文件: {rules_json_path}")
-        
-        # 尝试替代文件名
-        alt_paths = [
-            os.path.join(os.path.dirname(rules_json_path), "rules.db.json"),
-            os.path.join(workspace_path, "rules_data", "rules.db.json"),
-            os.path.join(workspace_path, "rules.db.json")
-        ]
-        
-        for alt_path in alt_paths:
-            logger.debug(f"尝试替代路径: {alt_path}")
-            if os.path.exists(alt_path):
-                logger.info(f"使用替代规则数据文件: {alt_path}")
-                print(f"注意: 使用替代规则数据文件 - {alt_path}")
-                rules_json_path = alt_path
-                break
+    # 查看批量任务进度，不需要加载规则数据
+    if args.batch_status:
+        print_batch_status(args.batch_status, workspace_path)
+        return
+    
+    # 由JSON规则列表构建规则库，输出到--rules-json指定的.pack文件或默认规则库
+    if args.build_store:
+        store_path = args.rules_json if args.rules_json and args.rules_json.endswith('.pack') else DEFAULT_STORE
+        try:
+            stats = build_store_from_files(args.build_store, store_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"构建规则库失败: {str(e)}")
+            print(f"错误: 构建规则库失败 - {str(e)}")
+            return
+        print(f"规则库已写入 {store_path}: {stats['rules']}条规则，{stats['bodies']}份正文，"
+              f"{stats['raw_bytes']}字节压缩为{stats['store_bytes']}字节")
+        return
+    
+    # 未指定规则数据文件或指定的文件不存在时使用随扩展分发的规则库（叠加覆盖层）
+    if args.rules_json:
+        rules_json_path = args.rules_json if os.path.isabs(args.rules_json) else os.path.join(workspace_path, args.rules_json)
+    else:
+        rules_json_path = None
     
-    if not os.path.exists(rules_json_path):
-        logger.error(f"规则数据JSON文件不存在: {rules_json_path}")
-        print(f"错误: 规则数据文件不存在 - {rules_json_path}")
+    # 批量导入.mdc文件：规则库是只读的，导入到用户覆盖层；JSON规则数据文件不存在时新建
+    if args.ingest:
+        if rules_json_path and not is_store(rules_json_path):
+            target, base_catalog = rules_json_path, None
+        else:
+            target, base_catalog = USER_OVERLAY, resolve_catalog(rules_json_path)
+        try:
+            stats = ingest_mdc_files(args.ingest, target, base_catalog=base_catalog)
+        except (OSError, ValueError) as e:
+            logger.error(f"导入规则文件失败: {str(e)}")
+            print(f"错误: 导入规则文件失败 - {str(e)}")
+            emit_event("error", stage="ingest", message=str(e), recoverable=False)
+            return
+        print(f"导入完成: 找到{stats['found']}个.mdc文件，新增{stats['added']}条，更新{stats['updated']}条，"
+              f"跳过重复{stats['duplicates']}条、未变化{stats['unchanged']}个，目录共{stats['total']}条规则"
+              f"（{stats['seconds']}秒）")
+        emit_event("ingest", **stats)
+        return
+    
+    missing_path = rules_json_path
+    rules_json_path = resolve_catalog(rules_json_path)
+    if rules_json_path is None:
+        logger.error(f"规则数据文件不存在: {missing_path or DEFAULT_STORE}")
+        print(f"错误: 规则数据文件不存在 - {missing_path or DEFAULT_STORE}")
         print("请确保规则数据文件存在于以下位置之一:")
-        print(f"  - {args.rules_json}")
-        print(f"  - {os.path.join(workspace_path, 'rules_data', 'rules.json')}")
-        print(f"  - {os.path.join(workspace_path, 'rules_data', 'rules.db.json')}")
+        if missing_path:
+            print(f"  - {missing_path}")
+        print(f"  - {DEFAULT_STORE}")
+        emit_event("error", stage="startup", message=f"规则数据文件不存在: {missing_path or DEFAULT_STORE}", recoverable=False)
+        return
+    
+    # 常驻查询服务和分页查询只输出请求的字段，规则正文在请求时才解压，供扩展按需加载
+    if args.serve:
+        CatalogService(rules_json_path, lambda path: load_rules_from_json(path, with_content=False)).serve()
+        return
+    if args.query or args.get_rule:
+        query = CatalogQuery(load_rules_from_json(rules_json_path, with_content=False))
+        try:
+            if args.get_rule:
+                result = query.get(args.get_rule)
+                if result is None:
+                    raise ValueError(f"找不到规则: {args.get_rule}")
+            else:
+                result = query.page([field.strip() for field in args.fields.split(',') if field.strip()], args.sort,
+                                    args.cursor, args.limit, args.search,
+                                    ' '.join(args.selected_rule) if args.selected_rule else None)
+        except ValueError as e:
+            logger.error(str(e))
+            print(json.dumps({"error": str(e)}, ensure_ascii=False))
+            return
+        print(json.dumps(result, ensure_ascii=False))
         return
     
-    # 加载规则数据
-    rules = load_rules_from_json(rules_json_path)
+    # 加载规则数据（只解压最终用到的规则正文）
+    rules = load_rules_from_json(rules_json_path, with_content=False)
     if not rules:
         logger.error("未能加载任何规则数据")
         print("错误: 未能加载任何规则数据")
+        emit_event("error", stage="startup", message="未能加载任何规则数据", recoverable=False)
+        return
+    
+    # 后台预生成推荐规则
+    if args.prefetch is not None:
+        stats = prefetch_rules(hydrate_rules(rules), workspace_path, args.prefetch, args.prefetch_max_tokens, not args.single_package,
+                               args.profile)
+        print(f"预生成完成: 推荐{len(stats['recommended'])}条规则，生成{stats['generated']}项，已缓存{stats['cached']}项，"
+              f"超出花费上限跳过{stats['over_budget']}项{'，已取消' if stats['cancelled'] else ''}")
+        emit_event("prefetch", **stats)
+        return
+    
+    # 对整个规则目录执行批量任务
+    if args.batch and not args.selected_rule:
+        run_batch(hydrate_rules(rules), workspace_path, args.batch, output_dir, not args.single_package, args.batch_workers,
+                  not args.no_cache, args.profile, args.batch_retry_failed, not args.no_merge)
         return
     
     # 如果提供了选择规则
     if args.selected_rule:
-        # 处理单个选择规则
-        selected_rule = next((rule for rule in rules if rule.get('slug') == args.selected_rule), None)
+        expression = ' '.join(args.selected_rule)
+        try:
+            selected_rules, unresolved = RuleIndex(rules).select(expression)
+        except ValueError as e:
+            logger.error(str(e))
+            print(f"错误: {str(e)}")
+            emit_event("error", stage="select", message=str(e), recoverable=False)
+            return
         
-        if selected_rule:
-            logger.info(f"使用指定规则: {args.selected_rule}")
-            print(f"使用指定规则: {selected_rule.get('name', args.selected_rule)}")
-            process_selected_rules([selected_rule], workspace_path, True)
-        else:
-            logger.error(f"找不到指定规则: {args.selected_rule}")
-            print(f"错误: 找不到指定规则 - {args.selected_rule}")
+        # 找不到的slug给出最接近的候选
+        for term, suggestions in unresolved:
+            logger.error(f"找不到指定规则: {term}")
+            print(f"错误: 找不到指定规则 - {term}")
+            if suggestions:
+                print(f"  您是不是要找: {', '.join(suggestions)}")
+            emit_event("error", stage="select", message=f"找不到指定规则: {term}", rule=term,
+                       suggestions=suggestions, recoverable=True)
+        
+        if selected_rules:
+            hydrate_rules(selected_rules)
+            logger.info(f"使用指定规则: {expression}")
+            print(f"使用指定规则({len(selected_rules)}条): {', '.join(rule.get('slug', rule.get('name', '')) for rule in selected_rules)}")
+            if args.plan:
+                plan = plan_selected_rules(selected_rules, workspace_path, not args.single_package, not args.no_cache,
+                                           args.profile)
+                print_plan(plan)
+                emit_event("plan", **plan["totals"])
+            elif args.watch:
+                watch_workspace(selected_rules, workspace_path, output_dir, not args.single_package,
+                                PRIORITIES[args.priority], not args.no_merge, not args.no_cache, args.profile)
+            elif args.batch:
+                run_batch(selected_rules, workspace_path, args.batch, output_dir, not args.single_package,
+                          args.batch_workers, not args.no_cache, args.profile, args.batch_retry_failed,
+                          not args.no_merge)
+            else:
+                process_selected_rules(selected_rules, workspace_path, True, output_dir, not args.single_package,
+                                       PRIORITIES[args.priority], not args.no_merge, not args.no_cache,
+                                       profile=args.profile)
+        elif not unresolved:
+            logger.error(f"没有符合条件的规则: {expression}")
+            print(f"错误: 没有符合条件的规则 - {expression}")
+            emit_event("error", stage="select", message=f"没有符合条件的规则: {expression}", recoverable=False)
         return
 
     # 显示规则列表供用户选择
@@ -769,10 +2172,21 @@ def main():
     max_rules = display_rules_list(rules)
 
     # 用户选择规则
-    selected_rules = select_rules(rules, max_rules)
+    selected_rules = hydrate_rules(select_rules(rules, max_rules))
 
     # 处理选中的规则
-    process_selected_rules(selected_rules, workspace_path, True)
+    if args.plan:
+        plan = plan_selected_rules(selected_rules, workspace_path, not args.single_package, not args.no_cache, args.profile)
+        print_plan(plan)
+        emit_event("plan", **plan["totals"])
+        return
+    if args.watch:
+        watch_workspace(selected_rules, workspace_path, output_dir, not args.single_package,
+                        PRIORITIES[args.priority], not args.no_merge, not args.no_cache, args.profile)
+    else:
+        process_selected_rules(selected_rules, workspace_path, True, output_dir, not args.single_package,
+                               PRIORITIES[args.priority], not args.no_merge, not args.no_cache,
+                               profile=args.profile)
 
     logger.info("规则选择和生成过程完成")
     print("\n任务完成！感谢使用Cursor规则生成器。")
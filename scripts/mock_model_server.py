@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 本地模拟模型服务：兼容OpenAI chat completions流式接口，返回固定格式的规则，
+用于在不调用真实模型的情况下测试批量任务、续写、重试和中断恢复
+
+@example
+    python scripts/mock_model_server.py --port 8765 --rules 4 --token-delay 0.05 --fail-rate 0.2
+    # 在 ~/.cursor-rules/config.json 中设置 "model_url": "http://127.0.0.1:8765/v1/chat/completions"，api_key任意
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CHUNK_CHARS = 24  # 每个SSE事件包含的字符数
+
+# 续写请求中列出已生成规则的部分，见local_rules_selector.continuation_messages
+_GENERATED_NAMES = re.compile(r"不要重复已生成的规则（(.*?)）")
+
+def build_rules(count, skip=()):
+    """
+    生成模拟规则，续写请求中已生成的规则被跳过
+
+    @param count - 完整输出的规则数
+    @param skip - 已生成的规则名称
+    @return List[dict]
+    """
+    rules = []
+    for i in range(count):
+        name = f"mock-rule-{i + 1}"
+        if name in skip:
+            continue
+        rules.append({
+            "name": name,
+            "glob_pattern": "**/*.{ts,tsx,js,jsx,py}",
+            "description": f"模拟规则 {i + 1}",
+            "content": f"- 模拟条目 {i + 1}.1\n- 模拟条目 {i + 1}.2"
+        })
+    return rules
+
+def make_handler(options):
+    rng = random.Random(options.seed)
+    rng_lock = threading.Lock()
+    stats = {"requests": 0, "failures": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def send_event(self, payload):
+            self.wfile.write(b"data: " + payload.encode('utf-8') + b"\n\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            with rng_lock:
+                stats["requests"] += 1
+                fail = rng.random() < options.fail_rate
+                if fail:
+                    stats["failures"] += 1
+            if fail:
+                payload = json.dumps({"error": {"message": "模拟的服务端错误"}}, ensure_ascii=False).encode('utf-8')
+                self.send_response(500)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                logger.info(f"第{stats['requests']}个请求: 返回模拟错误")
+                return
+
+            messages = body.get("messages") or []
+            last = messages[-1].get("content", '') if messages else ''
+            match = _GENERATED_NAMES.search(last)
+            skip = {name.strip() for name in match.group(1).split(',')} if match else set()
+            text = json.dumps(build_rules(options.rules, skip), ensure_ascii=False)
+            logger.info(f"第{stats['requests']}个请求: {len(messages)}条消息，跳过已生成的{len(skip - {'无'})}条规则")
+
+            time.sleep(options.delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            try:
+                for start in range(0, len(text), CHUNK_CHARS):
+                    self.send_event(json.dumps({"choices": [{"delta": {"content": text[start:start + CHUNK_CHARS]},
+                                                             "finish_reason": None}]}, ensure_ascii=False))
+                    if options.token_delay:
+                        time.sleep(options.token_delay)
+                self.send_event(json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}]}))
+                self.send_event("[DONE]")
+            except (BrokenPipeError, ConnectionResetError):
+                logger.info("客户端已断开连接")
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟模型服务（OpenAI兼容的流式接口）')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--rules', type=int, default=3, help='每次完整输出的规则数')
+    parser.add_argument('--delay', type=float, default=0.0, help='返回第一个token前的延迟（秒）')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='每个SSE事件之间的延迟（秒），用于测试中途中断')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='返回HTTP 500的请求比例（0-1）')
+    parser.add_argument('--seed', type=int, default=0, help='模拟错误的随机种子')
+    options = parser.parse_args()
+
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(options))
+    logger.info(f"模拟模型服务已启动: http://{options.host}:{options.port}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 多端点AI模型客户端：按延迟路由到最快的健康端点，首个token超时后发送对冲请求
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import threading
+
+import requests
+
+# 导入配置管理模块
+try:
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+# 端点延迟统计文件，跨进程保留延迟估计
+STATS_FILE = os.path.join(CONFIG_DIR, "endpoint_stats.json")
+
+CONNECT_TIMEOUT = 10       # 建立连接超时时间（秒）
+READ_TIMEOUT = 60          # 两次数据之间的最长等待时间（秒）
+REQUEST_DEADLINE = 120     # 单次生成的整体截止时间（秒）
+HEDGE_DEFAULT_DELAY = 8.0  # 延迟样本不足时的对冲等待时间（秒）
+HEDGE_MIN_DELAY = 0.5      # 对冲等待时间下限（秒）
+HEDGE_MIN_SAMPLES = 5      # 使用百分位阈值所需的最少样本数
+LATENCY_WINDOW = 50        # 每个端点保留的延迟样本数
+EWMA_ALPHA = 0.3           # 延迟滑动平均的平滑系数
+UNHEALTHY_COOLDOWN = 30    # 端点失败后被视为不健康的时长（秒）
+STATS_LOCK_TIMEOUT = 5     # 保存端点统计时等待文件锁的最长时间（秒）
+
+class ModelRequestError(Exception):
+    """所有端点均请求失败"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class ModelDeadlineExceeded(ModelRequestError):
+    """超过整体截止时间仍未完成生成"""
+
+def get_endpoints(config):
+    """
+    从配置中获取端点列表，主端点（model_url）排在最前
+
+    endpoints中的每一项可以是URL字符串，也可以是包含model_url/api_key/model_name的字典，
+    缺少的api_key和model_name沿用主配置
+    """
+    endpoints = []
+    if config.get('model_url'):
+        endpoints.append({
+            "model_url": config.get('model_url'),
+            "api_key": config.get('api_key'),
+            "model_name": config.get('model_name')
+        })
+
+    for item in config.get('endpoints') or []:
+        if isinstance(item, str):
+            item = {"model_url": item}
+        endpoint = {
+            "model_url": item.get('model_url') or item.get('url'),
+            "api_key": item.get('api_key', config.get('api_key')),
+            "model_name": item.get('model_name', config.get('model_name'))
+        }
+        if endpoint["model_url"] and endpoint not in endpoints:
+            endpoints.append(endpoint)
+
+    return endpoints
+
+def endpoint_key(endpoint):
+    """端点统计使用的键"""
+    return f"{endpoint['model_url']}|{endpoint['model_name']}"
+
+def _stats_entry(stats, key):
+    entry = stats.setdefault(key, {})
+    entry.setdefault("ewma", None)
+    entry.setdefault("samples", [])
+    entry.setdefault("failures", 0)
+    entry.setdefault("unhealthy_until", 0)
+    return entry
+
+def _apply_change(entry, kind, value):
+    """把一次记录（延迟样本或失败）应用到端点统计上"""
+    if kind == 'latency':
+        entry["ewma"] = value if entry["ewma"] is None else EWMA_ALPHA * value + (1 - EWMA_ALPHA) * entry["ewma"]
+        entry["samples"] = (entry["samples"] + [round(value, 3)])[-LATENCY_WINDOW:]
+        entry["failures"] = 0
+        entry["unhealthy_until"] = 0
+    else:
+        entry["failures"] += 1
+        entry["unhealthy_until"] = value + UNHEALTHY_COOLDOWN * min(entry["failures"], 4)
+
+class EndpointStats:
+    """
+    记录每个端点的首个token延迟（滑动平均和最近样本）及健康状态
+
+    本进程的记录同时保存在pending中，保存时重新读取文件并把这些记录依次应用上去，
+    不会覆盖其他进程在此期间保存的样本和失败状态
+    """
+
+    def __init__(self, path=STATS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = self._read()
+        self.pending = []
+
+    def _read(self):
+        """@return dict - 文件中的统计，文件不存在或无法解析时为空字典"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    stats = json.load(f)
+                if isinstance(stats, dict):
+                    return stats
+        except Exception as e:
+            logger.debug(f"读取端点统计失败: {str(e)}")
+        return {}
+
+    def _entry(self, key):
+        return _stats_entry(self.stats, key)
+
+    def _record(self, key, kind, value):
+        with self.lock:
+            _apply_change(self._entry(key), kind, value)
+            self.pending.append((key, kind, value))
+
+    def record_latency(self, key, latency):
+        """记录一次成功请求的首个token延迟"""
+        self._record(key, 'latency', latency)
+
+    def record_censored(self, key, elapsed):
+        """
+        记录被取消请求的已等待时长：真实延迟至少为该值，仅在高于当前估计时计入
+        """
+        with self.lock:
+            ewma = self._entry(key)["ewma"]
+        if ewma is None or elapsed > ewma:
+            self.record_latency(key, elapsed)
+
+    def record_failure(self, key):
+        """记录一次失败，端点在冷却期内被视为不健康"""
+        self._record(key, 'failure', time.time())
+
+    def is_healthy(self, key):
+        with self.lock:
+            return self._entry(key)["unhealthy_until"] <= time.time()
+
+    def hedge_delay(self, key, percentile=0.95, default=HEDGE_DEFAULT_DELAY):
+        """
+        根据端点最近的首个token延迟计算对冲阈值（百分位数）
+        """
+        with self.lock:
+            samples = sorted(self._entry(key)["samples"])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return default
+        index = min(len(samples) - 1, int(len(samples) * percentile))
+        return max(HEDGE_MIN_DELAY, samples[index])
+
+    def rank(self, endpoints):
+        """
+        按健康状态和延迟估计排序，没有样本的端点使用默认延迟参与排序
+        """
+        def score(endpoint):
+            key = endpoint_key(endpoint)
+            with self.lock:
+                ewma = self._entry(key)["ewma"]
+            return (not self.is_healthy(key), ewma if ewma is not None else HEDGE_DEFAULT_DELAY)
+        return sorted(endpoints, key=score)
+
+    def save(self):
+        """
+        保存统计信息，失败时忽略
+
+        多个进程（CLI、预生成、批量任务）共享同一个统计文件：加锁后重新读取文件，
+        把本进程上次保存以来的记录应用到最新内容上，再先写临时文件后重命名
+        """
+        with self.lock:
+            changes, self.pending = self.pending, []
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with file_lock(f"{self.path}.lock", STATS_LOCK_TIMEOUT):
+                stats = self._read()
+                for key, kind, value in changes:
+                    _apply_change(_stats_entry(stats, key), kind, value)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(stats, f, indent=2)
+                os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.debug(f"保存端点统计失败: {str(e)}")
+            with self.lock:
+                self.pending = changes + self.pending
+            return
+
+        # 采用合并后的结果，保存期间新增的记录重新应用上去
+        with self.lock:
+            for key, kind, value in self.pending:
+                _apply_change(_stats_entry(stats, key), kind, value)
+            self.stats = stats
+
+_endpoint_stats = None
+
+def get_endpoint_stats():
+    """获取进程内共享的端点统计"""
+    global _endpoint_stats
+    if _endpoint_stats is None:
+        _endpoint_stats = EndpointStats()
+    return _endpoint_stats
+
+class _StreamAttempt:
+    """
+    在后台线程中向单个端点发送流式请求，将收到的行放入共享事件队列
+    """
+
+    def __init__(self, endpoint, data, events):
+        self.endpoint = endpoint
+        self.key = endpoint_key(endpoint)
+        self.data = dict(data, model=endpoint['model_name'])
+        self.events = events
+        self.response = None
+        self.cancelled = False
+        self.started = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.time()
+        self.thread.start()
+
+    def _run(self):
+        headers = {
+            "Authorization": f"Bearer {self.endpoint['api_key']}",
+            "Content-Type": "application/json"
+        }
+        try:
+            response = requests.post(self.endpoint['model_url'], headers=headers, json=self.data,
+                                     stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            self.response = response
+            if self.cancelled:
+                response.close()
+                return
+            if response.status_code != 200:
+                retry_after = response.headers.get('Retry-After')
+                self.events.put((self, 'error', ModelRequestError(
+                    f"API 调用失败: {response.status_code} {response.text[:500]}",
+                    status_code=response.status_code,
+                    retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+                )))
+                return
+            for line in response.iter_lines():
+                if self.cancelled:
+                    return
+                if line:
+                    self.events.put((self, 'line', line))
+            self.events.put((self, 'done', None))
+        except Exception as e:
+            if not self.cancelled:
+                self.events.put((self, 'error', e))
+
+    def cancel(self):
+        """取消请求并关闭连接"""
+        self.cancelled = True
+        if self.response is not None:
+            try:
+                self.response.close()
+            except Exception:
+                pass
+
+def stream_chat_completion(config, data):
+    """
+    以流式方式调用chat completions接口，返回SSE响应的每一行
+
+    - 优先使用延迟最低的健康端点
+    - 首个token在百分位阈值内未到达时，向下一个端点发送对冲请求，先返回的请求胜出，其余请求被取消
+    - 端点在返回首个token前失败时自动切换到下一个端点
+    - 超过整体截止时间时抛出ModelDeadlineExceeded
+
+    @param config - AI模型配置
+    @param data - 请求体（model字段会被替换为各端点的模型名称）
+    @yield bytes - SSE响应行
+    """
+    stats = get_endpoint_stats()
+    pending = stats.rank(get_endpoints(config))
+    if not pending:
+        raise ModelRequestError("未配置任何模型端点")
+
+    percentile = float(config.get('hedge_percentile') or 0.95)
+    deadline_at = time.time() + float(config.get('request_deadline') or REQUEST_DEADLINE)
+    events = queue.Queue()
+    active = []
+
+    def launch():
+        attempt = _StreamAttempt(pending.pop(0), data, events)
+        active.append(attempt)
+        attempt.start()
+        logger.debug(f"请求端点: {attempt.endpoint['model_url']} ({attempt.endpoint['model_name']})")
+        return time.time() + stats.hedge_delay(attempt.key, percentile)
+
+    hedge_at = launch()
+    winner = None
+    last_error = None
+
+    try:
+        # 等待首个token，必要时发送对冲请求
+        while winner is None:
+            now = time.time()
+            if now >= deadline_at:
+                raise ModelDeadlineExceeded("等待首个token超过整体截止时间")
+            wait_until = min(deadline_at, hedge_at) if pending else deadline_at
+            try:
+                attempt, kind, payload = events.get(timeout=max(0.01, wait_until - now))
+            except queue.Empty:
+                if pending and time.time() >= hedge_at:
+                    logger.info("首个token未在阈值内到达，向备用端点发送对冲请求...")
+                    hedge_at = launch()
+                continue
+
+            if attempt.cancelled:
+                continue
+            if kind == 'line':
+                winner = attempt
+                stats.record_latency(attempt.key, time.time() - attempt.started)
+                for other in active:
+                    if other is not winner:
+                        stats.record_censored(other.key, time.time() - other.started)
+                        other.cancel()
+                yield payload
+                break
+
+            # 首个token前失败或返回空响应，切换到下一个端点
+            last_error = payload or ModelRequestError("端点返回空响应")
+            logger.warning(f"端点 {attempt.endpoint['model_url']} 请求失败: {str(last_error)}")
+            stats.record_failure(attempt.key)
+            active.remove(attempt)
+            if not active:
+                if not pending:
+                    raise last_error if isinstance(last_error, ModelRequestError) else ModelRequestError(str(last_error))
+                hedge_at = launch()
+
+        # 读取胜出请求的剩余内容
+        while True:
+            remaining = deadline_at - time.time()
+            if remaining <= 0:
+                raise ModelDeadlineExceeded("流式响应超过整体截止时间")
+            try:
+                attempt, kind, payload = events.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if attempt is not winner:
+                continue
+            if kind == 'line':
+                yield payload
+            elif kind == 'done':
+                break
+            else:
+                stats.record_failure(attempt.key)
+                raise ModelRequestError(f"流式响应中断: {str(payload)}")
+    finally:
+        for attempt in active:
+            attempt.cancel()
+        stats.save()
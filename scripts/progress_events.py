@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 机器可读的进度事件流（NDJSON），供VSCode扩展实时更新界面
+"""
+
+import sys
+import json
+import time
+import threading
+
+EVENT_FORMATS = ['ndjson']
+
+_stream = None
+_lock = threading.Lock()
+
+def enable_events(event_format='ndjson'):
+    """
+    启用事件流：事件独占标准输出，其余的print输出改写到标准错误，避免混入事件流
+
+    @param event_format - 事件格式，目前仅支持ndjson
+    """
+    global _stream
+    if event_format not in EVENT_FORMATS:
+        raise ValueError(f"不支持的事件格式: {event_format}")
+    _stream = sys.stdout
+    sys.stdout = sys.stderr
+
+def events_enabled():
+    """是否已启用事件流"""
+    return _stream is not None
+
+def emit_event(event, **fields):
+    """
+    输出一条事件，未启用事件流时不做任何事
+
+    @param event - 事件类型：phase_start、phase_end、first_token、rule_parsed、continuation、patch、file_written、file_removed、error、stats、plan、prefetch、ingest、batch_job、batch_progress、stream_stopped
+    @param fields - 事件字段，必须可以序列化为JSON
+    """
+    if _stream is None:
+        return
+    line = json.dumps(dict({"event": event, "ts": round(time.time(), 3)}, **fields), ensure_ascii=False, default=str)
+    with _lock:
+        _stream.write(line + '\n')
+        _stream.flush()
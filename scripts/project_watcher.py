@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 监听工作区文件变化：Linux下使用inotify，其他平台或inotify不可用时退回到定时轮询，变化事件经过防抖后批量返回
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = 1.0   # 最后一次变化后保持安静的时间，超过后才返回一批变化
+MAX_BATCH_WAIT = 10.0    # 持续变化时一批变化最长的等待时间
+POLL_INTERVAL = 2.0      # 轮询模式的扫描间隔（秒）
+WAIT_SLICE = 1.0         # 等待事件的单次超时，保证可以及时响应Ctrl+C
+
+# inotify事件掩码（见 inotify(7)）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+class _InotifyBackend:
+    """基于inotify的递归监听，新建的目录会自动加入监听"""
+
+    name = "inotify"
+
+    def __init__(self, root, skip_dir):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError(errno.ENOSYS, "当前平台不支持inotify")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.skip_dir = skip_dir
+        self.paths = {}
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify初始化失败")
+        try:
+            self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, top):
+        for root, dirs, _ in os.walk(top):
+            dirs[:] = [d for d in dirs if not self.skip_dir(os.path.join(root, d))]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    # 超出系统的监听数量上限（fs.inotify.max_user_watches）
+                    raise OSError(error, "inotify监听数量达到系统上限")
+                continue
+            self.paths[wd] = root
+
+    def read(self, timeout):
+        """
+        等待并读取变化
+
+        @return List[str] | None - 发生变化的路径，事件队列溢出时返回None（需要全量重新分析）
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += _EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            parent = self.paths.get(wd)
+            if parent is None:
+                continue
+            path = os.path.join(parent, os.fsdecode(name)) if name else parent
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and not self.skip_dir(path):
+                try:
+                    self._add_tree(path)
+                except OSError as e:
+                    logger.warning(f"无法监听新目录 {path}: {str(e)}")
+            changed.append(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class _PollingBackend:
+    """定时扫描目录和文件的修改时间，比较前后两次快照得到变化"""
+
+    name = "polling"
+
+    def __init__(self, root, skip_dir, interval=POLL_INTERVAL):
+        self.root = root
+        self.skip_dir = skip_dir
+        self.interval = interval
+        self.snapshot = self._scan()
+        self.next_scan = time.time() + interval
+
+    def _scan(self):
+        snapshot = {}
+        for root, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not self.skip_dir(os.path.join(root, d))]
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def read(self, timeout):
+        delay = self.next_scan - time.time()
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+            if time.time() < self.next_scan:
+                return []
+        snapshot = self._scan()
+        self.next_scan = time.time() + self.interval
+        changed = [path for path in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(path) != self.snapshot.get(path)]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+class ProjectWatcher:
+    """
+    监听工作区的变化，忽略隐藏目录、依赖目录和规则输出目录
+
+    @param workspace_path - 工作区根目录
+    @param ignored_dirs - 忽略的目录名（例如node_modules）
+    @param ignored_paths - 忽略的绝对路径（例如.cursor/rules输出目录）
+    @param polling - 强制使用轮询模式
+    """
+
+    def __init__(self, workspace_path, ignored_dirs=(), ignored_paths=(), polling=False):
+        self.workspace_path = os.path.abspath(workspace_path)
+        self.ignored_dirs = set(ignored_dirs)
+        self.ignored_paths = [os.path.abspath(p) for p in ignored_paths]
+        self.backend = None
+        if not polling:
+            try:
+                self.backend = _InotifyBackend(self.workspace_path, self._skip_dir)
+            except (OSError, AttributeError) as e:
+                logger.info(f"inotify不可用，改用轮询方式监听文件变化: {str(e)}")
+        if self.backend is None:
+            self.backend = _PollingBackend(self.workspace_path, self._skip_dir)
+        logger.info(f"开始监听工作区变化（{self.backend.name}）: {self.workspace_path}")
+
+    def _skip_dir(self, path):
+        name = os.path.basename(path)
+        return name.startswith('.') or name in self.ignored_dirs or self._ignored_path(path)
+
+    def _ignored_path(self, path):
+        return any(path == p or path.startswith(p + os.sep) for p in self.ignored_paths)
+
+    def _relevant(self, path):
+        if self._ignored_path(path):
+            return False
+        rel_path = os.path.relpath(path, self.workspace_path)
+        parts = rel_path.split(os.sep)
+        return not any(part.startswith('.') and part not in ('.', '..') or part in self.ignored_dirs for part in parts)
+
+    def changes(self):
+        """
+        持续产出防抖后的变化批次
+
+        @yield Set[str] | None - 工作区内发生变化的相对路径（使用/分隔），无法确定变化范围时为None
+        """
+        while True:
+            batch = set()
+            overflow = False
+            first_change = None
+            last_change = None
+            while True:
+                if first_change is None:
+                    timeout = WAIT_SLICE
+                else:
+                    # 安静期结束或单批等待过久时结束本批
+                    now = time.time()
+                    timeout = min(last_change + DEBOUNCE_SECONDS, first_change + MAX_BATCH_WAIT) - now
+                    if timeout <= 0:
+                        break
+                paths = self.backend.read(timeout)
+                if paths is None:
+                    overflow = True
+                    paths = []
+                paths = [p for p in paths if self._relevant(p)]
+                if paths or overflow:
+                    last_change = time.time()
+                    first_change = first_change or last_change
+                    batch.update(os.path.relpath(p, self.workspace_path).replace(os.sep, '/') for p in paths)
+            yield None if overflow else batch
+
+    def close(self):
+        self.backend.close()
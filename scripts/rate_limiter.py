@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 模型调用的客户端限流与优先级调度：请求数和token数双令牌桶，跨进程共享
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import threading
+import itertools
+
+# 导入配置管理模块
+try:
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+# 令牌桶状态文件及其锁文件，多个进程（多个VSCode窗口、批处理任务）共享
+STATE_FILE = os.path.join(CONFIG_DIR, "rate_limit.json")
+LOCK_FILE = os.path.join(CONFIG_DIR, "rate_limit.lock")
+
+# 调用优先级，数值越小越优先
+PRIORITY_INTERACTIVE = 0   # 用户点击单条规则
+PRIORITY_BACKGROUND = 10   # 批量任务、预生成等后台任务
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "background": PRIORITY_BACKGROUND}
+
+BACKGROUND_RESERVE = 0.2   # 后台任务不得占用的令牌桶容量比例，为交互请求预留
+RATE_LIMIT_BACKOFF = 20    # 收到429但没有Retry-After时的全局退避时间（秒）
+MAX_SLEEP = 1.0            # 单次等待令牌的最长休眠时间（秒）
+
+class ModelScheduler:
+    """
+    进程内按优先级排队，队首的调用再到跨进程共享的令牌桶中申请配额
+
+    @param rpm_limit - 每分钟请求数上限，0表示不限制
+    @param tpm_limit - 每分钟token数上限，0表示不限制
+    """
+
+    def __init__(self, rpm_limit=0, tpm_limit=0, state_file=STATE_FILE, lock_file=LOCK_FILE):
+        self.limits = {"requests": int(rpm_limit or 0), "tokens": int(tpm_limit or 0)}
+        self.state_file = state_file
+        self.lock_file = lock_file
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.metrics = {
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "acquired": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+            "by_priority": {}
+        }
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        with open(self.state_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+
+    def _try_consume(self, cost_tokens, priority):
+        """
+        尝试从令牌桶中扣除一次请求和预计token数
+
+        @return float - 0表示成功，否则为还需等待的秒数
+        """
+        if not any(self.limits.values()) and not os.path.exists(self.state_file):
+            return 0
+
+        with file_lock(self.lock_file):
+            state = self._load_state()
+            now = time.time()
+
+            # 其他进程收到429后设置的全局退避
+            blocked_until = state.get("blocked_until", 0)
+            if blocked_until > now:
+                return blocked_until - now
+
+            costs = {"requests": 1, "tokens": cost_tokens}
+            wait = 0
+            for name, limit in self.limits.items():
+                if not limit:
+                    continue
+                rate = limit / 60.0
+                bucket = state.get(name) or {"level": limit, "updated": now}
+                level = min(limit, bucket["level"] + (now - bucket["updated"]) * rate)
+                state[name] = {"level": level, "updated": now}
+
+                # 单次请求超过桶容量时按容量计算，避免永远无法满足
+                required = min(costs[name], limit)
+                if priority >= PRIORITY_BACKGROUND:
+                    required = min(limit, required + limit * BACKGROUND_RESERVE)
+                if level < required:
+                    wait = max(wait, (required - level) / rate)
+
+            if wait == 0:
+                for name, limit in self.limits.items():
+                    if limit:
+                        state[name]["level"] -= min(costs[name], limit)
+            self._save_state(state)
+            return wait
+
+    def acquire(self, estimated_tokens, priority=PRIORITY_INTERACTIVE):
+        """
+        等待直到允许发送一次模型调用
+
+        @param estimated_tokens - 预计消耗的token数（输入+输出）
+        @param priority - 调用优先级
+        @return float - 实际等待的秒数
+        """
+        ticket = (priority, next(self.counter))
+        started = time.time()
+
+        with self.condition:
+            heapq.heappush(self.queue, ticket)
+            self.metrics["queue_depth"] = len(self.queue)
+            self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], len(self.queue))
+
+        try:
+            while True:
+                # 只有队首的调用可以申请配额，保证交互请求先于后台任务
+                with self.condition:
+                    while self.queue[0] != ticket:
+                        self.condition.wait(MAX_SLEEP)
+                wait = self._try_consume(estimated_tokens, priority)
+                if wait <= 0:
+                    break
+                logger.debug(f"触发客户端限流，等待{wait:.1f}秒...")
+                time.sleep(min(wait, MAX_SLEEP))
+        finally:
+            with self.condition:
+                self.queue.remove(ticket)
+                heapq.heapify(self.queue)
+                self.metrics["queue_depth"] = len(self.queue)
+                self.condition.notify_all()
+
+        waited = time.time() - started
+        with self.condition:
+            self.metrics["acquired"] += 1
+            self.metrics["total_wait"] += waited
+            self.metrics["max_wait"] = max(self.metrics["max_wait"], waited)
+            by_priority = self.metrics["by_priority"].setdefault(str(priority), {"acquired": 0, "total_wait": 0.0})
+            by_priority["acquired"] += 1
+            by_priority["total_wait"] += waited
+        return waited
+
+    def backoff(self, seconds=None):
+        """
+        收到429时设置全局退避，所有共享该状态文件的进程都会暂停发送
+        """
+        seconds = float(seconds or RATE_LIMIT_BACKOFF)
+        logger.warning(f"模型服务返回限流(429)，所有调用暂停{seconds:.0f}秒")
+        with file_lock(self.lock_file):
+            state = self._load_state()
+            state["blocked_until"] = max(state.get("blocked_until", 0), time.time() + seconds)
+            self._save_state(state)
+
+    def get_metrics(self):
+        """
+        获取调度统计：当前/最大队列深度、调用次数、总等待和最长等待时间
+        """
+        with self.condition:
+            metrics = json.loads(json.dumps(self.metrics))
+        metrics["avg_wait"] = metrics["total_wait"] / metrics["acquired"] if metrics["acquired"] else 0.0
+        return metrics
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler(config):
+    """
+    获取进程内共享的调度器，限额来自配置中的rpm_limit和tpm_limit（配置修改后以最新的限额为准）
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ModelScheduler(config.get('rpm_limit', 0), config.get('tpm_limit', 0))
+        else:
+            _scheduler.limits = {"requests": int(config.get('rpm_limit') or 0), "tokens": int(config.get('tpm_limit') or 0)}
+        return _scheduler
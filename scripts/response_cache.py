@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description AI生成结果缓存：以源规则内容、项目指纹和模型为键，输入未变化的规则不再调用模型
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+from contextlib import contextmanager, ExitStack
+
+# 导入配置管理模块
+try:
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(CONFIG_DIR, "cache")
+CACHE_VERSION = 1  # 缓存格式或提示词发生不兼容变化时递增
+# 正在进行的生成请求的锁文件目录，用于在多个进程之间合并相同的请求
+INFLIGHT_DIR = os.path.join(CONFIG_DIR, "inflight")
+FLIGHT_WAIT_TIMEOUT = 600  # 等待其他进程完成相同请求的最长时间（秒），超时后自行生成
+# 每个源规则上一次生成所用的源内容和生成结果，源规则修改后用于基于差异的增量生成
+VERSIONS_DIR = os.path.join(CONFIG_DIR, "versions")
+
+def cache_key(*parts):
+    """
+    由多个输入计算缓存键，字典和列表按排序后的JSON参与计算
+
+    @example cache_key(rule_content, project_fingerprint, model_name)
+    """
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode('utf-8'))
+    for part in parts:
+        if not isinstance(part, str):
+            part = json.dumps(part, sort_keys=True, ensure_ascii=False)
+        digest.update(b'\0' + part.encode('utf-8'))
+    return digest.hexdigest()
+
+class ResponseCache:
+    """
+    基于文件的生成结果缓存，每个键一个JSON文件，按键的前两位分目录存放
+
+    写入时先写临时文件再重命名，多个进程同时写入同一个键也不会产生损坏的文件
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key, newer_than=None):
+        """
+        读取缓存的规则列表
+
+        @param newer_than - 只接受该时间戳之后写入的结果
+        @return List[Tuple[str, str, str, str]] | None - 未命中时返回None
+        """
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            rules = [tuple(rule) for rule in entry["rules"]]
+            if newer_than is not None and entry.get("created", 0) < newer_than:
+                rules = None
+        except (OSError, ValueError, KeyError, TypeError):
+            rules = None
+        if rules is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return rules
+
+    def put(self, key, rules, **meta):
+        """
+        写入规则列表，写入失败只记录日志
+
+        @param rules - List[Tuple[str, str, str, str]]
+        @param meta - 附加信息（例如源规则slug和模型名称），仅用于排查问题
+        """
+        path = self._path(key)
+        entry = dict(meta, created=round(time.time(), 3), rules=[list(rule) for rule in rules])
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入生成结果缓存失败: {str(e)}")
+
+    def entry(self, key):
+        """
+        读取完整的缓存条目（包括put时写入的附加信息），不计入命中统计
+
+        @return dict | None
+        """
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if isinstance(entry, dict) and isinstance(entry.get("rules"), list) else None
+
+    def contains(self, key):
+        return os.path.exists(self._path(key))
+
+@contextmanager
+def single_flight(key, timeout=FLIGHT_WAIT_TIMEOUT):
+    """
+    跨进程合并相同的生成请求：同一个键同时只有一个进程（领导者）在生成，
+    其他进程在锁文件上等待，领导者结束后再由调用方读取它写入的缓存
+
+    领导者进程异常退出时锁会被操作系统自动释放，等待中的进程随后自行生成
+
+    @param key - 请求的缓存键
+    @yield bool - 是否等待过其他进程
+    """
+    waited = []
+
+    def on_wait():
+        waited.append(True)
+        logger.info("相同的生成请求正在其他进程中进行，等待其结果...")
+
+    with ExitStack() as stack:
+        try:
+            lock = stack.enter_context(file_lock(os.path.join(INFLIGHT_DIR, f"{key}.lock"), timeout, on_wait))
+            # 记录领导者进程，便于排查长时间等待的问题
+            lock.seek(0)
+            lock.truncate()
+            lock.write(str(os.getpid()))
+            lock.flush()
+        except TimeoutError:
+            logger.warning(f"等待其他进程超过{timeout}秒，改为自行生成")
+        yield bool(waited)
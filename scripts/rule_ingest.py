@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 批量导入已有的.mdc规则文件：并行遍历多个目录，逐行流式解析front matter和正文，
+按内容哈希去重后增量合并到规则目录（rules.db.json）和查询索引
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 导入配置管理模块
+try:
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+    from rule_query import RuleIndex, normalize_term
+    from rule_store import load_catalog, hydrate_rules
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+    from rule_query import RuleIndex, normalize_term
+    from rule_store import load_catalog, hydrate_rules
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = 16          # 遍历目录和解析文件的线程数
+MAX_PENDING_TASKS = 1024     # 同时排队的任务数上限，控制内存占用
+MAX_MDC_BYTES = 1024 * 1024  # 超过该大小的.mdc文件视为异常文件跳过
+INGEST_STATE_DIR = os.path.join(CONFIG_DIR, "ingest")  # 已导入文件的签名记录，再次导入时跳过未变化的文件
+CATALOG_LOCK_DIR = os.path.join(CONFIG_DIR, "locks")
+
+# 遍历时跳过的目录（.cursor目录本身需要进入）
+SKIPPED_DIRS = {'node_modules', 'venv', 'env', '__pycache__', 'dist', 'build', 'target', 'vendor', '.git', '.hg', '.svn'}
+# 从规则名称派生标签时忽略的通用词
+GENERIC_NAME_WORDS = {'rule', 'rules', 'best', 'practices', 'guide', 'guidelines', 'style', 'conventions', 'and', 'the', 'mdc'}
+
+def content_hash(content):
+    """
+    规则正文的内容哈希，忽略行尾空白、换行符差异和首尾空行
+
+    @return str - sha256十六进制摘要
+    """
+    digest = hashlib.sha256()
+    for line in content.strip().splitlines():
+        digest.update(line.rstrip().encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+def parse_mdc_stream(lines):
+    """
+    逐行解析.mdc文件，同时计算正文的内容哈希，不需要把整个文件读入内存后再切分
+
+    front matter支持 `key: value` 和YAML列表两种写法：
+        globs:
+          - src/**/*.ts
+
+    @param lines - 可迭代的文本行（例如打开的文件对象）
+    @return Tuple[dict, str, str] - (front matter, 正文, 正文的内容哈希)
+    """
+    meta = {}
+    body = []
+    digest = hashlib.sha256()
+    iterator = iter(lines)
+    first = next(iterator, None)
+    if first is None:
+        return meta, '', content_hash('')
+
+    pending_blank = 0
+    started = False
+
+    def add_body_line(line):
+        nonlocal pending_blank, started
+        line = line.rstrip()
+        if not line:
+            # 空行延迟写入，忽略首尾空行
+            pending_blank += started
+            return
+        for _ in range(pending_blank):
+            body.append('')
+            digest.update(b'\n')
+        pending_blank = 0
+        started = True
+        body.append(line)
+        digest.update(line.encode('utf-8') + b'\n')
+
+    if first.strip() == '---':
+        list_key = None
+        for line in iterator:
+            stripped = line.strip()
+            if stripped == '---':
+                break
+            if list_key and stripped.startswith('- '):
+                meta[list_key].append(stripped[2:].strip().strip('"\''))
+                continue
+            list_key = None
+            if ':' in stripped and not stripped.startswith('#'):
+                key, value = stripped.split(':', 1)
+                key, value = key.strip(), value.strip()
+                if value:
+                    meta[key] = value.strip('"\'')
+                else:
+                    meta[key] = []
+                    list_key = key
+    else:
+        add_body_line(first)
+
+    for line in iterator:
+        add_body_line(line)
+
+    for key, value in meta.items():
+        if isinstance(value, list):
+            meta[key] = ','.join(value)
+    return meta, '\n'.join(body), digest.hexdigest()
+
+def slugify(name):
+    """规则名称转换为slug：去掉.mdc后缀，小写，非字母数字字符统一为连字符"""
+    if name.endswith('.mdc'):
+        name = name[:-4]
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'rule'
+
+def derive_tags(meta, slug):
+    """
+    生成规则的标签：优先使用front matter中的tags，否则由slug中的非通用词派生
+
+    @return List[str]
+    """
+    tags = meta.get('tags')
+    if tags:
+        return [normalize_term(tag) for tag in tags.strip('[]').split(',') if tag.strip(' "\'')]
+    return [word for word in slug.split('-') if word not in GENERIC_NAME_WORDS and not word.isdigit()]
+
+def _scan_dir(path):
+    """
+    扫描单个目录
+
+    @return Tuple[List[str], List[Tuple[str, int, int]]] - (子目录, [(.mdc文件路径, mtime_ns, 大小)])
+    """
+    subdirs, files = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIPPED_DIRS:
+                            subdirs.append(entry.path)
+                    elif entry.name.endswith('.mdc') and entry.is_file():
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_mtime_ns, stat.st_size))
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.debug(f"无法读取目录 {path}: {str(e)}")
+    return subdirs, files
+
+def _parse_file(path):
+    """解析单个.mdc文件，失败时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return parse_mdc_stream(f)
+    except OSError as e:
+        logger.debug(f"无法读取规则文件 {path}: {str(e)}")
+        return None
+
+def iter_mdc_files(roots, workers=INGEST_WORKERS):
+    """
+    并行遍历多个目录，逐个产出找到的.mdc文件，扫描出的子目录作为新任务提交给线程池
+
+    @param roots - 要遍历的目录列表
+    @yield Tuple[str, int, int] - (文件绝对路径, mtime_ns, 大小)
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_scan_dir, os.path.abspath(root)) for root in roots}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirs, files = future.result()
+                pending.update(executor.submit(_scan_dir, subdir) for subdir in subdirs)
+                yield from files
+
+def parse_mdc_files(paths, workers=INGEST_WORKERS):
+    """
+    并行解析.mdc文件，同时排队的文件数有上限，内存占用与文件总数无关
+
+    @param paths - 可迭代的文件路径
+    @yield Tuple[str, Tuple[dict, str, str] | None] - (文件路径, 解析结果)，顺序与输入不一定相同
+    """
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        while True:
+            for path in paths:
+                pending[executor.submit(_parse_file, path)] = path
+                if len(pending) >= MAX_PENDING_TASKS:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+
+def _catalog_digest(catalog_path):
+    return hashlib.sha256(os.path.abspath(catalog_path).encode('utf-8')).hexdigest()[:16]
+
+def _load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+def _write_json_atomic(path, data, indent=None):
+    """先写临时文件再重命名，读取方不会读到写了一半的文件"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+def _unique_slug(index, slug, next_suffix, reserved=()):
+    """
+    同名规则追加数字后缀，next_suffix记录每个slug下一次尝试的后缀，避免大量同名文件时反复从头尝试
+
+    @param reserved - 其他规则目录（例如覆盖层之下的规则库）已使用的slug，同样需要避开
+    """
+    candidate, suffix = slug, next_suffix.get(slug, 2)
+    while candidate in index.slugs or candidate in reserved:
+        candidate = f"{slug}-{suffix}"
+        suffix += 1
+    next_suffix[slug] = suffix
+    return candidate
+
+def ingest_mdc_files(roots, catalog_path, workers=INGEST_WORKERS, base_catalog=None):
+    """
+    把多个目录下的.mdc文件导入规则目录
+
+    - 相同正文（内容哈希相同）的规则只保留一份，包括目录中已有的规则
+    - 记录每个文件的修改时间、大小和内容哈希，再次导入时未变化的文件不再读取
+    - 已导入过的文件内容发生变化时更新原有条目，而不是新增一条
+    - 整个导入过程持有规则目录的跨进程锁，最后一次性原子写入
+
+    @param roots - 要遍历的目录列表
+    @param catalog_path - 规则目录文件（例如rules_data/rules.db.json），不存在时创建
+    @param base_catalog - catalog_path作为覆盖层时其下的规则库：与规则库中正文相同的规则视为重复，
+                          新规则的slug避开规则库中已有的slug，不会覆盖内置规则
+    @return dict - 导入统计
+    """
+    started = time.time()
+    digest = _catalog_digest(catalog_path)
+    state_path = os.path.join(INGEST_STATE_DIR, f"{digest}.json")
+    stats = {"found": 0, "unchanged": 0, "parsed": 0, "added": 0, "updated": 0,
+             "duplicates": 0, "empty": 0, "errors": 0}
+
+    with file_lock(os.path.join(CATALOG_LOCK_DIR, f"catalog-{digest}.lock")):
+        catalog = _load_json(catalog_path, [])
+        if not isinstance(catalog, list):
+            raise ValueError(f"规则目录格式错误，应为规则列表: {catalog_path}")
+        signatures = _load_json(state_path, {})
+
+        # 已有规则的内容哈希和来源文件
+        index = RuleIndex(catalog)
+        known_hashes = set()
+        by_source = {}
+        next_suffix = {}
+        reserved = set()
+        if base_catalog:
+            for rule in hydrate_rules(load_catalog(base_catalog, with_content=False)):
+                if isinstance(rule, dict):
+                    known_hashes.add(rule.get('content_hash') or content_hash(str(rule.get('content', ''))))
+                    reserved.add(str(rule.get('slug', '')).lower())
+        for rule in catalog:
+            if not isinstance(rule, dict):
+                continue
+            rule_hash = rule.get('content_hash') or content_hash(str(rule.get('content', '')))
+            known_hashes.add(rule_hash)
+            if rule.get('source'):
+                by_source[rule['source']] = rule
+
+        def changed_files():
+            visited = set()
+            for path, mtime_ns, size in iter_mdc_files(roots, workers):
+                # 嵌套的导入目录会重复遍历到同一个文件
+                if path in visited:
+                    continue
+                visited.add(path)
+                stats["found"] += 1
+                # 文件未变化且内容仍在目录中时跳过（目录被替换或删减后会重新导入）
+                signature = signatures.get(path)
+                if signature and signature[:2] == [mtime_ns, size] and signature[2] in known_hashes:
+                    stats["unchanged"] += 1
+                    continue
+                if size > MAX_MDC_BYTES:
+                    logger.warning(f"跳过过大的规则文件（{size}字节）: {path}")
+                    stats["errors"] += 1
+                    continue
+                signatures[path] = [mtime_ns, size, None]
+                yield path
+
+        for path, parsed in parse_mdc_files(changed_files(), workers):
+            if parsed is None:
+                stats["errors"] += 1
+                signatures.pop(path, None)
+                continue
+            stats["parsed"] += 1
+            meta, body, body_hash = parsed
+            signatures[path][2] = body_hash
+            if not body:
+                stats["empty"] += 1
+                continue
+            if body_hash in known_hashes:
+                stats["duplicates"] += 1
+                continue
+            known_hashes.add(body_hash)
+
+            name = meta.get('name') or os.path.basename(path)
+            fields = {
+                "description": meta.get('description') or slugify(name).replace('-', ' '),
+                "content": body,
+                "content_hash": body_hash,
+            }
+            if meta.get('globs'):
+                fields["globs"] = meta['globs']
+
+            existing = by_source.get(path)
+            if existing is not None:
+                existing.update(fields)
+                stats["updated"] += 1
+                continue
+
+            slug = _unique_slug(index, slugify(name), next_suffix, reserved)
+            rule = {
+                "title": name[:-4] if name.endswith('.mdc') else name,
+                "slug": slug,
+                "tags": derive_tags(meta, slug),
+                "libs": [],
+                "author": "",
+                "source": path,
+            }
+            rule.update(fields)
+            index.add(rule)
+            by_source[path] = rule
+            stats["added"] += 1
+
+        if stats["added"] or stats["updated"]:
+            _write_json_atomic(catalog_path, index.rules, indent=2)
+        try:
+            _write_json_atomic(state_path, signatures)
+        except OSError as e:
+            logger.warning(f"写入导入记录失败，下次导入将重新读取所有文件: {str(e)}")
+
+    stats["total"] = len(index.rules)
+    stats["seconds"] = round(time.time() - started, 2)
+    logger.info(f"导入完成: 找到{stats['found']}个.mdc文件，新增{stats['added']}条，更新{stats['updated']}条，"
+                f"重复{stats['duplicates']}条，未变化{stats['unchanged']}个，耗时{stats['seconds']}秒")
+    return stats
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 合并相似的AI生成规则：按名称、glob和规则条目的MinHash相似度聚类，合并为单个规则
+"""
+
+import re
+import random
+import hashlib
+
+NUM_PERM = 64               # MinHash签名长度
+SHINGLE_SIZE = 4            # 字符shingle长度（兼容中文内容）
+CONTENT_THRESHOLD = 0.6     # 内容相似度达到该值即合并
+NAME_CONTENT_THRESHOLD = 0.3  # 名称相近时所需的内容相似度
+NAME_THRESHOLD = 0.5        # 名称词语的Jaccard相似度阈值
+BULLET_SHINGLE_SIZE = 2     # 比较单条规则条目时使用的shingle长度
+BULLET_THRESHOLD = 0.6      # 两条规则条目视为重复的shingle相似度
+
+_TOP_BULLET = re.compile(r'^(?:[-*+]|\d+\.)\s')  # 顶层条目（无缩进）
+_FENCE = re.compile(r'^\s*(?:```|~~~)')          # 代码块的起止行
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20250306)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+def split_globs(glob_pattern):
+    """
+    按顶层逗号拆分glob列表，花括号内的逗号不拆分
+    """
+    parts = []
+    depth = 0
+    current = ''
+    for char in glob_pattern or '':
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth = max(0, depth - 1)
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return [p for p in parts if p]
+
+def normalize_rule_line(line):
+    """
+    归一化规则条目，用于去重比较
+    """
+    line = re.sub(r'^[-*]\s*', '', line.strip())
+    line = re.sub(r'\s+', ' ', line)
+    return line.rstrip('。.;；,，').lower()
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    生成去除空白后的字符shingle集合
+    """
+    text = re.sub(r'\s+', '', text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def minhash_signature(shingle_set):
+    """
+    计算shingle集合的MinHash签名
+    """
+    if not shingle_set:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big') for s in shingle_set]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+def signature_similarity(sig_a, sig_b):
+    """用签名估计两个集合的Jaccard相似度"""
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+def jaccard(set_a, set_b):
+    """精确计算Jaccard相似度"""
+    if not set_a or not set_b:
+        return 0.0
+    return len(set_a & set_b) / len(set_a | set_b)
+
+def rule_key(name):
+    """规则名称归一化：去掉.mdc后缀并转为小写"""
+    name = name.lower()
+    return name[:-4] if name.endswith('.mdc') else name
+
+def glob_scope(glob_pattern):
+    """
+    获取glob的目录范围（第一个通配符之前的目录部分），不同范围的规则不合并
+    """
+    scopes = set()
+    for pattern in split_globs(glob_pattern) or ['**/*']:
+        prefix = re.split(r'[*?{\[]', pattern, 1)[0]
+        scopes.add(prefix.rsplit('/', 1)[0] if '/' in prefix else '')
+    return frozenset(scopes)
+
+def _content_lines(content):
+    """用于计算相似度特征的非空行（已去除缩进），不用于生成合并后的正文"""
+    return [line.strip() for line in str(content).split('\n') if normalize_rule_line(line)]
+
+def rule_blocks(content):
+    """
+    把规则正文拆成块：顶层条目连同其后缩进的子条目、续行（以及其中的代码块）为一块，
+    代码块整体为一块，其余每行（包括空行和标题）各为一块；所有行保持原样
+
+    @return List[Tuple[str | None, List[str]]] - (条目的去重键, 原始行)，非条目块的键为None
+    """
+    lines = str(content).split('\n')
+    blocks = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _FENCE.match(line):
+            end = i + 1
+            while end < len(lines) and not _FENCE.match(lines[end]):
+                end += 1
+            blocks.append((None, lines[i:end + 1]))
+            i = end + 1
+            continue
+        if not _TOP_BULLET.match(line):
+            blocks.append((None, [line]))
+            i += 1
+            continue
+        end = i + 1
+        in_fence = False
+        while end < len(lines):
+            child = lines[end]
+            if in_fence:
+                in_fence = not _FENCE.match(child)
+            elif child[:1] in (' ', '\t') and child.strip():
+                in_fence = bool(_FENCE.match(child))
+            else:
+                break
+            end += 1
+        blocks.append((normalize_rule_line(line), lines[i:end]))
+        i = end
+    return blocks
+
+def merge_rule_contents(contents, near=True):
+    """
+    合并多条规则正文：只对顶层条目（连同其子条目）去重，其余内容（代码块、标题、空行等）原样保留
+
+    @param contents - 规则正文列表，按优先顺序排列
+    @param near - 是否同时去除近似重复的条目（shingle相似度达到BULLET_THRESHOLD），否则只去除完全相同的条目
+    @return str
+    """
+    if len(contents) == 1:
+        return contents[0]
+    lines = []
+    seen_keys = set()
+    seen_shingles = []
+    for content in contents:
+        for key, block in rule_blocks(content):
+            if key is not None:
+                if key in seen_keys:
+                    continue
+                if near:
+                    key_shingles = shingles(key, BULLET_SHINGLE_SIZE)
+                    if any(jaccard(key_shingles, other) >= BULLET_THRESHOLD for other in seen_shingles):
+                        continue
+                    seen_shingles.append(key_shingles)
+                seen_keys.add(key)
+            lines.extend(block)
+    return '\n'.join(lines).strip('\n')
+
+def cluster_rules(rules):
+    """
+    对规则聚类，满足以下任一条件的两条规则归为同一簇（并查集合并）：
+    - 名称相同
+    - glob目录范围相同，且规则条目的MinHash相似度达到阈值（名称相近时阈值更低）
+
+    @param rules - List[Tuple[str, str, str, str]] (name, description, globs, content)
+    @return List[List[int]] - 每个簇包含的规则下标
+    """
+    parent = list(range(len(rules)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    features = []
+    for name, _, glob_pattern, content in rules:
+        lines = {normalize_rule_line(line) for line in _content_lines(content)}
+        features.append({
+            "key": rule_key(name),
+            "words": set(re.split(r'[-_]', rule_key(name))),
+            "scope": glob_scope(glob_pattern),
+            "signature": minhash_signature(set().union(*(shingles(line) for line in lines)) if lines else set())
+        })
+
+    # 生成的规则数量通常只有几十条，两两比较即可
+    for i in range(len(rules)):
+        for j in range(i + 1, len(rules)):
+            a, b = features[i], features[j]
+            if a["key"] == b["key"]:
+                parent[find(j)] = find(i)
+                continue
+            if a["scope"] != b["scope"]:
+                continue
+            similarity = signature_similarity(a["signature"], b["signature"])
+            threshold = NAME_CONTENT_THRESHOLD if jaccard(a["words"], b["words"]) >= NAME_THRESHOLD else CONTENT_THRESHOLD
+            if similarity >= threshold:
+                parent[find(j)] = find(i)
+
+    clusters = {}
+    for i in range(len(rules)):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
+
+def merge_cluster(rules):
+    """
+    将一个簇中的规则合并为一条：名称取出现次数最多的名称，glob取并集，顶层条目去重（包括近似重复），
+    其余内容原样保留；只有一条规则的簇原样返回
+
+    @return Tuple[str, str, str, str]
+    """
+    if len(rules) == 1:
+        return rules[0]
+    names = [name for name, _, _, _ in rules]
+    name = max(names, key=lambda n: (names.count(n), -names.index(n)))
+    description = next((d for _, d, _, _ in rules if d), '')
+
+    globs = []
+    for _, _, glob_pattern, _ in rules:
+        for pattern in split_globs(glob_pattern):
+            if pattern not in globs:
+                globs.append(pattern)
+
+    content = merge_rule_contents([str(content) for _, _, _, content in rules])
+    return (name, description, ','.join(globs) or '**/*', content)
+
+def consolidate_rules(rules):
+    """
+    合并相似规则
+
+    @param rules - List[Tuple[str, str, str, str]] (name, description, globs, content)
+    @return List[Tuple[str, str, str, str]] - 合并后的规则，按首次出现顺序排列
+    """
+    clusters = cluster_rules(rules)
+    clusters.sort(key=min)
+    return [merge_cluster([rules[i] for i in cluster]) for cluster in clusters]
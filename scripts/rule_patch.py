@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 基于差异的增量生成：源规则小幅修改时只把行差异和此前的生成结果发给模型，
+由模型返回对生成规则的修改操作（新增、更新、删除），再在本地应用
+"""
+
+import difflib
+
+try:
+    from rule_merger import rule_key
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    import os
+    import sys
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from rule_merger import rule_key
+
+DIFF_CONTEXT_LINES = 1     # 差异中保留的上下文行数
+MAX_DIFF_RATIO = 0.5       # 变化行数超过源规则行数的该比例时改为完整生成
+PATCH_OPS = ('add', 'update', 'remove')
+
+def source_diff(old_source, new_source):
+    """
+    计算源规则的行差异（unified diff格式，不含文件头）
+
+    @return Tuple[str, int] - (差异文本, 变化的行数)
+    """
+    lines = list(difflib.unified_diff(str(old_source).splitlines(), str(new_source).splitlines(),
+                                      lineterm='', n=DIFF_CONTEXT_LINES))[2:]
+    changed = sum(1 for line in lines if line[:1] in '+-' and not line.startswith(('+++', '---')))
+    return '\n'.join(lines), changed
+
+def diff_worth_patching(new_source, changed):
+    """变化足够小（且确有变化）时才值得增量生成"""
+    total = max(1, len(str(new_source).splitlines()))
+    return 0 < changed <= total * MAX_DIFF_RATIO
+
+def validate_patch_op(obj):
+    """
+    校验并规范化模型返回的修改操作
+
+    @return Tuple[str, str, dict] | None - (操作, 规则名称, 新字段)，字段只包含模型给出的部分
+    """
+    if not isinstance(obj, dict):
+        return None
+    op = str(obj.get("op") or '').strip().lower()
+    name = str(obj.get("name") or '').strip().replace('/', '-').replace('\\', '-')
+    if op not in PATCH_OPS or not name:
+        return None
+    fields = {}
+    for field in ("description", "glob_pattern", "content"):
+        value = obj.get(field)
+        if isinstance(value, list):
+            value = '\n'.join(str(line) for line in value)
+        if value:
+            fields[field] = str(value)
+    if op == 'add' and "content" not in fields:
+        return None
+    return op, name, fields
+
+def apply_rule_patch(rules, ops):
+    """
+    把修改操作应用到此前生成的规则上，保持原有顺序，新增的规则追加在末尾
+
+    - update: 只替换给出的字段；目标规则不存在且给出了内容时按新增处理
+    - add: 同名规则已存在时按更新处理
+    - remove: 删除同名规则
+
+    @param rules - List[Tuple[str, str, str, str]] 此前生成的规则
+    @param ops - validate_patch_op返回的操作列表
+    @return List[Tuple[str, str, str, str]]
+    """
+    result = {rule_key(rule[0]): list(rule) for rule in rules}
+    for op, name, fields in ops:
+        key = rule_key(name)
+        if op == 'remove':
+            result.pop(key, None)
+            continue
+        current = result.get(key)
+        if current is None:
+            if "content" not in fields:
+                continue
+            current = result[key] = [name, '', '**/*', '']
+        for index, field in ((1, "description"), (2, "glob_pattern"), (3, "content")):
+            if field in fields:
+                current[index] = fields[field]
+    return [tuple(rule) for rule in result.values()]
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 规则选择表达式：支持多个slug、tag:/lib:条件及AND/OR/NOT组合，slug拼写错误时通过三元组索引给出最接近的规则
+"""
+
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+FUZZY_AUTO_THRESHOLD = 0.5  # 最佳候选相似度达到该值且明显优于次优候选时自动纠正
+FUZZY_MARGIN = 0.1          # 自动纠正要求的与次优候选的相似度差
+FUZZY_SUGGESTIONS = 3       # 无法自动纠正时给出的候选数量
+FUZZY_EPSILON = 1e-9        # 比较相似度时的浮点误差容限（例如 0.6 - 0.5 算作恰好0.1）
+
+_TOKEN_PATTERN = re.compile(r'\s*(\(|\)|,|[^\s(),]+)')
+
+def normalize_term(value):
+    """标签和库名归一化：小写，空白和下划线统一为连字符"""
+    return re.sub(r'[\s_]+', '-', str(value).strip().lower())
+
+def trigrams(text):
+    """生成带边界填充的字符三元组集合"""
+    text = f"  {text.lower()} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class RuleIndex:
+    """
+    规则目录的查询索引，加载规则后一次性构建：
+    - slug到下标的映射
+    - tag和lib的位图倒排（整数位图，按位运算实现AND/OR/NOT）
+    - slug的三元组倒排，用于模糊匹配
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        self.all_bits = 0
+        self.slugs = {}
+        self.postings = {"tag": {}, "lib": {}}
+        self.trigram_postings = {}
+        self.slug_trigrams = []
+
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule):
+        """
+        向索引追加一条规则（批量导入时增量更新，无需重建索引）
+
+        @return int - 规则在索引中的下标
+        """
+        i = len(self.rules)
+        self.rules.append(rule)
+        self.all_bits |= 1 << i
+
+        slug = str(rule.get('slug', '')).lower()
+        self.slugs.setdefault(slug, i)
+
+        libs = rule.get('libs') or []
+        if isinstance(libs, str):
+            libs = libs.split(',')
+        for field, values in (("tag", rule.get('tags') or []), ("lib", libs)):
+            for value in values:
+                key = normalize_term(value)
+                if key:
+                    self.postings[field][key] = self.postings[field].get(key, 0) | (1 << i)
+
+        grams = trigrams(slug)
+        self.slug_trigrams.append(grams)
+        for gram in grams:
+            self.trigram_postings.setdefault(gram, []).append(i)
+        return i
+
+    def closest_slugs(self, term, limit=FUZZY_SUGGESTIONS):
+        """
+        按三元组Jaccard相似度返回最接近的slug
+
+        @return List[Tuple[str, float]] - (slug, 相似度)，按相似度降序
+        """
+        grams = trigrams(term)
+        shared = {}
+        for gram in grams:
+            for i in self.trigram_postings.get(gram, []):
+                shared[i] = shared.get(i, 0) + 1
+        scored = []
+        for i, count in shared.items():
+            similarity = count / (len(grams) + len(self.slug_trigrams[i]) - count)
+            scored.append((str(self.rules[i].get('slug')), similarity))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def _resolve_slug(self, term, unresolved):
+        """精确匹配slug，失败时尝试模糊匹配"""
+        slug = term.lower()
+        if slug in self.slugs:
+            return 1 << self.slugs[slug]
+
+        candidates = self.closest_slugs(slug)
+        if candidates and candidates[0][1] >= FUZZY_AUTO_THRESHOLD - FUZZY_EPSILON and (
+                len(candidates) == 1 or candidates[0][1] - candidates[1][1] >= FUZZY_MARGIN - FUZZY_EPSILON):
+            logger.warning(f"找不到规则 {term}，已自动匹配为最接近的规则 {candidates[0][0]}")
+            return 1 << self.slugs[candidates[0][0].lower()]
+
+        unresolved.append((term, [slug for slug, _ in candidates]))
+        return 0
+
+    def recommend(self, weights, limit):
+        """
+        按项目特征为规则打分并返回得分最高的规则：命中标签的权重之和，再按命中标签占规则标签的比例折算，
+        标签少而精准的规则排在覆盖面广的通用规则之前
+
+        @param weights - {归一化的标签: 权重}，例如项目使用的框架、库和语言
+        @param limit - 返回的规则数量
+        @return List[Tuple[dict, float]] - (规则, 得分)，按得分降序
+        """
+        scores = {}
+        matched = {}
+        for term, weight in weights.items():
+            bits = self.postings["tag"].get(term, 0)
+            while bits:
+                low = bits & -bits
+                i = low.bit_length() - 1
+                bits ^= low
+                scores[i] = scores.get(i, 0) + weight
+                matched[i] = matched.get(i, 0) + 1
+
+        ranked = []
+        for i, score in scores.items():
+            tags = self.rules[i].get('tags') or []
+            ranked.append((score * (matched[i] / max(len(tags), matched[i])) ** 0.5, i))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [(self.rules[i], round(score, 3)) for score, i in ranked[:limit]]
+
+    def select(self, expression):
+        """
+        解析并执行选择表达式
+
+        - 多个slug之间用空格或逗号分隔，结果取并集
+        - tag:react、lib:vue 按标签或库筛选
+        - AND、OR、NOT（不区分大小写）及括号组合条件，AND优先于OR
+
+        @example index.select('nextjs-react-typescript, tag:react AND NOT lib:vue')
+        @return Tuple[List[dict], List[Tuple[str, List[str]]]] - (选中的规则, 无法解析的slug及候选)
+        @raise ValueError - 表达式语法错误
+        """
+        tokens = _TOKEN_PATTERN.findall(expression or '')
+        unresolved = []
+        position = [0]
+
+        def peek():
+            return tokens[position[0]] if position[0] < len(tokens) else None
+
+        def take():
+            token = peek()
+            position[0] += 1
+            return token
+
+        def keyword(token):
+            return token.upper() if token and token.upper() in ('AND', 'OR', 'NOT') else None
+
+        def parse_or():
+            bits = parse_and()
+            while True:
+                token = peek()
+                if token == ',' or keyword(token) == 'OR':
+                    take()
+                    bits |= parse_and()
+                elif token is not None and token != ')' and keyword(token) != 'AND':
+                    # 相邻的条件之间没有运算符时视为OR
+                    bits |= parse_and()
+                else:
+                    return bits
+
+        def parse_and():
+            bits = parse_not()
+            while keyword(peek()) == 'AND':
+                take()
+                bits &= parse_not()
+            return bits
+
+        def parse_not():
+            if keyword(peek()) == 'NOT':
+                take()
+                return self.all_bits & ~parse_not()
+            return parse_atom()
+
+        def parse_atom():
+            token = take()
+            if token is None or token in (')', ',') or keyword(token):
+                raise ValueError(f"选择表达式语法错误，位置{position[0]}附近: {token or '表达式结尾'}")
+            if token == '(':
+                bits = parse_or()
+                if take() != ')':
+                    raise ValueError("选择表达式语法错误: 缺少右括号")
+                return bits
+            field, _, value = token.partition(':')
+            if value and field.lower() in self.postings:
+                return self.postings[field.lower()].get(normalize_term(value), 0)
+            return self._resolve_slug(token, unresolved)
+
+        bits = parse_or() if tokens else 0
+        if peek() is not None:
+            raise ValueError(f"选择表达式语法错误，多余的内容: {peek()}")
+
+        selected = [rule for i, rule in enumerate(self.rules) if bits >> i & 1]
+        return selected, unresolved
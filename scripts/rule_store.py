@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 内容寻址的规则库（rules_data/rules.pack）：规则正文按内容哈希去重，每条正文用共享字典单独压缩，
+只读取元数据即可列出和筛选规则，正文在需要时逐条解压；同目录的rules.db.json和用户目录的rules.overlay.json
+作为覆盖层叠加在规则库之上（相同slug的规则以覆盖层为准）
+
+文件格式：
+    MAGIC(8字节) | 头部长度(4字节，大端) | 头部(zlib压缩的JSON) | 正文数据
+    头部 = {"version": 1, "dictionary": base64, "rules": [元数据 + content_id], "blobs": {content_id: [偏移, 长度]}}
+"""
+
+import os
+import sys
+import json
+import zlib
+import base64
+import struct
+import hashlib
+import logging
+import threading
+from collections import Counter
+
+try:
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from config import CONFIG_DIR
+    from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+STORE_MAGIC = b"CRSTORE1"
+STORE_VERSION = 1
+STORE_SUFFIX = ".pack"
+# 随扩展分发的规则库
+DEFAULT_STORE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rules_data", "rules.pack")
+# 覆盖层：规则库同目录下获取/更新的规则数据，以及用户本地添加的规则（--ingest的默认目标）
+STORE_OVERLAY_NAME = "rules.db.json"
+USER_OVERLAY = os.path.join(CONFIG_DIR, "rules.overlay.json")
+DICTIONARY_SIZE = 32 * 1024   # 共享字典的最大字节数（zlib的窗口大小）
+COMPRESS_LEVEL = 9
+
+def content_id(content):
+    """规则正文的内容哈希，完全相同的正文只保存一份"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def is_store(path):
+    """按文件头判断是否是规则库文件（而不是JSON规则列表）"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(STORE_MAGIC)) == STORE_MAGIC
+    except OSError:
+        return False
+
+def train_dictionary(bodies, size=DICTIONARY_SIZE):
+    """
+    由多条正文中反复出现的行构造共享字典
+
+    只出现在一条正文中的行没有共享价值；出现次数越多、越长的行越靠近字典末尾（zlib优先匹配距离近的内容）
+
+    @param bodies - 规则正文列表
+    @param size - 字典的最大字节数
+    @return bytes
+    """
+    counts = Counter()
+    for body in bodies:
+        counts.update({line.strip() for line in body.splitlines() if len(line.strip()) >= 8})
+    scored = sorted(((count * len(line.encode('utf-8')), line) for line, count in counts.items() if count > 1),
+                    reverse=True)
+    chosen = []
+    used = 0
+    for _, line in scored:
+        encoded = line.encode('utf-8') + b'\n'
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b''.join(reversed(chosen))
+
+def merge_catalogs(catalogs):
+    """
+    按slug合并多个规则列表，后面的列表覆盖前面同slug的规则，没有slug的规则直接追加
+
+    @param catalogs - List[List[dict]]
+    @return List[dict]
+    """
+    merged = []
+    positions = {}
+    for catalog in catalogs:
+        for rule in catalog:
+            if not isinstance(rule, dict):
+                continue
+            slug = rule.get('slug')
+            if slug and slug in positions:
+                merged[positions[slug]] = rule
+                continue
+            if slug:
+                positions[slug] = len(merged)
+            merged.append(rule)
+    return merged
+
+def build_store(rules, store_path):
+    """
+    把规则列表写成规则库文件（先写临时文件再重命名）
+
+    @param rules - 规则列表，content之外的字段原样保存在元数据中
+    @param store_path - 输出路径
+    @return dict - 统计：规则数、去重后的正文数、原始字节数和规则库字节数
+    """
+    bodies = {}
+    metadata = []
+    raw_bytes = 0
+    for rule in rules:
+        content = str(rule.get('content') or '')
+        raw_bytes += len(content.encode('utf-8'))
+        key = content_id(content)
+        bodies.setdefault(key, content)
+        meta = {field: value for field, value in rule.items() if field not in ('content', 'content_id')}
+        meta['content_id'] = key
+        metadata.append(meta)
+
+    dictionary = train_dictionary(list(bodies.values()))
+    blobs = {}
+    data = []
+    offset = 0
+    for key, content in bodies.items():
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY,
+                                      dictionary)
+        blob = compressor.compress(content.encode('utf-8')) + compressor.flush()
+        blobs[key] = [offset, len(blob)]
+        data.append(blob)
+        offset += len(blob)
+
+    header = zlib.compress(json.dumps({
+        "version": STORE_VERSION,
+        "dictionary": base64.b64encode(dictionary).decode('ascii'),
+        "rules": metadata,
+        "blobs": blobs
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), COMPRESS_LEVEL)
+
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(STORE_MAGIC + struct.pack('>I', len(header)) + header)
+        for blob in data:
+            f.write(blob)
+    os.replace(tmp_path, store_path)
+    return {
+        "rules": len(metadata),
+        "bodies": len(bodies),
+        "raw_bytes": raw_bytes,
+        "store_bytes": os.path.getsize(store_path)
+    }
+
+class RuleStore:
+    """
+    只读的规则库：打开时只读取头部（元数据、字典和正文位置），正文按需逐条解压
+
+    @param path - 规则库文件路径
+    @throws ValueError 文件不是规则库、版本不支持或已损坏（被截断）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+                raise ValueError(f"不是规则库文件: {path}")
+            try:
+                (header_length,) = struct.unpack('>I', f.read(4))
+                header = json.loads(zlib.decompress(f.read(header_length)).decode('utf-8'))
+            except (struct.error, zlib.error, UnicodeDecodeError, ValueError) as e:
+                raise ValueError(f"规则库文件已损坏，无法读取头部: {path}（{str(e)}）") from e
+            size = os.fstat(f.fileno()).st_size
+        if not isinstance(header, dict) or header.get("version") != STORE_VERSION:
+            raise ValueError(f"不支持的规则库版本: {header.get('version') if isinstance(header, dict) else None}")
+        self.data_offset = len(STORE_MAGIC) + 4 + header_length
+        try:
+            self.dictionary = base64.b64decode(header["dictionary"])
+            self.metadata = header["rules"]
+            self.blobs = header["blobs"]
+            data_length = max((offset + length for offset, length in self.blobs.values()), default=0)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"规则库文件已损坏，头部字段无效: {path}（{str(e)}）") from e
+        if self.data_offset + data_length > size:
+            raise ValueError(f"规则库文件已损坏，正文数据不完整: {path}")
+
+    def content(self, key):
+        """
+        解压一条正文
+
+        @param key - content_id
+        @return str
+        @throws KeyError 规则库中没有该正文
+        @throws ValueError 正文数据已损坏（解压失败或与内容哈希不一致）
+        """
+        offset, length = self.blobs[key]
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_offset + offset)
+            blob = f.read(length)
+        try:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS, self.dictionary)
+            content = (decompressor.decompress(blob) + decompressor.flush()).decode('utf-8')
+        except (zlib.error, UnicodeDecodeError) as e:
+            raise ValueError(f"规则库中的正文已损坏: {key}（{str(e)}）") from e
+        if not decompressor.eof or content_id(content) != key:
+            raise ValueError(f"规则库中的正文已损坏: {key}")
+        return content
+
+    def rules(self, with_content=True):
+        """
+        @param with_content - 是否解压全部正文；为False时规则只带content_id，之后用hydrate_rules按需解压
+        @return List[dict] - 规则列表（每次返回新的字典）
+        """
+        rules = [dict(meta) for meta in self.metadata]
+        if with_content:
+            for rule in rules:
+                rule['content'] = self.content(rule['content_id'])
+        return rules
+
+# 按需解压时根据content_id找到所在的规则库
+_content_sources = {}
+_sources_lock = threading.Lock()
+
+def overlay_paths(store_path):
+    """@return List[str] - 叠加在规则库之上的覆盖层文件（按优先级从低到高，只包含存在的文件）"""
+    candidates = [os.path.join(os.path.dirname(os.path.abspath(store_path)), STORE_OVERLAY_NAME), USER_OVERLAY]
+    return [path for path in candidates if os.path.exists(path)]
+
+def catalog_signature(path):
+    """规则库及其覆盖层的修改时间和大小，任何一个变化都需要重新加载"""
+    paths = [path] + (overlay_paths(path) if is_store(path) else [])
+    signature = []
+    for item in paths:
+        stat = os.stat(item)
+        signature.append((item, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+def _load_json_rules(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise ValueError(f"规则数据格式错误，应为规则列表: {path}")
+    return rules
+
+def load_catalog(path, with_content=True):
+    """
+    加载规则目录：规则库文件叠加覆盖层，或者单个JSON规则列表
+
+    @param path - 规则库（.pack）或JSON规则列表文件
+    @param with_content - 为False时规则库中的规则只带content_id，正文由hydrate_rules按需解压
+    @return List[dict]
+    @throws OSError | ValueError 文件无法读取或格式错误
+    """
+    if not is_store(path):
+        return _load_json_rules(path)
+
+    store = RuleStore(path)
+    with _sources_lock:
+        for key in store.blobs:
+            _content_sources[key] = store
+    catalogs = [store.rules(with_content)]
+    for overlay in overlay_paths(path):
+        try:
+            catalogs.append(_load_json_rules(overlay))
+        except (OSError, ValueError) as e:
+            logger.warning(f"加载规则覆盖层失败，已忽略: {overlay}（{str(e)}）")
+    return merge_catalogs(catalogs)
+
+def rule_content(rule):
+    """
+    规则正文，延迟加载的规则在这里解压（不修改rule）
+
+    @return str | None
+    @throws ValueError 规则库中的正文已损坏
+    """
+    if 'content' in rule:
+        return rule['content']
+    key = rule.get('content_id')
+    with _sources_lock:
+        store = _content_sources.get(key)
+    return store.content(key) if store is not None else None
+
+def hydrate_rules(rules):
+    """为延迟加载的规则解压正文，已有正文的规则不变；返回同一个列表便于链式调用"""
+    for rule in rules:
+        if 'content' not in rule and rule.get('content_id'):
+            content = rule_content(rule)
+            rule['content'] = content if content is not None else '- 无规则内容'
+    return rules
+
+def resolve_catalog(path=None):
+    """
+    确定要使用的规则目录：显式指定且存在的文件优先，否则使用随扩展分发的规则库
+
+    @param path - 显式指定的规则库或JSON规则列表
+    @return str | None - 都不存在时返回None
+    """
+    if path and os.path.exists(path):
+        return path
+    if path:
+        logger.warning(f"指定的规则数据文件不存在，使用默认规则库: {path}")
+    return DEFAULT_STORE if os.path.exists(DEFAULT_STORE) else None
+
+def build_store_from_files(sources, store_path):
+    """
+    由多个JSON规则列表构建规则库，同slug的规则以后面的文件为准；持有规则库的跨进程锁
+
+    @param sources - JSON规则列表文件（也可以是已有的规则库）
+    @param store_path - 输出的规则库路径
+    @return dict - 统计，见build_store
+    """
+    catalogs = []
+    for source in sources:
+        catalogs.append(RuleStore(source).rules() if is_store(source) else _load_json_rules(source))
+    lock_path = os.path.join(CONFIG_DIR, "locks", f"store-{hashlib.sha256(os.path.abspath(store_path).encode('utf-8')).hexdigest()[:16]}.lock")
+    with file_lock(lock_path):
+        return build_store(merge_catalogs(catalogs), store_path)
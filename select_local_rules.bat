@@ -11,7 +11,7 @@ echo 您可以通过环境变量 CURSOR_RULES_MODEL_URL、CURSOR_RULES_API_KEY 
 echo.
 
 set WORKSPACE_PATH=%CD%
-set RULES_JSON=rules_data/rules.db.json
+set RULES_JSON=rules_data/rules.pack
 
 if not exist "%RULES_JSON%" (
     echo 错误: 找不到规则数据文件 %RULES_JSON%
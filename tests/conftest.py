@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+"""
+测试使用临时的用户目录，缓存、锁和统计文件不会写入真实的 ~/.cursor-rules
+（config.CONFIG_DIR 在导入时确定，必须在导入脚本之前设置）
+"""
+
+import os
+import tempfile
+
+os.environ['HOME'] = tempfile.mkdtemp(prefix='cursor-rules-test-')
+os.environ['USERPROFILE'] = os.environ['HOME']
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 规则目录分页查询的测试：排序值相同时按游标翻到最后一页，不重复也不遗漏
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from catalog_query import CatalogQuery, decode_cursor, encode_cursor
+
+TITLES = ["Beta", "alpha", "Alpha", "beta", "Gamma", "alpha"]
+RULES = [{"slug": f"rule{i:02d}", "title": TITLES[i % len(TITLES)], "tags": ["python" if i % 3 else "react"],
+          "content": f"- body {i}"} for i in range(20)]
+RULES += [
+    {"title": "alpha", "tags": []},                           # 没有slug
+    {"slug": "rule01", "title": "alpha", "tags": ["react"]},  # 与前面的规则slug相同且标题相同
+    {"slug": "untitled", "tags": ["react"]},                  # 没有标题
+]
+
+def collect(query, limit, **params):
+    """从第一页翻到最后一页，返回所有规则id"""
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = query.page(cursor=cursor, limit=limit, **params)
+        ids.extend(item["id"] for item in page["items"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, pages, page["total"]
+
+class CatalogQueryPageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.query = CatalogQuery(RULES)
+
+    def expected(self, key, descending, where=None):
+        ids = self.query.ids
+        selected = [i for i in range(len(RULES)) if where is None or where(RULES[i])]
+        ordered = sorted(selected, key=lambda i: (str(RULES[i].get(key) or '').casefold(), ids[i]))
+        return [ids[i] for i in (reversed(ordered) if descending else ordered)]
+
+    def test_paging_to_the_end_with_ties(self):
+        for sort in ("title", "-title", "slug", "-slug"):
+            expected = self.expected(sort.lstrip('-'), sort.startswith('-'))
+            for limit in (1, 2, 3, 7, len(RULES), 100):
+                with self.subTest(sort=sort, limit=limit):
+                    ids, pages, total = collect(self.query, limit, sort=sort)
+                    self.assertEqual(ids, expected)
+                    self.assertEqual(len(set(ids)), len(RULES))
+                    self.assertEqual(total, len(RULES))
+                    self.assertEqual(pages, max(1, -(-len(RULES) // limit)))
+
+    def test_paging_filtered_results(self):
+        react = lambda rule: "react" in (rule.get("tags") or [])
+        for sort in ("title", "-title"):
+            expected = self.expected("title", sort.startswith('-'), react)
+            for limit in (1, 2, 4):
+                with self.subTest(sort=sort, limit=limit):
+                    ids, _, total = collect(self.query, limit, sort=sort, where="tag:react")
+                    self.assertEqual(ids, expected)
+                    self.assertEqual(total, len(expected))
+        ids, _, total = collect(self.query, 2, sort="title", search="GAMMA")
+        self.assertEqual((ids, total), (self.expected("title", False, lambda rule: rule.get("title") == "Gamma"), 3))
+
+    def test_duplicate_slugs_get_unique_ids(self):
+        self.assertEqual(len(set(self.query.ids)), len(RULES))
+        self.assertEqual(self.query.ids[-3:], ["rule-20", "rule01~21", "untitled"])
+        self.assertEqual(self.query.get("rule01")["content"], "- body 1")
+        self.assertEqual(self.query.get("rule01~21", ["tags"]), {"id": "rule01~21", "tags": ["react"]})
+
+    def test_cursor_survives_inserted_rules(self):
+        first = self.query.page(sort="title", limit=5)
+        # 新规则排在第一页之前：已发出的游标之后的内容不受影响
+        grown = CatalogQuery(RULES + [{"slug": "aaa", "title": "Aardvark"}])
+        rest, _, _ = collect(grown, 5, sort="title")
+        after = grown.page(sort="title", limit=100, cursor=first["next_cursor"])
+        self.assertEqual([item["id"] for item in first["items"]] + [item["id"] for item in after["items"]],
+                         [rule_id for rule_id in rest if rule_id != "aaa"])
+
+    def test_projection(self):
+        page = self.query.page(fields=["title"], sort="slug", limit=1)
+        self.assertEqual(page["items"], [{"id": "rule-20", "title": "alpha"}])
+
+    def test_invalid_arguments(self):
+        cursor = self.query.page(sort="title", limit=1)["next_cursor"]
+        for params in ({"sort": "author"}, {"sort": "-title", "cursor": cursor}, {"cursor": "not-a-cursor!"},
+                       {"where": "tag:react AND"}):
+            with self.subTest(params):
+                with self.assertRaises(ValueError):
+                    self.query.page(**params)
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor("-title", "alpha ✓", "rule01~21")
+        self.assertEqual(decode_cursor(cursor, "-title"), ("alpha ✓", "rule01~21"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 流式输出解析的表格测试：增量扫描JSON数组中的对象，以及从截断的对象中恢复规则
+"""
+
+import os
+import sys
+import json
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from generation_pipeline import JsonArrayScanner, salvage_object, salvage_rule
+
+RULES = [
+    {"name": "braces", "glob_pattern": "**/*.ts", "description": "{not} [an] object",
+     "content": "- Use `{ a: [1, 2] }` and \"quoted\" text\n- Escape \\\\ and \\\" properly"},
+    {"name": "unicode", "glob_pattern": "src/**/*.{ts,tsx}", "description": "é",
+     "content": "- 使用 café ✓\n  - nested } ] ,"},
+]
+ARRAY = json.dumps(RULES, ensure_ascii=True)
+
+def scan(chunks):
+    scanner = JsonArrayScanner()
+    objects = []
+    for chunk in chunks:
+        objects.extend(scanner.feed(chunk))
+    return [json.loads(text) for text in objects], scanner
+
+class JsonArrayScannerTest(unittest.TestCase):
+
+    def test_wrapped_output(self):
+        cases = [
+            ("bare", ARRAY),
+            ("fence", "```json\n" + ARRAY + "\n```"),
+            ("prose", "Here are the rules:\n" + ARRAY + "\nHope this helps {really}."),
+            ("prose with brackets", "Rules [see below]:\n```json\n" + ARRAY + "\n```\n[done]"),
+        ]
+        for label, text in cases:
+            with self.subTest(label):
+                objects, scanner = scan([text])
+                self.assertEqual(objects, RULES)
+                self.assertTrue(scanner.closed)
+                self.assertEqual(scanner.partial_text(), '')
+
+    def test_arbitrary_chunk_boundaries(self):
+        for cut in range(1, len(ARRAY)):
+            objects, _ = scan([ARRAY[:cut], ARRAY[cut:]])
+            self.assertEqual(objects, RULES, f"cut at {cut}")
+        rng = random.Random(0)
+        for _ in range(50):
+            chunks, rest = [], ARRAY
+            while rest:
+                size = rng.randint(1, 7)
+                chunks.append(rest[:size])
+                rest = rest[size:]
+            self.assertEqual(scan(chunks)[0], RULES)
+
+    def test_complete_and_partial_text(self):
+        first = json.dumps(RULES[0])
+        text = "```json\n[" + first + ", {\"name\": \"x\", \"content\": \"- a"
+        objects, scanner = scan([text])
+        self.assertEqual(objects, [RULES[0]])
+        self.assertEqual(scanner.complete_text(), "```json\n[" + first)
+        self.assertEqual(scanner.partial_text(), "{\"name\": \"x\", \"content\": \"- a")
+        self.assertFalse(scanner.closed)
+
+    def test_output_after_array_is_ignored(self):
+        objects, scanner = scan([ARRAY, '\n[{"name": "late", "content": "- x"}]'])
+        self.assertEqual(objects, RULES)
+
+class SalvageRuleTest(unittest.TestCase):
+
+    def test_truncation_table(self):
+        head = '{"name": "hooks", "glob_pattern": "**/*.tsx", '
+        cases = [
+            ("inside a key", head + '"content": "- one\\n- two", "descri', ('hooks', '', '**/*.tsx', '- one\n- two')),
+            ("inside the name value", '{"name": "hoo', None),
+            ("inside the name key", '{"na', None),
+            ("before content", head + '"description": "d", "cont', None),
+            ("inside content", head + '"content": "- one\\n- tw', ('hooks', '', '**/*.tsx', '- one')),
+            ("inside content with one bullet", head + '"content": "- on', ('hooks', '', '**/*.tsx', '- on')),
+            ("inside \\u escape", head + '"content": "- one\\n- caf\\u00', ('hooks', '', '**/*.tsx', '- one')),
+            ("after a lone backslash", head + '"content": "- one\\n- a\\', ('hooks', '', '**/*.tsx', '- one')),
+            ("after an escaped backslash", head + '"content": "- one\\n- C:\\\\', ('hooks', '', '**/*.tsx', '- one')),
+            ("after an escaped quote", head + '"content": "- one\\n- say \\"', ('hooks', '', '**/*.tsx', '- one')),
+            ("content list", head + '"content": ["- one", "- tw', ('hooks', '', '**/*.tsx', '- one')),
+            ("inside glob value", '{"name": "hooks", "content": "- one", "glob_pattern": "src/**/*.t',
+             ('hooks', '', '**/*', '- one')),
+            ("after complete content", head + '"content": "- one\\n- two"', ('hooks', '', '**/*.tsx', '- one\n- two')),
+            ("braces in strings", head + '"description": "{[", "content": "- a } ]\\n- b', ('hooks', '{[', '**/*.tsx', '- a } ]')),
+            ("empty", '', None),
+        ]
+        for label, text, expected in cases:
+            with self.subTest(label):
+                self.assertEqual(salvage_rule(text), expected)
+
+    def test_salvage_object_reports_open_key(self):
+        obj, open_key = salvage_object('{"name": "a", "content": "- x')
+        self.assertEqual((obj, open_key), ({"name": "a", "content": "- x"}, 'content'))
+        obj, open_key = salvage_object('{"name": "a", "content": "- x", "n": {"deep": [1, 2')
+        self.assertEqual((obj, open_key), ({"name": "a", "content": "- x", "n": {"deep": [1, 2]}}, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description glob匹配的回归测试：扩展名快速路径与正则路径一样区分大小写
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from glob_analyzer import PathIndex
+
+class PathIndexMatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        workspace = os.path.join(self.tmp.name, 'ws')
+        for path in ('src/a.ts', 'src/B.TS', 'lib/c.ts'):
+            full = os.path.join(workspace, path)
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            open(full, 'w').close()
+        self.index = PathIndex(workspace, cache_dir=os.path.join(self.tmp.name, 'cache')).refresh()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def matched(self, glob_pattern):
+        return sorted(self.index.paths[i] for i in self.index.match(glob_pattern))
+
+    def test_simple_extension_is_case_sensitive(self):
+        self.assertEqual(self.matched('**/*.ts'), ['lib/c.ts', 'src/a.ts'])
+        self.assertEqual(self.matched('**/*.TS'), ['src/B.TS'])
+
+    def test_fast_path_agrees_with_regex_path(self):
+        # src/*.ts 不是 prefix/**/*.ext 形式，走正则匹配
+        self.assertEqual(self.matched('src/**/*.ts'), ['src/a.ts'])
+        self.assertEqual(self.matched('src/*.ts'), ['src/a.ts'])
+
+if __name__ == '__main__':
+    unittest.main()
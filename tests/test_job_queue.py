@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 批量任务队列的测试：领取、检查点、失败重试、中断释放和恢复，以及对模拟模型服务的中断后继续
+"""
+
+import os
+import sys
+import subprocess
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import job_queue
+import local_rules_selector
+from job_queue import JobQueue, JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING
+from mock_model_server import make_handler
+
+RULE = ('react-hooks', 'Hooks', '**/*.tsx', '- Use hooks')
+
+def start_mock_server(testcase, rules=1, token_delay=0.0, fail_rate=0.0):
+    """在后台线程中启动模拟模型服务，测试结束时关闭；返回接口地址"""
+    options = SimpleNamespace(rules=rules, delay=0.0, token_delay=token_delay, fail_rate=fail_rate, seed=0)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    testcase.addCleanup(server.server_close)
+    testcase.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+def dead_pid():
+    """一个已退出进程的pid"""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.queue = JobQueue(os.path.join(tmp.name, 'jobs.db'))
+        self.addCleanup(self.queue.close)
+        self.batch_id, added = self.queue.open_batch('b', '/ws', [('react', '.', {"name": "react.mdc"})])
+        self.assertEqual(added, 1)
+
+    def status(self):
+        return self.queue.jobs(self.batch_id)[0]
+
+    def test_open_batch_keeps_existing_jobs(self):
+        job = self.queue.claim(self.batch_id)
+        self.queue.checkpoint(job["id"], RULE)
+        batch_id, added = self.queue.open_batch('b', '/ws', [('react', '.', {"name": "react.mdc"}),
+                                                             ('vue', '.', {"name": "vue.mdc"})])
+        self.assertEqual((batch_id, added), (self.batch_id, 1))
+        self.assertEqual(self.queue.results(job["id"]), [RULE])
+        self.assertEqual(self.status()["status"], JOB_RUNNING)
+
+    def test_release_returns_checkpoint_without_counting_attempt(self):
+        job = self.queue.claim(self.batch_id)
+        self.assertEqual(job["attempts"], 1)
+        self.assertEqual(job["checkpoint"], [])
+        self.assertTrue(self.queue.checkpoint(job["id"], RULE))
+        # 同名规则不重复保存
+        self.assertFalse(self.queue.checkpoint(job["id"], RULE[:3] + ('- changed',)))
+        self.assertIsNone(self.queue.claim(self.batch_id))
+
+        self.queue.release(job["id"])
+        job = self.queue.claim(self.batch_id)
+        self.assertEqual(job["attempts"], 1)
+        self.assertEqual(job["checkpoint"], [RULE])
+        self.assertEqual(self.status()["attempts"], 1)
+
+    def test_fail_backs_off_then_gives_up(self):
+        job = self.queue.claim(self.batch_id)
+        self.assertTrue(self.queue.fail(job["id"], "boom", max_attempts=2))
+        # 退避期内不能领取
+        self.assertEqual(self.status()["status"], JOB_PENDING)
+        self.assertIsNone(self.queue.claim(self.batch_id))
+        self.assertGreater(self.queue.next_wakeup(self.batch_id), 0)
+
+        with mock.patch.object(job_queue, 'RETRY_BACKOFF', 0):
+            self.queue._write("UPDATE jobs SET not_before = 0")
+            job = self.queue.claim(self.batch_id)
+            self.assertEqual(job["attempts"], 2)
+            self.assertFalse(self.queue.fail(job["id"], "boom again", max_attempts=2))
+        self.assertEqual(self.status()["status"], JOB_FAILED)
+        self.assertEqual(self.status()["last_error"], "boom again")
+        self.assertIsNone(self.queue.claim(self.batch_id))
+
+        self.assertEqual(self.queue.retry_failed(self.batch_id), 1)
+        job = self.queue.claim(self.batch_id)
+        self.assertEqual(job["attempts"], 1)
+
+    def test_recover_requeues_jobs_of_dead_owners(self):
+        job = self.queue.claim(self.batch_id)
+        self.queue.checkpoint(job["id"], RULE)
+        # 所属进程仍在运行的任务不恢复
+        self.assertEqual(self.queue.recover(self.batch_id), 0)
+
+        self.queue._write("UPDATE jobs SET owner = ? WHERE id = ?", (dead_pid(), job["id"]))
+        self.assertEqual(self.queue.recover(self.batch_id), 1)
+        self.assertEqual(self.status()["status"], JOB_PENDING)
+        job = self.queue.claim(self.batch_id)
+        self.assertEqual(job["checkpoint"], [RULE])
+
+    def test_complete_exposes_batch_results(self):
+        job = self.queue.claim(self.batch_id)
+        self.queue.checkpoint(job["id"], RULE)
+        self.assertEqual(self.queue.batch_results(self.batch_id), [])
+        self.queue.complete(job["id"])
+        self.assertEqual(self.queue.batch_results(self.batch_id), [('.', RULE)])
+        progress = self.queue.progress(self.batch_id)
+        self.assertEqual((progress[JOB_DONE], progress["total"], progress["rules"]), (1, 1, 1))
+
+class RunBatchTest(unittest.TestCase):
+
+    def test_interrupted_batch_resumes_from_checkpoints(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        workspace = os.path.join(tmp.name, 'ws')
+        os.makedirs(workspace)
+        with open(os.path.join(workspace, 'index.ts'), 'w') as f:
+            f.write("export const a = 1;\n")
+        output_dir = os.path.join(workspace, '.cursor', 'rules')
+        db_path = os.path.join(tmp.name, 'jobs.db')
+
+        url = start_mock_server(self, rules=3, token_delay=0.02, fail_rate=0.3)
+        config = {"model_url": url, "api_key": "test", "model_name": "mock", "batch_workers": 1,
+                  "batch_max_attempts": 20, "batch_progress_interval": 0.05}
+        rules = [{"name": f"source-{i}", "slug": f"source-{i}", "description": "d", "globs": "**/*.ts",
+                  "content": f"- 源规则 {i}"} for i in range(4)]
+
+        interrupted = []
+        def print_progress(name, progress, elapsed=None, eta=None):
+            # 第一条规则写入检查点后模拟Ctrl+C
+            if not interrupted and progress["rules"]:
+                interrupted.append(dict(progress))
+                raise KeyboardInterrupt
+
+        def run():
+            return local_rules_selector.run_batch(rules, workspace, 'resume-test', output_dir, use_cache=False,
+                                                  merge_similar=False)
+
+        with mock.patch.object(local_rules_selector, 'JobQueue', lambda: JobQueue(db_path)), \
+                mock.patch.object(local_rules_selector, 'load_config', return_value=config), \
+                mock.patch.object(local_rules_selector, 'install_cancel_handlers'), \
+                mock.patch.object(local_rules_selector, 'print_batch_progress', print_progress), \
+                mock.patch.object(job_queue, 'RETRY_BACKOFF', 0):
+            progress = run()
+            self.assertTrue(progress["cancelled"])
+            self.assertLess(progress[JOB_DONE], progress["total"])
+            # 进行中的任务已放回队列
+            self.assertEqual(progress[JOB_RUNNING], 0)
+
+            progress = run()
+
+        self.assertNotIn("cancelled", progress)
+        self.assertEqual((progress[JOB_DONE], progress["total"]), (4, 4))
+        queue = JobQueue(db_path)
+        self.addCleanup(queue.close)
+        batch_id = queue.find_batch('resume-test', workspace)
+        for job in queue.jobs(batch_id):
+            # 续写时已生成的规则不重复保存，每个任务恰好得到全部三条规则
+            self.assertEqual(sorted(name for name, _, _, _ in queue.results(job["id"])),
+                             ['mock-rule-1', 'mock-rule-2', 'mock-rule-3'])
+        self.assertEqual(sorted(os.listdir(output_dir)), ['mock-rule-1.mdc', 'mock-rule-2.mdc', 'mock-rule-3.mdc'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 多端点模型客户端的测试：端点统计的跨进程合并，以及对冲、截止时间和故障切换
+（在进程内启动多个带延迟的模拟模型服务）
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import model_client
+import local_rules_selector
+from model_client import EndpointStats, ModelDeadlineExceeded, endpoint_key, stream_chat_completion
+from mock_model_server import make_handler
+
+def start_mock_server(testcase, rules=1, delay=0.0, fail_rate=0.0):
+    """在后台线程中启动模拟模型服务，测试结束时关闭；返回接口地址"""
+    options = SimpleNamespace(rules=rules, delay=delay, token_delay=0.0, fail_rate=fail_rate, seed=0)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    testcase.addCleanup(server.server_close)
+    testcase.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+def endpoint(url):
+    return {"model_url": url, "api_key": "test", "model_name": "mock"}
+
+def streamed_rule_names(lines):
+    """拼接SSE响应中的文本并解析出规则名称"""
+    text = ''
+    for line in lines:
+        payload = line.decode('utf-8')[len('data: '):]
+        if payload != '[DONE]':
+            text += json.loads(payload)["choices"][0]["delta"].get("content") or ''
+    return [rule["name"] for rule in json.loads(text)]
+
+class EndpointStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'endpoint_stats.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_concurrent_saves_keep_each_others_records(self):
+        # 两个进程各自加载同一份统计，后保存的一方不能覆盖先保存的记录
+        first, second = EndpointStats(self.path), EndpointStats(self.path)
+        first.record_latency('a', 1.0)
+        second.record_latency('a', 2.0)
+        second.record_failure('b')
+        first.save()
+        second.save()
+
+        stats = EndpointStats(self.path).stats
+        self.assertEqual(stats['a']['samples'], [1.0, 2.0])
+        self.assertAlmostEqual(stats['a']['ewma'], 1.3)
+        self.assertEqual(stats['b']['failures'], 1)
+        self.assertGreater(stats['b']['unhealthy_until'], 0)
+        # 保存后进程内的统计也包含其他进程的记录
+        self.assertEqual(second.stats['a']['samples'], [1.0, 2.0])
+
+    def test_saving_twice_does_not_replay_records(self):
+        stats = EndpointStats(self.path)
+        stats.record_latency('a', 1.0)
+        stats.save()
+        stats.save()
+        self.assertEqual(EndpointStats(self.path).stats['a']['samples'], [1.0])
+
+class StreamChatCompletionTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.stats = EndpointStats(os.path.join(tmp.name, 'endpoint_stats.json'))
+        patcher = mock.patch.object(model_client, '_endpoint_stats', self.stats)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def config(self, primary, *others, **options):
+        return dict({"model_url": primary, "api_key": "test", "model_name": "mock",
+                     "endpoints": list(others)}, **options)
+
+    def test_hedge_fires_and_faster_endpoint_wins(self):
+        slow = start_mock_server(self, rules=1, delay=3.0)
+        fast = start_mock_server(self, rules=2)
+        # 慢端点的历史延迟较低，排在最前；对冲阈值为其延迟样本的百分位数
+        for _ in range(5):
+            self.stats.record_latency(endpoint_key(endpoint(slow)), 0.2)
+
+        cancelled = []
+        original_cancel = model_client._StreamAttempt.cancel
+        def cancel(attempt):
+            cancelled.append(attempt.endpoint['model_url'])
+            original_cancel(attempt)
+
+        started = time.time()
+        with mock.patch.object(model_client._StreamAttempt, 'cancel', cancel):
+            names = streamed_rule_names(stream_chat_completion(self.config(slow, fast), {"messages": []}))
+        elapsed = time.time() - started
+
+        self.assertEqual(names, ['mock-rule-1', 'mock-rule-2'])
+        self.assertLess(elapsed, 2.0)
+        self.assertIn(slow, cancelled)
+        # 被取消的请求按已等待时长计入慢端点的延迟
+        self.assertGreaterEqual(self.stats.stats[endpoint_key(endpoint(slow))]["samples"][-1], 0.2)
+        self.assertEqual(len(self.stats.stats[endpoint_key(endpoint(fast))]["samples"]), 1)
+
+    def test_request_deadline_raises(self):
+        slow = start_mock_server(self, delay=3.0)
+        started = time.time()
+        with self.assertRaises(ModelDeadlineExceeded):
+            list(stream_chat_completion(self.config(slow, request_deadline=0.5), {"messages": []}))
+        self.assertLess(time.time() - started, 2.0)
+
+    def test_failed_endpoint_cools_down_and_next_is_tried(self):
+        broken = start_mock_server(self, fail_rate=1.0)
+        healthy = start_mock_server(self, rules=2)
+        config = self.config(broken, healthy)
+
+        names = streamed_rule_names(stream_chat_completion(config, {"messages": []}))
+        self.assertEqual(names, ['mock-rule-1', 'mock-rule-2'])
+        entry = self.stats.stats[endpoint_key(endpoint(broken))]
+        self.assertEqual(entry["failures"], 1)
+        self.assertFalse(self.stats.is_healthy(endpoint_key(endpoint(broken))))
+        # 冷却期内不健康的端点排到最后
+        ranked = self.stats.rank(model_client.get_endpoints(config))
+        self.assertEqual(ranked[0]["model_url"], healthy)
+
+class DeadlineFallbackTest(unittest.TestCase):
+
+    def test_process_selected_rules_falls_back_to_catalog_rule(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        workspace = os.path.join(tmp.name, 'ws')
+        os.makedirs(workspace)
+        with open(os.path.join(workspace, 'index.ts'), 'w') as f:
+            f.write("export const a = 1;\n")
+        slow = start_mock_server(self, delay=3.0)
+        stats = EndpointStats(os.path.join(tmp.name, 'endpoint_stats.json'))
+        config = {"model_url": slow, "api_key": "test", "model_name": "mock", "request_deadline": 0.5}
+        rule = {"name": "catalog-rule", "description": "catalog", "globs": "**/*.ts", "content": "- 原始规则内容"}
+
+        with mock.patch.object(model_client, '_endpoint_stats', stats), \
+                mock.patch.object(local_rules_selector, 'get_model_config', return_value=config):
+            local_rules_selector.process_selected_rules([rule], workspace, use_cache=False)
+
+        output_dir = os.path.join(workspace, '.cursor', 'rules')
+        self.assertEqual(os.listdir(output_dir), ['catalog-rule.mdc'])
+        with open(os.path.join(output_dir, 'catalog-rule.mdc'), encoding='utf-8') as f:
+            self.assertIn('- 原始规则内容', f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 相似规则合并的回归测试：代码块、嵌套条目等非条目内容必须原样保留
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from rule_merger import consolidate_rules, merge_rule_contents
+
+FENCED = '- Use hooks\n  - nested detail\n\n```ts\nconst a = 1;\n```\n\n```ts\nconst b = 2;\n```'
+
+class ConsolidateRulesTest(unittest.TestCase):
+
+    def test_single_rule_is_unchanged(self):
+        rule = ('a.mdc', 'd', 'src/**/*.ts', FENCED)
+        self.assertEqual(consolidate_rules([rule]), [rule])
+
+    def test_merge_keeps_fences_and_nesting(self):
+        other = '- Use hooks.\n  - another detail\n- Prefer composition\n\n```ts\nconst b = 2;\n```'
+        merged = consolidate_rules([('a.mdc', 'd', 'src/**/*.ts', FENCED), ('a.mdc', 'd', 'src/**/*.tsx', other)])
+        self.assertEqual(len(merged), 1)
+        content = merged[0][3]
+        self.assertTrue(content.startswith(FENCED))
+        # 重复的顶层条目连同子条目一起去掉，其余内容原样追加
+        self.assertNotIn('another detail', content)
+        self.assertIn('- Prefer composition', content)
+        self.assertEqual(content.count('```'), 6)
+        self.assertEqual(merged[0][2], 'src/**/*.ts,src/**/*.tsx')
+
+    def test_bullets_inside_code_blocks_are_not_deduplicated(self):
+        code = '```md\n- item\n- item\n```'
+        self.assertEqual(merge_rule_contents(['- item', code], near=False), '- item\n' + code)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 规则选择表达式的测试：运算符优先级、括号、语法错误，以及slug自动纠正与只给出候选的边界
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from rule_query import RuleIndex
+
+RULES = [
+    {"slug": "react", "tags": ["react", "frontend"], "libs": ["react"]},
+    {"slug": "nextjs", "tags": ["react", "ssr"], "libs": ["next", "react"]},
+    {"slug": "vue", "tags": ["vue", "frontend"], "libs": "vue,vuex"},
+    {"slug": "django", "tags": ["python", "backend"], "libs": ["django"]},
+    {"slug": "flask", "tags": ["Python", "backend"], "libs": []},
+]
+
+class RuleIndexSelectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = RuleIndex(RULES)
+
+    def slugs(self, expression):
+        selected, unresolved = self.index.select(expression)
+        self.assertEqual(unresolved, [])
+        return [rule["slug"] for rule in selected]
+
+    def test_precedence_table(self):
+        cases = [
+            ("react vue", ["react", "vue"]),
+            ("react, vue", ["react", "vue"]),
+            ("tag:react", ["react", "nextjs"]),
+            ("tag:python", ["django", "flask"]),
+            ("lib:vuex", ["vue"]),
+            ("tag:react AND lib:next", ["nextjs"]),
+            ("tag:react and not lib:next", ["react"]),
+            ("NOT tag:react", ["vue", "django", "flask"]),
+            ("NOT NOT tag:ssr", ["nextjs"]),
+            # AND优先于OR
+            ("tag:python OR tag:react AND lib:next", ["nextjs", "django", "flask"]),
+            ("(tag:python OR tag:react) AND lib:next", ["nextjs"]),
+            ("tag:frontend AND NOT tag:vue OR django", ["react", "django"]),
+            ("tag:frontend AND NOT (tag:vue OR tag:react)", []),
+            ("NOT tag:react AND tag:frontend", ["vue"]),
+            ("NOT (tag:react AND tag:frontend)", ["nextjs", "vue", "django", "flask"]),
+            ("((react))", ["react"]),
+            ("tag:missing", []),
+            ("", []),
+        ]
+        for expression, expected in cases:
+            with self.subTest(expression):
+                self.assertEqual(self.slugs(expression), expected)
+
+    def test_syntax_errors(self):
+        for expression in ("tag:react AND", "(tag:react", "tag:react)", "AND react", "react OR", "NOT",
+                           "()", ", react", "react AND , vue"):
+            with self.subTest(expression):
+                with self.assertRaises(ValueError):
+                    self.index.select(expression)
+
+class ResolveSlugTest(unittest.TestCase):
+
+    def resolve(self, slugs, term):
+        index = RuleIndex([{"slug": slug} for slug in slugs])
+        return index.select(term)
+
+    def test_auto_correct_boundary(self):
+        # (规则, 输入, 自动纠正的结果或None)，相似度为三元组Jaccard系数
+        cases = [
+            (["vue"], "vuex", "vue"),                                   # 0.5：恰好达到阈值
+            (["react"], "rect", None),                                  # 低于阈值
+            (["angular", "angularjs"], "angulax", "angular"),           # 3/5 对 1/2：差恰好为0.1
+            (["next", "nuxtjs"], "nextjs", "next"),                     # 1/2 对 2/5：差恰好为0.1
+            (["nextjs", "nuxtjs"], "nxtjs", None),                      # 两个候选相同，只给出候选
+        ]
+        for slugs, term, expected in cases:
+            with self.subTest(term):
+                selected, unresolved = self.resolve(slugs, term)
+                if expected:
+                    self.assertEqual([rule["slug"] for rule in selected], [expected])
+                    self.assertEqual(unresolved, [])
+                else:
+                    self.assertEqual(selected, [])
+                    self.assertEqual(len(unresolved), 1)
+                    self.assertEqual(unresolved[0][0], term)
+
+    def test_suggestions_are_ranked(self):
+        index = RuleIndex([{"slug": slug} for slug in ("nextjs", "nuxtjs", "django")])
+        _, unresolved = index.select("nxtjs")
+        self.assertEqual(sorted(unresolved[0][1][:2]), ["nextjs", "nuxtjs"])
+        self.assertEqual(index.closest_slugs("zzzz"), [])
+
+    def test_exact_slug_is_case_insensitive(self):
+        selected, unresolved = self.resolve(["React"], "REACT")
+        self.assertEqual(([rule["slug"] for rule in selected], unresolved), (["React"], []))
+
+if __name__ == '__main__':
+    unittest.main()
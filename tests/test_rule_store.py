@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+@description 规则库的往返测试：构建、延迟加载和解压、正文去重、覆盖层优先级，以及损坏文件的报错
+"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import rule_store
+from rule_store import (DEFAULT_STORE, RuleStore, build_store_from_files, hydrate_rules, is_store, load_catalog,
+                        STORE_OVERLAY_NAME)
+
+RULES = [
+    {"slug": "react", "title": "React", "tags": ["react"], "libs": ["react"], "author": {"name": "a"},
+     "content": "- Use function components\n- 使用 hooks ✓"},
+    {"slug": "vue", "title": "Vue", "tags": ["vue"], "libs": [], "content": "- Use the composition API"},
+    {"slug": "react-copy", "title": "React (copy)", "tags": [], "libs": [],
+     "content": "- Use function components\n- 使用 hooks ✓"},
+    {"slug": "empty", "title": "Empty", "tags": [], "libs": [], "content": ""},
+]
+
+class RuleStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.store_path = os.path.join(self.dir, 'store', 'rules.pack')
+        self.user_overlay = os.path.join(self.dir, 'rules.overlay.json')
+        patcher = mock.patch.object(rule_store, 'USER_OVERLAY', self.user_overlay)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_json(self, path, rules):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(rules, f, ensure_ascii=False)
+        return path
+
+    def build(self, rules):
+        return build_store_from_files([self.write_json(os.path.join(self.dir, 'source.json'), rules)],
+                                      self.store_path)
+
+    def assert_round_trip(self, rules):
+        lazy = load_catalog(self.store_path, with_content=False)
+        self.assertTrue(all('content' not in rule for rule in lazy))
+        loaded = [{key: value for key, value in rule.items() if key != 'content_id'} for rule in hydrate_rules(lazy)]
+        self.assertEqual(loaded, rules)
+
+    def test_round_trip_keeps_every_field(self):
+        self.build(RULES)
+        self.assertTrue(is_store(self.store_path))
+        self.assert_round_trip(RULES)
+
+    def test_round_trip_of_shipped_catalog(self):
+        rules = [{key: value for key, value in rule.items() if key != 'content_id'}
+                 for rule in RuleStore(DEFAULT_STORE).rules()]
+        self.assertGreater(len(rules), 0)
+        self.build(rules)
+        self.assert_round_trip(rules)
+
+    def test_identical_bodies_are_stored_once(self):
+        stats = self.build(RULES)
+        self.assertEqual((stats["rules"], stats["bodies"]), (4, 3))
+        store = RuleStore(self.store_path)
+        self.assertEqual(len(store.blobs), 3)
+        ids = {rule["slug"]: rule["content_id"] for rule in store.metadata}
+        self.assertEqual(ids["react"], ids["react-copy"])
+
+    def test_later_sources_replace_same_slug(self):
+        first = self.write_json(os.path.join(self.dir, 'a.json'), RULES[:2])
+        second = self.write_json(os.path.join(self.dir, 'b.json'), [dict(RULES[1], title="Vue 3")])
+        build_store_from_files([first, second], self.store_path)
+        self.assertEqual([(rule["slug"], rule["title"]) for rule in load_catalog(self.store_path)],
+                         [("react", "React"), ("vue", "Vue 3")])
+
+    def test_overlay_precedence(self):
+        self.build(RULES[:2])
+        store_overlay = os.path.join(os.path.dirname(self.store_path), STORE_OVERLAY_NAME)
+        self.write_json(store_overlay, [dict(RULES[0], title="React (updated)", content="- updated"),
+                                        {"slug": "svelte", "title": "Svelte", "content": "- runes"}])
+        self.write_json(self.user_overlay, [dict(RULES[0], title="React (mine)", content="- mine"),
+                                            {"title": "No slug", "content": "- appended"}])
+        rules = hydrate_rules(load_catalog(self.store_path, with_content=False))
+        self.assertEqual([(rule.get("slug"), rule["title"], rule["content"]) for rule in rules], [
+            ("react", "React (mine)", "- mine"),
+            ("vue", "Vue", "- Use the composition API"),
+            ("svelte", "Svelte", "- runes"),
+            (None, "No slug", "- appended"),
+        ])
+
+    def test_invalid_overlay_is_ignored(self):
+        self.build(RULES[:2])
+        with open(self.user_overlay, 'w', encoding='utf-8') as f:
+            f.write('{"not": "a list"}')
+        self.assertEqual([rule["slug"] for rule in load_catalog(self.store_path)], ["react", "vue"])
+
+    def test_corrupt_store_raises_clear_error(self):
+        self.build(RULES)
+        with open(self.store_path, 'rb') as f:
+            data = f.read()
+        header_end = len(data) - sum(length for _, length in RuleStore(self.store_path).blobs.values())
+        corrupt_path = os.path.join(self.dir, 'corrupt.pack')
+        cases = [
+            ("magic only", data[:8], "头部"),
+            ("truncated header", data[:header_end - 10], "头部"),
+            ("garbage header", data[:12] + b'x' * (header_end - 12) + data[header_end:], "头部"),
+            ("truncated bodies", data[:-5], "正文数据不完整"),
+        ]
+        for label, content, message in cases:
+            with self.subTest(label):
+                with open(corrupt_path, 'wb') as f:
+                    f.write(content)
+                with self.assertRaisesRegex(ValueError, message):
+                    load_catalog(corrupt_path, with_content=False)
+
+    def test_corrupt_body_raises_on_hydrate(self):
+        self.build(RULES)
+        with open(self.store_path, 'r+b') as f:
+            f.seek(-3, os.SEEK_END)
+            last = f.read(3)
+            f.seek(-3, os.SEEK_END)
+            f.write(bytes(byte ^ 0xff for byte in last))
+        rules = load_catalog(self.store_path, with_content=False)
+        with self.assertRaisesRegex(ValueError, "正文已损坏"):
+            hydrate_rules(rules)
+
+    def test_not_a_store(self):
+        path = self.write_json(os.path.join(self.dir, 'rules.json'), RULES)
+        self.assertFalse(is_store(path))
+        with self.assertRaisesRegex(ValueError, "不是规则库文件"):
+            RuleStore(path)
+        self.assertEqual(load_catalog(path), RULES)
+
+if __name__ == '__main__':
+    unittest.main()